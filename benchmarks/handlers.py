@@ -0,0 +1,413 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from i18n import resource_loader
+from i18n import config as i18config
+
+from ptbtest import Mockbot, ChatGenerator, MessageGenerator, UserGenerator
+
+from slateboy.slateboy import SlateBoy
+from slateboy.personality import BlankPersonality
+from slateboy.providers import WalletProvider
+from slateboy.recording import RecordingWalletProvider, ReplayWalletProvider
+from slateboy.slatepack import parseSlatepack, encodeSlatepack
+from slateboy.helpers import toNanogrin
+
+
+# end-to-end benchmark of the SlateBoy handlers, synthetic updates are
+# pushed through the dispatcher at the given rate and the latency of every
+# update is measured from its scheduled arrival until its handler returned
+#
+#   python -m benchmarks.handlers --updates 2000 --users 50 --rate 200 \
+#       --latency finalize=0.05 --latency receive=0.05
+#
+#   python -m benchmarks.handlers --fake-wallet --json before.json
+#
+#   python -m benchmarks.handlers --fake-wallet --record rush.jsonl.gz
+#   python -m benchmarks.handlers --replay rush.jsonl.gz --replay-scale 0.5
+#
+# with --wallet-workers the wallet part is handed to the worker pool, the
+# latency then reflects the time the update held the dispatcher
+
+TRANSLATIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'translations')
+
+DEFAULT_MIX = 'balance=40,deposit=15,withdraw=15,s1=10,s2=10,group=10'
+
+PERCENTILES = [50, 95, 99]
+
+
+def setupTranslations():
+    i18config.set('file_format', 'json')
+    i18config.set('load_path', [TRANSLATIONS_DIRECTORY])
+    i18config.set('filename_format', '{namespace}.{locale}.{format}')
+    i18config.set('locale', 'en')
+    resource_loader.init_json_loader()
+
+
+# nearest-rank percentile, values have to be sorted
+def percentile(values, p):
+    if len(values) == 0:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+# wallet provider answering like a healthy wallet after the configured
+# per-method latency, the slatepacks are real so the local parser works
+class LatencyWalletProvider(WalletProvider):
+    def __init__(self, latency={}):
+        self.latency = latency
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def wait(self, method):
+        time.sleep(self.latency.get(method, 0))
+
+    def nextTxId(self):
+        with self.lock:
+            self.counter += 1
+            return '00000000-0000-4000-8000-{:012d}'.format(self.counter)
+
+    def sync(self, full=False):
+        self.wait('sync')
+        return True, None
+
+    def isReady(self):
+        self.wait('isReady')
+        return True, None
+
+    def send(self, amount, *args, **kwargs):
+        self.wait('send')
+        tx_id = self.nextTxId()
+        return True, None, encodeSlatepack(tx_id, 'S1', amt=toNanogrin(amount)), tx_id
+
+    def releaseLock(self, tx_id):
+        self.wait('releaseLock')
+        return True, None
+
+    def invoice(self, amount, *args, **kwargs):
+        self.wait('invoice')
+        tx_id = self.nextTxId()
+        return True, None, encodeSlatepack(tx_id, 'I1', amt=toNanogrin(amount)), tx_id
+
+    def decodeSlatepack(self, slatepack):
+        self.wait('decodeSlatepack')
+        valid, reason, header = parseSlatepack(slatepack)
+        return valid, reason, header
+
+    def receive(self, slatepack, slate=None):
+        self.wait('receive')
+        tx_id = slate['id']
+        return True, None, encodeSlatepack(tx_id, 'S2', amt=slate['amt']), tx_id
+
+    def finalize(self, slatepack, slate=None):
+        self.wait('finalize')
+        return True, None, slate['id']
+
+    def retrieveTxs(self, tx_ids=None):
+        self.wait('retrieveTxs')
+        return True, None, []
+
+
+# approves everything, keeps no state
+class BenchPersonality(BlankPersonality):
+    def getBalance(self, update, context):
+        return True, None, (1.0, 0.0, 0.0, 0.0)
+
+    def canDeposit(self, update, context, amount):
+        return True, None, True, amount
+
+    def canWithdraw(self, update, context, amount, maximum=False):
+        return True, None, True, amount
+
+    def assignDepositTx(self, update, context, amount, tx_id):
+        return True, None, True, None
+
+    def assignWithdrawTx(self, update, context, amount, tx_id):
+        return True, None
+
+    def shouldFinalizeDepositTx(self, update, context, tx_id):
+        return True, None
+
+    def shouldFinalizeWithdrawTx(self, update, context, tx_id):
+        return True, None
+
+    def finalizeDepositTx(self, update, context, tx_id):
+        return True, None, None
+
+    def finalizeWithdrawTx(self, update, context, tx_id):
+        return True, None, None
+
+    def shouldSeeEULA(self, update, context):
+        return False, None, None
+
+    def shouldIgnore(self, update, context):
+        return False, None
+
+    def incomingText(self, update, context, contains_slatepack):
+        return True, None
+
+    def incomingTextDM(self, update, context, contains_slatepack):
+        return True, None
+
+    def incomingTextGroup(self, update, context, contains_slatepack):
+        return True, None
+
+    def customPublicSlatepackWarning(self):
+        return None
+
+    def customDepositInstructions(self, update, context):
+        return False, None
+
+    def customDepositSlatepackFormatting(self, update, context):
+        return None
+
+    def customDepositFinalMessage(self, update, context):
+        return None
+
+    def customWithdrawInstructions(self, update, context):
+        return False, None
+
+    def customWithdrawSlatepackFormatting(self, update, context):
+        return None
+
+    def customWithdrawFinalMessage(self, update, context):
+        return None
+
+    def customSRSDepositInstructions(self, update, context):
+        return False, None
+
+    def customSRSDepositSlatepackFormatting(self, update, context):
+        return None
+
+    def customSRSDepositFinalMessage(self, update, context):
+        return None
+
+
+# builds the synthetic updates, returns [(kind, update), ...]
+class Workload:
+    def __init__(self, bot, users=10, mix=DEFAULT_MIX, seed=0,
+                 withdrawals=None):
+        self.random = random.Random(seed)
+        self.mg = MessageGenerator(bot)
+        ug = UserGenerator()
+        cg = ChatGenerator()
+        self.users = []
+        for i in range(users):
+            user = ug.get_user(id=100000 + i)
+            self.users.append((user, cg.get_chat(user=user)))
+        self.group = cg.get_chat(type='group', title='bench')
+        self.kinds, self.weights = [], []
+        for kind, weight in parsePairs(mix.split(','), cast=int).items():
+            self.kinds.append(kind)
+            self.weights.append(weight)
+
+        # tx_ids of the already started withdrawals, the S2 responses
+        # have to refer to a transaction known to the wallet
+        self.withdrawals = withdrawals
+
+    def slatepack(self, sta):
+        tx_id = None
+        if sta == 'S2' and self.withdrawals:
+            tx_id = self.withdrawals.pop()
+        if tx_id is None:
+            tx_id = '{:08x}-0000-4000-8000-{:012x}'.format(
+                self.random.getrandbits(32), self.random.getrandbits(48))
+        amount = self.random.randint(1, 1000) * 100000000
+        return encodeSlatepack(tx_id, sta, amt=amount, fee=8000000)
+
+    def text(self, kind):
+        amount = self.random.randint(1, 1000) / 10.0
+        if kind == 'balance':
+            return '/balance'
+        if kind == 'deposit':
+            return '/deposit {}'.format(amount)
+        if kind == 'withdraw':
+            return '/withdraw {}'.format(amount)
+        if kind == 's1':
+            return self.slatepack('S1')
+        if kind == 's2':
+            return self.slatepack('S2')
+        return 'gm, how is everyone doing {}'.format(amount)
+
+    def generate(self, count):
+        updates = []
+        for kind in self.random.choices(self.kinds, self.weights, k=count):
+            user, chat = self.random.choice(self.users)
+            if kind == 'group':
+                chat = self.group
+            update = self.mg.get_message(
+                user=user, chat=chat, text=self.text(kind),
+                parse_mode='HTML')
+            updates.append((kind, update))
+        return updates
+
+
+# drives the updates through the dispatcher, returns the results dict
+def run(slateboy, updates, rate=0, concurrency=4):
+    dispatcher = slateboy.updater.dispatcher
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def onError(update, context):
+        with lock:
+            errors[type(context.error).__name__] = errors.get(
+                type(context.error).__name__, 0) + 1
+    dispatcher.add_error_handler(onError)
+
+    def process(kind, update, scheduled):
+        dispatcher.process_update(update)
+        latency = time.perf_counter() - scheduled
+        with lock:
+            latencies.setdefault(kind, []).append(latency)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    start = time.perf_counter()
+    for i, (kind, update) in enumerate(updates):
+        scheduled = time.perf_counter()
+        if rate > 0:
+            # open loop, updates arrive on schedule no matter how
+            # quickly the bot answers
+            scheduled = start + i / float(rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        executor.submit(process, kind, update, scheduled)
+    executor.shutdown(wait=True)
+    if slateboy.wallet_workers is not None:
+        slateboy.wallet_workers.stop()
+    elapsed = time.perf_counter() - start
+
+    results = {
+        'updates': len(updates),
+        'elapsed': elapsed,
+        'throughput': len(updates) / elapsed,
+        'errors': errors,
+        'handlers': {}
+    }
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        stats = {'count': len(values)}
+        for p in PERCENTILES:
+            stats['p{}'.format(p)] = percentile(values, p) * 1000
+        results['handlers'][kind] = stats
+    return results
+
+
+def report(results, out=sys.stdout):
+    out.write('{} updates in {:.2f}s, {:.1f} updates/s\n'.format(
+        results['updates'], results['elapsed'], results['throughput']))
+    out.write('{:<10} {:>7} {:>10} {:>10} {:>10}\n'.format(
+        'handler', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for kind, stats in results['handlers'].items():
+        out.write('{:<10} {:>7} {:>10.2f} {:>10.2f} {:>10.2f}\n'.format(
+            kind, stats['count'], stats['p50'], stats['p95'], stats['p99']))
+    for name, count in results['errors'].items():
+        out.write('errors {}: {}\n'.format(name, count))
+
+
+# method=value command line pairs
+def parsePairs(pairs, cast=str):
+    parsed = {}
+    for pair in pairs:
+        method, value = pair.split('=', 1)
+        parsed[method.strip()] = cast(value)
+    return parsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Throughput and latency of the SlateBoy handlers')
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='updates per second, 0 sends as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='dispatcher threads processing the updates')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='kind=weight pairs, kinds: balance, deposit, '
+                             'withdraw, s1, s2, group')
+    parser.add_argument('--latency', action='append', default=[],
+                        metavar='METHOD=SECONDS',
+                        help='latency of the provider methods, or of the '
+                             'Owner API methods with --fake-wallet')
+    parser.add_argument('--fake-wallet', action='store_true',
+                        help='use CoreWallet against the fake grin-wallet')
+    parser.add_argument('--record', default=None, metavar='PATH',
+                        help='record the wallet calls to this log')
+    parser.add_argument('--replay', default=None, metavar='PATH',
+                        help='answer the wallet calls from a recorded log')
+    parser.add_argument('--replay-scale', type=float, default=1.0,
+                        help='multiplies the recorded wallet latencies')
+    parser.add_argument('--wallet-workers', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None,
+                        help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    setupTranslations()
+    latency = parsePairs(args.latency, cast=float)
+
+    server = None
+    withdrawals = None
+    if args.fake_wallet:
+        from slateboy.core_wallet import CoreWallet
+        from slateboy.fake_wallet import FakeWalletServer
+        # one output per prepared withdrawal
+        server = FakeWalletServer(
+            latency=latency, seed=args.seed,
+            outputs=[10000000000 for i in range(args.updates)]).start()
+        wallet = CoreWallet(
+            '', api_url=server.owner_url, foreign_api_url=server.foreign_url,
+            target_outputs=args.updates)
+        # withdrawals for the S2 responses to refer to
+        withdrawals = []
+        for i in range(args.updates):
+            success, reason, slatepack, tx_id = wallet.send(0.1)
+            withdrawals.append(tx_id)
+    elif args.replay is not None:
+        wallet = ReplayWalletProvider(args.replay, scale=args.replay_scale)
+    else:
+        wallet = LatencyWalletProvider(latency)
+    if args.record is not None:
+        wallet = RecordingWalletProvider(wallet, args.record)
+
+    bot = Mockbot()
+    config = {'wallet_workers': args.wallet_workers}
+    slateboy = SlateBoy(
+        'slate-boy', '', BenchPersonality(), wallet, config=config, bot=bot)
+    slateboy.initiate()
+
+    workload = Workload(
+        bot, users=args.users, mix=args.mix, seed=args.seed,
+        withdrawals=withdrawals)
+    updates = workload.generate(args.updates)
+
+    try:
+        results = run(slateboy, updates,
+                      rate=args.rate, concurrency=args.concurrency)
+    finally:
+        if server is not None:
+            server.stop()
+        if args.record is not None:
+            wallet.close()
+
+    report(results)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import time
+import threading
+
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half-open'
+
+
+# stops calling an unreachable wallet after a few consecutive failures,
+# while open the calls are rejected straight away and a single probe is
+# let through after the backoff, the backoff grows with every failed probe
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=5,
+                 max_reset_timeout=300, multiplier=2):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.multiplier = multiplier
+
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.backoff = reset_timeout
+        self.next_probe = None
+        self.lock = threading.Lock()
+
+    # cheap check without side effects, False while the breaker
+    # is open and the next probe is not due yet
+    def isAvailable(self):
+        with self.lock:
+            if self.state != BREAKER_OPEN:
+                return True
+            return time.monotonic() >= self.next_probe
+
+    # returns True if the call may proceed
+    def allow(self):
+        with self.lock:
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_HALF_OPEN:
+                # probe already in flight
+                return False
+            if time.monotonic() < self.next_probe:
+                return False
+            self.state = BREAKER_HALF_OPEN
+            return True
+
+    def recordSuccess(self):
+        with self.lock:
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self.backoff = self.reset_timeout
+            self.next_probe = None
+
+    def recordFailure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == BREAKER_HALF_OPEN:
+                # failed probe, wait longer next time
+                self.backoff = min(
+                    self.backoff * self.multiplier, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold:
+                return
+            self.state = BREAKER_OPEN
+            self.next_probe = time.monotonic() + self.backoff
@@ -1,4 +1,4 @@
-from i18n.translator import t
+from slateboy.translations import t
 
 from slateboy.personality import BlankPersonality
 from slateboy.helpers import getNow, extractIDs, extractIsBot
@@ -48,7 +48,7 @@ class ContextBlankPersonality(BlankPersonality):
         # check if context initiated
         if self.namespace not in context.user_data.keys():
             success = False
-            reason = t('slateboy.msg_missing_user_context')
+            reason = t('contextbot.msg_missing_user_context')
             return success, reason
 
         user_data = context.user_data[self.namespace][user_id]
@@ -56,13 +56,13 @@ class ContextBlankPersonality(BlankPersonality):
         # check if user has balance initiated
         if 'balance' not in user_data.keys():
             success = False
-            reason = t('slateboy.msg_missing_user_context')
+            reason = t('contextbot.msg_missing_user_context')
             return success, reason
 
         # check if user has transactions initiated
         if 'txs' not in user_data.keys():
             success = False
-            reason = t('slateboy.msg_missing_user_context')
+            reason = t('contextbot.msg_missing_user_context')
             return success, reason
 
         # everything is there
@@ -76,7 +76,7 @@ class ContextBlankPersonality(BlankPersonality):
         is_initiated, _ = self.isUserContextInitiated(context, user_id)
         if is_initiated:
             success = False
-            reason = t('slateboy.msg_user_context_already_initiated')
+            reason = t('contextbot.msg_user_context_already_initiated')
             return success, reason
 
         now = getNow()
@@ -103,7 +103,7 @@ class ContextBlankPersonality(BlankPersonality):
         # check if context initiated
         if self.namespace not in context.bot_data.keys():
             success = False
-            reason = t('slateboy.msg_missing_bot_context')
+            reason = t('contextbot.msg_missing_bot_context')
             return success, reason
 
         bot_data = context.bot_data[self.namespace]
@@ -111,7 +111,7 @@ class ContextBlankPersonality(BlankPersonality):
         # check if bot has balance initiated
         if 'balance' not in bot_data.keys() or 'txs' not in bot_data.keys():
             success = False
-            reason = t('slateboy.msg_missing_bot_context')
+            reason = t('contextbot.msg_missing_bot_context')
             return success, reason
 
         # everything is there
@@ -125,10 +125,11 @@ class ContextBlankPersonality(BlankPersonality):
         is_initiated, _ = self.isBotContextInitiated(context)
         if is_initiated:
             success = False
-            reason = t('slateboy.msg_bot_context_already_initiated')
+            reason = t('contextbot.msg_bot_context_already_initiated')
             return success, reason
         else:
-            context.bot_data[self.namespace] = {}
+            # keep what SlateBoy already stores in the namespace
+            context.bot_data.setdefault(self.namespace, {})
 
         context.bot_data[self.namespace]['balance'] = 0
         context.bot_data[self.namespace]['txs'] = {}
@@ -145,7 +146,7 @@ class ContextBlankPersonality(BlankPersonality):
         is_initiated, _ = self.isUserContextInitiated(context, user_id)
         if is_initiated:
             success = False
-            reason = t('slateboy.msg_user_context_not_initiated')
+            reason = t('contextbot.msg_user_context_not_initiated')
             return success, reason, balance
 
         # done, return the balance
@@ -160,7 +161,7 @@ class ContextBlankPersonality(BlankPersonality):
         is_initiated, _ = self.isBotContextInitiated(context)
         if is_initiated:
             success = False
-            reason = t('slateboy.msg_bot_context_not_initiated')
+            reason = t('contextbot.msg_bot_context_not_initiated')
             return success, reason, balance
 
         # done, return the balance
@@ -312,7 +313,7 @@ class ContextBlankPersonality(BlankPersonality):
         # check if this transaction has already been assigned
         if tx_id in context.bot_data[self.namespace]['txs'].keys():
             success = False
-            reason = t('slateboy.msg_tx_already_assigned')
+            reason = t('contextbot.msg_tx_already_assigned')
             reply_text = None
             return success, reason, reply_text
 
@@ -334,7 +335,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_deposit_assigned').format(
+        reply_text = t('contextbot.msg_deposit_assigned').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -361,7 +362,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_deposit_finalized').format(
+        reply_text = t('contextbot.msg_deposit_finalized').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -394,7 +395,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_deposit_confirmed').format(
+        reply_text = t('contextbot.msg_deposit_confirmed').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -426,7 +427,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_deposit_canceled').format(
+        reply_text = t('contextbot.msg_deposit_canceled').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -494,7 +495,7 @@ class ContextBlankPersonality(BlankPersonality):
         success = True
         reason = None
         send_instructions = True
-        reply_text = t('slateboy.msg_withdraw_assigned').format(
+        reply_text = t('contextbot.msg_withdraw_assigned').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, send_instructions, reply_text
@@ -509,7 +510,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_withdraw_finalized').format(
+        reply_text = t('contextbot.msg_withdraw_finalized').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -541,7 +542,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_withdraw_confirmed').format(
+        reply_text = t('contextbot.msg_withdraw_confirmed').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -574,7 +575,7 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         success = True
         reason = None
-        reply_text = t('slateboy.msg_deposit_canceled').format(
+        reply_text = t('contextbot.msg_withdraw_canceled').format(
             str(spendable), str(awaiting_confirmation),
             str(awaiting_finalization), str(locked))
         return success, reason, reply_text
@@ -588,7 +589,7 @@ class ContextBlankPersonality(BlankPersonality):
             should_finalize = self.isTx(context, tx_id)
             return should_finalize, reason
         except ValueError:
-            reason = t('slateboy.msg_unknown_tx')
+            reason = t('contextbot.msg_unknown_tx')
             should_finalize = False
             return should_finalize, reason
 
@@ -663,12 +664,17 @@ class ContextBlankPersonality(BlankPersonality):
         # all done!
         return False
 
+    # admin commands are reserved for the configured admins
+    def isAdmin(self, update, context):
+        chat_id, user_id = extractIDs(update)
+        return user_id in self.admins
+
     # we want the bot to ignore other bots by default
     def shouldIgnore(self, update, context):
         # is the message coming from a bot?
         if extractIsBot(update):
             ignore = True
-            reason = t('slateboy.msg_rejecting_bots')
+            reason = t('contextbot.msg_rejecting_bots')
             return ignore, reason
 
         # seems like we can let this flow continue...
@@ -677,6 +683,23 @@ class ContextBlankPersonality(BlankPersonality):
         reason = None
         return ignore, reason
 
+    def translationKeys(self):
+        balance = ('0', '1', '2', '3')
+        keys = {
+            'contextbot.msg_free_balance_warning': balance + ('4',),
+            'contextbot.msg_free_balance_exceeded': balance + ('4',)}
+        for key in ['deposit_assigned', 'deposit_finalized',
+                    'deposit_confirmed', 'deposit_canceled',
+                    'withdraw_assigned', 'withdraw_finalized',
+                    'withdraw_confirmed', 'withdraw_canceled']:
+            keys['contextbot.msg_' + key] = balance
+        for key in ['missing_user_context', 'user_context_already_initiated',
+                    'user_context_not_initiated', 'missing_bot_context',
+                    'bot_context_already_initiated', 'bot_context_not_initiated',
+                    'tx_already_assigned', 'unknown_tx', 'rejecting_bots']:
+            keys['contextbot.msg_' + key] = ()
+        return keys
+
     def atStart(self, context):
         success, reason = self.isBotContextInitiated(context)
         if not success:
@@ -1,27 +1,261 @@
+import os
+import json
+import time
+import asyncio
+import inspect
+import logging
 import functools
-import requests
+import threading
 
-from grinmw.wallet_v3 import WalletV3, WalletError
+from concurrent.futures import ThreadPoolExecutor
 
-from slateboy.providers import WalletProvider
+from grinmw.wallet_v3 import WalletV3, WalletError, encrypt, decrypt
+from requests.exceptions import ConnectionError as HTTPConnectionError, Timeout
 
+from slateboy.providers import WalletProvider, AsyncWalletProvider
+from slateboy.transport import getDefaultTransport, DEFAULT_TIMEOUT
+from slateboy.breaker import CircuitBreaker
+from slateboy.outputs import OutputManager
+from slateboy.translations import t
+from slateboy.helpers import toNanogrin
+
+
+logger = logging.getLogger(__name__)
 
 # until the following PR gets merged...
 # https://github.com/grinfans/grinmw.py/pull/7
-def receive(api_url, api_user, api_password, slate, dest_acct_name, r_addr):
-    method = ''
+def receive(api_url, api_user, api_password, slate, dest_acct_name, r_addr,
+            transport=None, timeout=DEFAULT_TIMEOUT):
+    if transport is None:
+        transport = getDefaultTransport()
+    method = 'receive_tx'
+    params = [slate, dest_acct_name, r_addr]
     payload = {
         'jsonrpc': '2.0',
         'id': 1,
-        'method': 'receive_tx',
-        'params': [slate, dest_acct_name, r_addr]
+        'method': method,
+        'params': params
     }
-    response = requests.post(
-                api_url, json=payload,
-                auth=(api_user, api_password))
+    response = transport.post(
+        api_url, payload, auth=(api_user, api_password), timeout=timeout)
+    if response.status_code >= 300 or response.status_code < 200:
+        raise WalletError(method, params, response.status_code, response.reason)
+    resp = response.json()
+    if 'error' in resp:
+        raise WalletError(
+            method, params, resp['error']['code'], resp['error']['message'])
+    if isinstance(resp['result'], dict) and 'Err' in resp['result']:
+        raise WalletError(method, params, None, resp['result']['Err'])
     return resp['result']['Ok']
 
 
+# Owner API client sending its requests through the shared transport
+# instead of opening a new connection for every call, the timeouts
+# belong to the client as the transport may serve other wallets too
+class PooledWalletV3(WalletV3):
+    def __init__(self, api_url, api_user, api_password, transport=None,
+                 timeout=DEFAULT_TIMEOUT, method_timeouts={}):
+        WalletV3.__init__(self, api_url, api_user, api_password)
+        if transport is None:
+            transport = getDefaultTransport()
+        self.transport = transport
+
+        # default timeout of the Owner API calls and the overrides of
+        # the slow methods like scan, None waits as long as it takes
+        self.timeout = timeout
+        self.method_timeouts = dict(method_timeouts)
+
+        # None until the first batch tells whether the wallet
+        # takes the JSON-RPC batches
+        self.batch_supported = None
+
+    def timeoutOf(self, method):
+        return self.method_timeouts.get(method, self.timeout)
+
+    def post(self, method, params, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeoutOf(method)
+        payload = {
+            'jsonrpc': '2.0',
+            'id': 1,
+            'method': method,
+            'params': params
+        }
+        response = self.transport.post(
+            self.api_url, payload, auth=(self.api_user, self.api_password),
+            timeout=timeout)
+        if response.status_code >= 300 or response.status_code < 200:
+            raise WalletError(method, params, response.status_code, response.reason)
+        response_json = response.json()
+        if 'error' in response_json:
+            raise WalletError(
+                method, params,
+                response_json['error']['code'],
+                response_json['error']['message'])
+        result = response_json.get('result', None)
+        if isinstance(result, dict) and 'Err' in result:
+            raise WalletError(method, params, None, response_json['result']['Err'])
+        return response_json
+
+    # the same exchange as in WalletV3, waiting as long as the encrypted
+    # method is allowed to take
+    def post_encrypted(self, method, params):
+        payload = {
+            'jsonrpc': '2.0',
+            'id': 1,
+            'method': method,
+            'params': params
+        }
+        nonce = os.urandom(12)
+        encrypted = encrypt(self.share_secret, json.dumps(payload), nonce)
+        resp = self.post('encrypted_request_v3', {
+            'nonce': nonce.hex(),
+            'body_enc': encrypted
+        }, timeout=self.timeoutOf(method))
+        nonce2 = bytes.fromhex(resp['result']['Ok']['nonce'])
+        encrypted2 = resp['result']['Ok']['body_enc']
+        response_json = json.loads(decrypt(self.share_secret, encrypted2, nonce2))
+        if 'error' in response_json:
+            raise WalletError(
+                method, params,
+                response_json['error']['code'],
+                response_json['error']['message'])
+        # the failed methods answer with the Err result, WalletV3 would
+        # only notice the missing Ok
+        result = response_json.get('result', None)
+        if isinstance(result, dict) and 'Err' in result:
+            raise WalletError(method, params, None, result['Err'])
+        return response_json
+
+    # independent Owner API requests in a single encrypted exchange,
+    # requests are [(method, params), ...] without the token
+    # returns list of the Ok results or WalletError instances
+    def batch(self, requests):
+        requests = [(method, dict(params, token=self.token))
+                    for method, params in requests]
+        if self.batch_supported is not False:
+            try:
+                results = self.postEncryptedBatch(requests)
+                self.batch_supported = True
+                return results
+            except BatchUnsupported:
+                self.batch_supported = False
+            except WalletError as e:
+                # once the batches worked, the error is about this one,
+                # the expired session and the wallet being down as well
+                if self.batch_supported or isSessionError(e) or isTransportError(e):
+                    raise e
+                # the wallet answered the batch as a whole
+                logger.info('Wallet does not take the JSON-RPC batches: %s', e)
+                self.batch_supported = False
+
+        # one exchange per request
+        results = []
+        for method, params in requests:
+            try:
+                response_json = self.post_encrypted(method, params)
+            except WalletError as e:
+                results.append(e)
+                continue
+            results.append(batchResult(method, params, response_json))
+        return results
+
+    def postEncryptedBatch(self, requests):
+        payload = []
+        for i, (method, params) in enumerate(requests):
+            payload.append({
+                'jsonrpc': '2.0',
+                'id': i + 1,
+                'method': method,
+                'params': params
+            })
+        nonce = os.urandom(12)
+        encrypted = encrypt(self.share_secret, json.dumps(payload), nonce)
+        resp = self.post('encrypted_request_v3', {
+            'nonce': nonce.hex(),
+            'body_enc': encrypted
+        })
+        nonce2 = bytes.fromhex(resp['result']['Ok']['nonce'])
+        encrypted2 = resp['result']['Ok']['body_enc']
+        responses = json.loads(decrypt(self.share_secret, encrypted2, nonce2))
+
+        # a single error instead of the list of responses
+        if isinstance(responses, dict) and 'error' in responses:
+            raise WalletError(
+                'batch', None,
+                responses['error'].get('code', None),
+                responses['error'].get('message', None))
+        if not isinstance(responses, list):
+            raise BatchUnsupported()
+        responses = {response.get('id', None): response for response in responses}
+
+        results = []
+        for i, (method, params) in enumerate(requests):
+            response_json = responses.get(i + 1, None)
+            if response_json is None:
+                results.append(WalletError(method, params, None, 'Missing response'))
+                continue
+            results.append(batchResult(method, params, response_json))
+        return results
+
+
+class BatchUnsupported(Exception):
+    pass
+
+
+# returns the Ok result (any) or WalletError
+def batchResult(method, params, response_json):
+    if 'error' in response_json:
+        return WalletError(
+            method, params,
+            response_json['error']['code'],
+            response_json['error']['message'])
+    result = response_json.get('result', None)
+    if isinstance(result, dict) and 'Err' in result:
+        return WalletError(method, params, None, result['Err'])
+    if not isinstance(result, dict) or 'Ok' not in result:
+        return WalletError(method, params, None, 'Invalid response')
+    return result['Ok']
+
+
+# provider methods which can share a batch, with the length
+# of their return values
+BATCHED_METHODS = {
+    'isReady': 2,
+    'retrieveTxs': 3,
+    'releaseLock': 2
+}
+
+
+# fragments of the Owner API error messages indicating that the
+# session token or the shared secret is no longer valid, for instance
+# because the grin-wallet has been restarted
+SESSION_ERROR_HINTS = ['token', 'encrypt', 'decrypt', 'shared key', 'not open']
+
+
+def isSessionError(e):
+    reason = str(e.reason).lower()
+    for hint in SESSION_ERROR_HINTS:
+        if hint in reason:
+            return True
+    return False
+
+
+# translation key of the reason returned when the circuit breaker
+# rejected the call, nothing reached the wallet
+WALLET_UNAVAILABLE = 'slateboy.msg_wallet_unavailable'
+
+
+# the wallet did not answer, connection refused, timeout or a server
+# error, the Err results and the other errors come from a reachable wallet
+def isTransportError(e):
+    if isinstance(e, (ConnectionError, TimeoutError, HTTPConnectionError, Timeout)):
+        return True
+    if isinstance(e, WalletError):
+        return isinstance(e.code, int) and e.code >= 500
+    return False
+
+
 class WrapCoreWallet:
     def __init__(self, expected_length):
         self.expected_length = expected_length
@@ -30,22 +264,54 @@ class WrapCoreWallet:
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             other_self = args[0]
-            try:
-                other_self.wallet.open_wallet(None, other_self.wallet_password)
-                ret = func(*args, **kwargs)
-                other_self.wallet.close_wallet()
-                return ret
-            except WalletError as e:
+
+            # wallet known to be down, do not wait for another timeout
+            if not other_self.breaker.allow():
                 success = False
-                reason = str(e)
+                reason = t(WALLET_UNAVAILABLE)
                 return tuple(
-                    [success, reason] + [None for i in range(expected_length - 2)])
+                    [success, reason] + [None for i in range(self.expected_length - 2)])
+
+            try:
+                ret = self.call(other_self, func, *args, **kwargs)
             except Exception as e:
                 success = False
+                if isTransportError(e):
+                    logger.warning('Wallet did not answer %s: %s', func.__name__, e)
+                    other_self.breaker.recordFailure()
+                    reason = t(WALLET_UNAVAILABLE)
+                    return tuple(
+                        [success, reason] + [None for i in range(self.expected_length - 2)])
+                # the wallet has answered, it is reachable
+                other_self.breaker.recordSuccess()
+                reason = str(e)
                 return tuple(
-                    [success] + [None for i in range(expected_length - 1)])
+                    [success, reason] + [None for i in range(self.expected_length - 2)])
+            other_self.breaker.recordSuccess()
+            return ret
         return wrapper
 
+    def call(self, other_self, func, *args, **kwargs):
+        # legacy mode, open and close the wallet around every call
+        if not other_self.keep_session:
+            if other_self.wallet is None:
+                other_self.openSession()
+            other_self.wallet.open_wallet(None, other_self.wallet_password)
+            ret = func(*args, **kwargs)
+            other_self.wallet.close_wallet()
+            return ret
+
+        # session mode, reuse the token and re-open only if
+        # the wallet rejected it
+        other_self.ensureSession()
+        try:
+            return func(*args, **kwargs)
+        except WalletError as e:
+            if not isSessionError(e):
+                raise e
+            other_self.openSession()
+            return func(*args, **kwargs)
+
 
 class CoreWallet(WalletProvider):
     def __init__(
@@ -53,7 +319,13 @@ class CoreWallet(WalletProvider):
             api_password,
             api_url='http://127.0.0.1:3420/v3/owner',
             foreign_api_url='http://localhost:3415/v2/foreign',
-            api_user='grin', wallet_password=''):
+            api_user='grin', wallet_password='',
+            keep_session=True, session_idle_timeout=600,
+            transport=None, api_timeout=None, foreign_api_timeout=None,
+            scan_timeout=None,
+            sync_state_path=None, reorg_margin=60, breaker=None,
+            output_manager=None, target_outputs=None,
+            warmup_retries=10, warmup_delay=1, warmup_max_delay=30):
         self.api_user = api_user
         self.api_password = api_password
 
@@ -62,22 +334,180 @@ class CoreWallet(WalletProvider):
 
         self.wallet_password = wallet_password
 
-        # connect
-        self.manageConnection()
+        # pooled keep-alive HTTP transport, shared across the endpoints
+        # and possibly other wallets
+        if transport is None:
+            transport = getDefaultTransport()
+        self.transport = transport
+
+        # timeouts of this wallet, None api_timeout and foreign_api_timeout
+        # keep those of the transport, the scan of a long chain takes
+        # minutes and is never cut short unless scan_timeout is set
+        self.api_timeout = DEFAULT_TIMEOUT
+        if api_timeout is not None:
+            self.api_timeout = api_timeout
+        self.foreign_api_timeout = DEFAULT_TIMEOUT
+        if foreign_api_timeout is not None:
+            self.foreign_api_timeout = foreign_api_timeout
+        self.scan_timeout = scan_timeout
+
+        # session management
+        self.keep_session = keep_session
+        self.session_idle_timeout = session_idle_timeout
+        self.session_last_used = None
+        self.session_lock = threading.RLock()
+
+        # incremental sync, the last scanned height survives restarts
+        # if the sync_state_path is provided
+        self.sync_state_path = sync_state_path
+        self.reorg_margin = reorg_margin
+        self.sync_lock = threading.Lock()
+        self.last_scanned_height = self.loadSyncState()
+
+        # stops waiting for the timeouts when the wallet is down
+        if breaker is None:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+
+        # keeps enough spendable outputs for the concurrent withdrawals,
+        # opt-in, without target_outputs every withdrawal uses the whole
+        # wallet as before
+        if output_manager is None and target_outputs:
+            output_manager = OutputManager(target_outputs=target_outputs)
+        self.output_manager = output_manager
+
+        # serializes the sends without the output manager
+        self.send_lock = threading.Lock()
+
+        # the connection is established by the first call or by
+        # the warmup, the wallet might be still starting or unlocking
+        self.wallet = None
+        self.wallet_share_secret = None
+        self.wallet_token = None
+        self.warmup_retries = warmup_retries
+        self.warmup_delay = warmup_delay
+        self.warmup_max_delay = warmup_max_delay
 
     def manageConnection(self):
-        self.wallet = WalletV3(self.api_url, self.api_user, self.api_password)
+        self.wallet = PooledWalletV3(
+            self.api_url, self.api_user, self.api_password,
+            transport=self.transport, timeout=self.api_timeout,
+            method_timeouts={'scan': self.scan_timeout})
         self.wallet_share_secret = self.wallet.init_secure_api()
         self.wallet_token = self.wallet.open_wallet(None, self.wallet_password)
+        self.session_last_used = time.monotonic()
 
+    # drops the current session and establishes a new one
+    def openSession(self):
+        with self.session_lock:
+            self.closeSession()
+            self.manageConnection()
+
+    # closes the wallet, errors are ignored as the session
+    # might be already invalid
+    def closeSession(self):
+        with self.session_lock:
+            if self.wallet_token is None:
+                return
+            try:
+                self.wallet.close_wallet()
+            except Exception:
+                pass
+            self.wallet_token = None
+
+    # connects ahead of the first call, retried with a growing delay
+    # returns success (bool) reason (str)
+    def warmup(self):
+        delay = self.warmup_delay
+        reason = None
+        for attempt in range(self.warmup_retries):
+            if attempt > 0:
+                time.sleep(delay)
+                delay = min(delay * 2, self.warmup_max_delay)
+            try:
+                self.openSession()
+            except Exception as e:
+                reason = str(e)
+                logger.warning('Wallet not reachable yet, attempt %d: %s',
+                               attempt + 1, reason)
+                continue
+            self.breaker.recordSuccess()
+            success = True
+            reason = None
+            return success, reason
+        success = False
+        return success, reason
+
+    # makes sure there is an open session that was not idle for too long
+    def ensureSession(self):
+        with self.session_lock:
+            now = time.monotonic()
+            is_idle = self.session_last_used is None or \
+                now - self.session_last_used > self.session_idle_timeout
+            if self.wallet_token is None or is_idle:
+                self.openSession()
+            self.session_last_used = now
+
+    # returns last scanned height (int) or None
+    # the path given to the constructor wins over the one of SlateBoy
+    def setSyncStatePath(self, path):
+        if self.sync_state_path is not None:
+            return
+        with self.sync_lock:
+            self.sync_state_path = path
+            self.last_scanned_height = self.loadSyncState()
+
+    def loadSyncState(self):
+        if self.sync_state_path is None:
+            return None
+        if not os.path.exists(self.sync_state_path):
+            return None
+        with open(self.sync_state_path) as f:
+            state = json.load(f)
+        return state.get('last_scanned_height', None)
+
+    def saveSyncState(self):
+        if self.sync_state_path is None:
+            return
+        state = {'last_scanned_height': self.last_scanned_height}
+        directory = os.path.dirname(self.sync_state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.sync_state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.sync_state_path)
+
+    # scans from the last scanned height minus the reorg safety margin,
+    # full rescan from the genesis only if requested or if the last
+    # scanned height is not known
     # returns success (bool) reason (str)
     @WrapCoreWallet(2)
-    def sync(self, start_height=0, delete_unconfirmed=False):
-        self.wallet.scan(start_height=0, delete_unconfirmed=False)
+    def sync(self, full=False, delete_unconfirmed=False):
+        if not self.sync_lock.acquire(blocking=False):
+            success = False
+            reason = 'Wallet sync already in progress'
+            return success, reason
+        try:
+            tip = int(self.wallet.node_height()['height'])
+            start_height = 0
+            if not full and self.last_scanned_height is not None:
+                start_height = max(0, self.last_scanned_height - self.reorg_margin)
+            self.wallet.scan(
+                start_height=start_height,
+                delete_unconfirmed=delete_unconfirmed)
+            self.last_scanned_height = tip
+            self.saveSyncState()
+        finally:
+            self.sync_lock.release()
         success = True
         reason = None
         return success, reason
 
+    # no wallet call, False while the circuit breaker is open
+    def isAvailable(self):
+        return self.breaker.isAvailable()
+
     # returns success (bool) reason (str)
     @WrapCoreWallet(2)
     def isReady(self):
@@ -87,29 +517,64 @@ class CoreWallet(WalletProvider):
         else:
             return False, None
 
+    # amount in GRIN, converted to nanogrin for the Owner API only here
     # returns success (bool) reason (str) slatepack (str) tx_id (str)
     @WrapCoreWallet(4)
     def send(self, amount, slatepack_address=None, minimum_confirmations=10, max_outputs=1, num_change_outputs=1):
+        nanogrin = toNanogrin(amount)
+        if nanogrin is None:
+            success = False
+            reason = 'Invalid amount {}'.format(amount)
+            return success, reason, None, None
+
+        # select and lock under the same lock, the concurrent
+        # withdrawals would pick the same outputs otherwise
+        use_all = self.output_manager is None
+        lock = self.send_lock if use_all else self.output_manager.lock
+        with lock:
+            if not use_all:
+                outputs = self.wallet.retrieve_outputs(refresh=False)
+                height = int(self.wallet.node_height()['height'])
+                self.output_manager.update(
+                    outputs, height=height,
+                    minimum_confirmations=minimum_confirmations)
+                success, reason, max_outputs, num_change_outputs = \
+                    self.output_manager.plan(nanogrin)
+                if not success:
+                    return success, reason, None, None
+            slate = self.initSendTx(
+                nanogrin, slatepack_address, minimum_confirmations,
+                max_outputs, num_change_outputs, use_all)
+            # the wallet does not lock the inputs before this call,
+            # the next withdrawal may not see them unspent
+            try:
+                self.wallet.tx_lock_outputs(slate)
+            except Exception as e:
+                self.wallet.cancel_tx(tx_slate_id=slate.get('id', None))
+                raise e
+        fee = slate.get('fee', None)
+        txid = slate.get('id', None)
+        recipients = [slatepack_address]
+        slatepack = self.wallet.create_slatepack_message(slate, recipients)
+        success = True
+        reason = None
+        return success, reason, slatepack, txid
+
+    def initSendTx(self, amount, slatepack_address, minimum_confirmations,
+                   max_outputs, num_change_outputs, use_all):
         params = {
 			'src_acct_name': None,
 			'amount': amount,
 			'minimum_confirmations': minimum_confirmations,
 			'max_outputs': max_outputs,
 			'num_change_outputs': num_change_outputs,
-			'selection_strategy_is_use_all': True,
+			'selection_strategy_is_use_all': use_all,
 			'target_slate_version': None,
 			'payment_proof_recipient_address': slatepack_address,
 			'ttl_blocks': None,
 			'send_args': None
 		}
-        slate = self.wallet.init_send_tx(params)
-        fee = slate.get('fee', None)
-        txid = slate.get('id', None)
-        recipients = [slatepack_address]
-        slatepack = self.wallet.create_slatepack_message(slate, recipients)
-        success = True
-        reason = None
-        return success, reason, slatepack, txid
+        return self.wallet.init_send_tx(params)
 
     # cancels the tx!
     # returns success (bool) reason (str)
@@ -120,17 +585,22 @@ class CoreWallet(WalletProvider):
         reason = None
         return success, reason
 
+    # amount in GRIN like in send
     # returns success (bool) reason (str), slatepack (str) tx_id (str)
     @WrapCoreWallet(4)
     def invoice(self, amount, slatepack_address=None, target_slate_version=None):
+        nanogrin = toNanogrin(amount)
+        if nanogrin is None:
+            success = False
+            reason = 'Invalid amount {}'.format(amount)
+            return success, reason, None, None
         params = {
-			'amount': amount,
+			'amount': nanogrin,
             'dest_acct_name': slatepack_address,
             'target_slate_version': None
 		}
         slate = self.wallet.issue_invoice_tx(params)
         txid = slate.get('id', None)
-        txid = grinUUIDtoBytes(txid)
         recipients = [] # TODO confirm this
         if slatepack_address is not None:
             recipients = [slatepack_address]
@@ -150,24 +620,224 @@ class CoreWallet(WalletProvider):
 
     # returns success (bool) reason (str), slatepack (str) tx_id (str)
     @WrapCoreWallet(4)
-    def receive(self, slatepack):
-        secret_indices = [0]
-        slate = self.wallet.slate_from_slatepack_message(slatepack, secret_indices)
+    def receive(self, slatepack, slate=None):
+        if slate is None:
+            secret_indices = [0]
+            slate = self.wallet.slate_from_slatepack_message(slatepack, secret_indices)
         dest_acct_name = None # TODO check this argument
         r_addr = None # TODO check this argument
-        receive(self.foreign_api_url, self.api_user, self.api_password, slate, dest_acct_name, r_addr)
+        slate_received = receive(
+            self.foreign_api_url, self.api_user, self.api_password,
+            slate, dest_acct_name, r_addr, transport=self.transport,
+            timeout=self.foreign_api_timeout)
+        txid = slate_received.get('id', None)
+        recipients = [] # TODO confirm this
+        slatepack = self.wallet.create_slatepack_message(slate_received, recipients)
+        success = True
+        reason = None
+        return success, reason, slatepack, txid
 
-    # returns success (bool) reason (str), slatepack (str) tx_id (str)
+    # returns success (bool) reason (str) tx_id (str)
     @WrapCoreWallet(3)
-    def finalize(self, slatepack, lock=False, post=True, fluff=False):
-        slate = self.wallet.slate_from_slatepack_message(slatepack, secret_indices)
+    def finalize(self, slatepack, slate=None, lock=False, post=True, fluff=False):
+        if slate is None:
+            secret_indices = [0]
+            slate = self.wallet.slate_from_slatepack_message(slatepack, secret_indices)
         if lock:
             self.wallet.tx_lock_outputs(slate)
         slate_finalized = self.wallet.finalize_tx(slate)
         txid = slate_finalized.get('id', None)
         if post:
-            post_res = self.broadcast(
-                slate_finalized, open_wallet=False, fluff=fluff)
+            self.wallet.post_tx(slate_finalized, fluff=fluff)
         success = True
         reason = None
-        return success, reason, slatepack, txid
+        return success, reason, txid
+
+    # one lookup per transaction instead of the whole transaction log,
+    # all of them in a single exchange
+    # returns success (bool) reason (str) txs (list)
+    def retrieveTxs(self, tx_ids=None, refresh=True):
+        call = ('retrieveTxs', [], {'tx_ids': tx_ids, 'refresh': refresh})
+        return self.batch([call])[0]
+
+    # calls are (method, args, kwargs) tuples of the provider methods, the
+    # consecutive isReady, retrieveTxs and releaseLock calls share a single
+    # encrypted exchange, the other calls are made one by one
+    # returns list of the return values of the calls
+    def batch(self, calls):
+        results = [None for call in calls]
+        pending = []
+        for index, (method, args, kwargs) in enumerate(calls):
+            requests = self.batchRequests(method, args, kwargs)
+            if requests is None:
+                self.flushBatch(pending, results)
+                results[index] = getattr(self, method)(*args, **kwargs)
+                continue
+            pending.append((index, method, requests))
+        self.flushBatch(pending, results)
+        return results
+
+    def flushBatch(self, pending, results):
+        if len(pending) == 0:
+            return
+        requests = []
+        for index, method, method_requests in pending:
+            requests += method_requests
+
+        success, reason, responses = True, None, []
+        if len(requests) > 0:
+            success, reason, responses = self.ownerBatch(requests)
+
+        offset = 0
+        for index, method, method_requests in pending:
+            if success:
+                results[index] = self.batchResponse(
+                    method, method_requests,
+                    responses[offset:offset + len(method_requests)])
+            else:
+                results[index] = tuple([success, reason] + [
+                    None for i in range(BATCHED_METHODS[method] - 2)])
+            offset += len(method_requests)
+        del pending[:]
+
+    # Owner API requests behind the provider call
+    # returns [(method, params), ...] or None if the call cannot be batched
+    def batchRequests(self, method, args, kwargs):
+        if method not in BATCHED_METHODS:
+            return None
+        arguments = inspect.signature(getattr(self, method)).bind(*args, **kwargs)
+        arguments.apply_defaults()
+        arguments = arguments.arguments
+
+        if method == 'isReady':
+            return [('retrieve_summary_info', {
+                'minimum_confirmations': 1,
+                'refresh_from_node': True
+            })]
+        if method == 'releaseLock':
+            return [('cancel_tx', {
+                'tx_id': None,
+                'tx_slate_id': arguments['tx_id']
+            })]
+        if arguments['tx_ids'] is None:
+            return [('retrieve_txs', {
+                'refresh_from_node': arguments['refresh'],
+                'tx_id': None,
+                'tx_slate_id': None
+            })]
+        return [('retrieve_txs', {
+            'refresh_from_node': arguments['refresh'],
+            'tx_id': None,
+            'tx_slate_id': tx_id
+        }) for tx_id in arguments['tx_ids']]
+
+    # turns the Owner API results back into the provider return value
+    def batchResponse(self, method, requests, responses):
+        for (owner_method, params), response in zip(requests, responses):
+            if isinstance(response, WalletError):
+                success = False
+                reason = str(response)
+                return tuple([success, reason] + [
+                    None for i in range(BATCHED_METHODS[method] - 2)])
+
+        if method == 'isReady':
+            summary = responses[0][1]
+            return summary.get('last_confirmed_height', None) is not None, None
+        if method == 'releaseLock':
+            return True, None
+        txs = []
+        for response in responses:
+            txs += response[1]
+        return True, None, txs
+
+    # the requests are executed in order, refreshing from the node
+    # once at the start of the batch is enough
+    # returns success (bool) reason (str) results (list)
+    @WrapCoreWallet(3)
+    def ownerBatch(self, requests):
+        refreshed = None
+        batched = []
+        for i, (method, params) in enumerate(requests):
+            if params.get('refresh_from_node', False):
+                if refreshed is None:
+                    refreshed = i
+                else:
+                    params = dict(params, refresh_from_node=False)
+            batched.append((method, params))
+        results = self.wallet.batch(batched)
+
+        # the node could not be reached, none of the results requested
+        # with the refresh are up to date
+        if refreshed is not None and not isinstance(results[refreshed], WalletError) \
+                and not results[refreshed][0]:
+            for i, (method, params) in enumerate(requests):
+                if params.get('refresh_from_node', False):
+                    results[i] = WalletError(
+                        method, params, None, 'Failed to refresh data from the node')
+
+        # let the wrapper re-open the session
+        for result in results:
+            if isinstance(result, WalletError) and isSessionError(result):
+                raise result
+        success = True
+        reason = None
+        return success, reason, results
+
+
+# asyncio flavour of the CoreWallet, the Owner API client is blocking so
+# the calls are delegated to a small bounded executor, the coroutines
+# only keep the event loop free, under the threaded dispatcher the
+# calling handler thread waits for them all the same
+class AsyncCoreWallet(AsyncWalletProvider):
+    def __init__(self, api_password, max_workers=4, **kwargs):
+        self.core = CoreWallet(api_password, **kwargs)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='wallet')
+
+    async def call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        function = functools.partial(
+            getattr(self.core, method), *args, **kwargs)
+        return await loop.run_in_executor(self.executor, function)
+
+    async def sync(self, *args, **kwargs):
+        return await self.call('sync', *args, **kwargs)
+
+    def isAvailable(self):
+        return self.core.isAvailable()
+
+    def setSyncStatePath(self, path):
+        self.core.setSyncStatePath(path)
+
+    async def isReady(self):
+        return await self.call('isReady')
+
+    async def warmup(self):
+        return await self.call('warmup')
+
+    async def send(self, *args, **kwargs):
+        return await self.call('send', *args, **kwargs)
+
+    async def releaseLock(self, tx_id):
+        return await self.call('releaseLock', tx_id)
+
+    async def invoice(self, *args, **kwargs):
+        return await self.call('invoice', *args, **kwargs)
+
+    async def decodeSlatepack(self, slatepack):
+        return await self.call('decodeSlatepack', slatepack)
+
+    async def receive(self, *args, **kwargs):
+        return await self.call('receive', *args, **kwargs)
+
+    async def finalize(self, *args, **kwargs):
+        return await self.call('finalize', *args, **kwargs)
+
+    async def retrieveTxs(self, *args, **kwargs):
+        return await self.call('retrieveTxs', *args, **kwargs)
+
+    async def batch(self, calls):
+        return await self.call('batch', calls)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,229 @@
+import time
+import logging
+import threading
+
+from slateboy.providers import WalletProvider
+from slateboy.core_wallet import CoreWallet, WALLET_UNAVAILABLE
+from slateboy.translations import t
+
+
+logger = logging.getLogger(__name__)
+
+# length of the tuples returned by the provider methods
+EXPECTED_LENGTH = {
+    'sync': 2,
+    'send': 4,
+    'releaseLock': 2,
+    'invoice': 4,
+    'decodeSlatepack': 3,
+    'receive': 4,
+    'finalize': 3,
+    'retrieveTxs': 3
+}
+
+
+def unavailable(method):
+    success = False
+    reason = t(WALLET_UNAVAILABLE)
+    return tuple(
+        [success, reason] + [None for i in range(EXPECTED_LENGTH[method] - 2)])
+
+
+class WalletNode:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.wallet = None
+        self.healthy = False
+        self.sync_state_path = None
+
+    # returns True if connected
+    def connect(self):
+        if self.wallet is not None:
+            return True
+        try:
+            self.wallet = self.factory()
+        except Exception:
+            logger.warning('Wallet %s is not reachable', self.name)
+            return False
+        if self.sync_state_path is not None:
+            self.wallet.setSyncStatePath(self.sync_state_path)
+        return True
+
+
+# several grin-wallet Owner API endpoints behind one provider, for instance
+# replicas restored from the same seed, the read-only calls go to any
+# healthy node while the state-changing ones are pinned to the primary,
+# if the primary goes down the next healthy node takes over
+#
+# the transactions live in the wallet which created them, after a failover
+# the pending ones are only known to the previous primary
+class MultiCoreWallet(WalletProvider):
+    def __init__(self, endpoints, health_interval=30, **kwargs):
+        # endpoints are the CoreWallet keyword arguments of every node,
+        # kwargs are shared by all of them
+        self.nodes = []
+        for i, endpoint in enumerate(endpoints):
+            options = dict(kwargs)
+            options.update(endpoint)
+            name = options.get('api_url', str(i))
+            self.nodes.append(WalletNode(name, self.factory(options)))
+
+        self.primary = 0
+        self.next_reader = 0
+        self.health_interval = health_interval
+        self.last_health_check = None
+        self.lock = threading.Lock()
+
+    def factory(self, options):
+        return lambda: CoreWallet(**options)
+
+    # refreshes the health of all the nodes, moves the primary
+    # if it is not healthy anymore
+    def checkHealth(self):
+        for node in self.nodes:
+            if not node.connect():
+                node.healthy = False
+                continue
+            success, reason = node.wallet.isReady()
+            node.healthy = success
+        self.last_health_check = time.monotonic()
+        with self.lock:
+            if not self.nodes[self.primary].healthy:
+                self.failover()
+
+    def failover(self):
+        for i in range(1, len(self.nodes) + 1):
+            candidate = (self.primary + i) % len(self.nodes)
+            if self.nodes[candidate].healthy:
+                if candidate != self.primary:
+                    logger.warning('Wallet failover from %s to %s',
+                        self.nodes[self.primary].name, self.nodes[candidate].name)
+                self.primary = candidate
+                return True
+        return False
+
+    def healthCheckDue(self):
+        if self.last_health_check is None:
+            return True
+        return time.monotonic() - self.last_health_check >= self.health_interval
+
+    # the call never reached the wallet or the wallet did not answer,
+    # the reason is translated for the locale of this very call
+    def isNodeFailure(self, node, ret):
+        if not isinstance(ret, tuple) or ret[0] is not False:
+            return False
+        reason = ret[1] if len(ret) > 1 else None
+        return reason == t(WALLET_UNAVAILABLE) or not node.wallet.isAvailable()
+
+    # round robin over the healthy nodes, the next one is tried
+    # if the node fails to answer
+    def callAny(self, method, *args, **kwargs):
+        with self.lock:
+            start = self.next_reader
+            self.next_reader = (self.next_reader + 1) % len(self.nodes)
+        ret = None
+        for i in range(len(self.nodes)):
+            node = self.nodes[(start + i) % len(self.nodes)]
+            if not node.healthy or node.wallet is None:
+                continue
+            ret = getattr(node.wallet, method)(*args, **kwargs)
+            if not self.isNodeFailure(node, ret):
+                return ret
+            node.healthy = False
+        if ret is None:
+            return self.callPrimary(method, *args, **kwargs)
+        return ret
+
+    # state-changing calls, retried on the new primary only if
+    # they were rejected before reaching the wallet
+    def callPrimary(self, method, *args, **kwargs):
+        with self.lock:
+            node = self.nodes[self.primary]
+        if not node.connect():
+            node.healthy = False
+            with self.lock:
+                self.failover()
+                node = self.nodes[self.primary]
+            if not node.connect():
+                return unavailable(method)
+        # with the breaker open the call is rejected before reaching
+        # the wallet, a timed out one may have reached it
+        rejected = not node.wallet.isAvailable()
+        ret = getattr(node.wallet, method)(*args, **kwargs)
+        if not self.isNodeFailure(node, ret):
+            return ret
+        node.healthy = False
+        with self.lock:
+            moved = self.failover() and self.nodes[self.primary] is not node
+            if moved:
+                node = self.nodes[self.primary]
+        if moved and rejected:
+            return getattr(node.wallet, method)(*args, **kwargs)
+        return ret
+
+    # every node scans its own copy of the wallet
+    def setSyncStatePath(self, path):
+        for i, node in enumerate(self.nodes):
+            node.sync_state_path = '{}.{}'.format(path, i)
+            if node.wallet is not None:
+                node.wallet.setSyncStatePath(node.sync_state_path)
+
+    def isAvailable(self):
+        for node in self.nodes:
+            if node.wallet is not None and node.healthy and node.wallet.isAvailable():
+                return True
+        # let the next call probe them
+        return self.healthCheckDue()
+
+    # connects all the nodes and picks the primary
+    # returns success (bool) reason (str)
+    def warmup(self):
+        self.checkHealth()
+        return self.isReady()
+
+    # called regularly by the readiness job, doubles as the health check
+    def isReady(self):
+        if self.healthCheckDue():
+            self.checkHealth()
+        node = self.nodes[self.primary]
+        if not node.healthy:
+            return False, None
+        return True, None
+
+    def decodeSlatepack(self, slatepack):
+        return self.callAny('decodeSlatepack', slatepack)
+
+    def sync(self, full=False):
+        return self.callPrimary('sync', full=full)
+
+    def send(self, amount, slatepack_address=None):
+        return self.callPrimary('send', amount, slatepack_address=slatepack_address)
+
+    def releaseLock(self, tx_id):
+        return self.callPrimary('releaseLock', tx_id)
+
+    def invoice(self, amount, slatepack_address=None):
+        return self.callPrimary('invoice', amount, slatepack_address=slatepack_address)
+
+    def receive(self, slatepack, slate=None):
+        return self.callPrimary('receive', slatepack, slate=slate)
+
+    def finalize(self, slatepack, slate=None):
+        return self.callPrimary('finalize', slatepack, slate=slate)
+
+    # the transaction log differs between the nodes
+    def retrieveTxs(self, tx_ids=None):
+        return self.callPrimary('retrieveTxs', tx_ids=tx_ids)
+
+    # batched on the primary, call by call with the failover
+    # if the primary did not answer
+    def batch(self, calls):
+        with self.lock:
+            node = self.nodes[self.primary]
+        if node.healthy and node.wallet is not None:
+            results = node.wallet.batch(calls)
+            failed = [ret for ret in results if self.isNodeFailure(node, ret)]
+            if len(failed) == 0:
+                return results
+        return WalletProvider.batch(self, calls)
@@ -0,0 +1,610 @@
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from coincurve import PrivateKey, PublicKey
+from grinmw.wallet_v3 import encrypt, decrypt
+
+from slateboy.slatepack import parseSlatepack, encodeSlatepack
+
+
+# stand-in for the grin-wallet Owner API v3 and Foreign API v2, speaks
+# just enough of the protocol (including the init_secure_api encryption)
+# for the CoreWallet to run the whole deposit and withdrawal pipeline
+# against it, used by the tests and for load testing on a laptop
+#
+#   python -m slateboy.fake_wallet --latency finalize_tx=0.2 --error scan=busy
+
+FAKE_FEE = 8000000
+
+# the fake wallet starts with a single 1000 GRIN output by default
+DEFAULT_OUTPUTS = [1000000000000]
+
+# JSON-RPC error code used by the grin-wallet for the generic errors
+ERROR_CODE = -32099
+
+
+class FakeWalletError(Exception):
+    pass
+
+
+# in-memory wallet state, slate ids and slatepacks are deterministic
+# for the given seed so the runs can be compared
+class FakeWalletState:
+    def __init__(self, seed=0, height=1000, confirm_on_post=True,
+                 outputs=DEFAULT_OUTPUTS):
+        self.seed = seed
+        self.height = height
+        self.confirm_on_post = confirm_on_post
+        self.counter = 0
+        self.txs = {}
+
+        # slate_id -> inputs picked by init_send_tx, they stay unspent
+        # until tx_lock_outputs like in the grin-wallet
+        self.inputs = {}
+        self.lock = threading.Lock()
+
+        # mature outputs the wallet starts with
+        self.outputs = []
+        for value in outputs:
+            self.addOutput(value, 'Unspent', None, height=1)
+
+    def addOutput(self, value, status, slate_id, height=None):
+        if height is None:
+            height = self.height
+        self.outputs.append({
+            'commit': '09{:064x}'.format(len(self.outputs)),
+            'value': int(value),
+            'status': status,
+            'height': height,
+            'tx_slate_id': slate_id
+        })
+
+    # smallest first selection of the unspent outputs, or all of them
+    def selectOutputs(self, amount, use_all, max_outputs):
+        unspent = [o for o in self.outputs if o['status'] == 'Unspent']
+        unspent.sort(key=lambda o: o['value'])
+        if use_all:
+            selected = unspent
+        else:
+            selected = []
+            total = 0
+            for output in unspent:
+                if total >= amount:
+                    break
+                selected.append(output)
+                total += output['value']
+        if sum(o['value'] for o in selected) < amount:
+            raise FakeWalletError('Not enough funds')
+        if max_outputs is not None and len(selected) > max_outputs:
+            raise FakeWalletError('Too many inputs')
+        return selected
+
+    # the inputs of the confirmed sends are gone, the change is spendable
+    def confirmOutputs(self, slate_id):
+        for output in self.outputs:
+            if output['tx_slate_id'] != slate_id:
+                continue
+            if output['status'] == 'Locked':
+                output['status'] = 'Spent'
+            elif output['status'] == 'Unconfirmed':
+                output['status'] = 'Unspent'
+                output['height'] = self.height
+
+    def nextSlateId(self):
+        self.counter += 1
+        return str(uuid.UUID(int=(self.seed << 64) | self.counter))
+
+    def slate(self, slate_id, sta, amount):
+        return {
+            'ver': '4:3',
+            'id': slate_id,
+            'sta': sta,
+            'amt': str(amount),
+            'fee': str(FAKE_FEE)
+        }
+
+    def logTx(self, slate_id, tx_type, credited=0, debited=0):
+        self.txs[slate_id] = {
+            'id': len(self.txs),
+            'tx_slate_id': slate_id,
+            'tx_type': tx_type,
+            'creation_ts': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'confirmed': False,
+            'amount_credited': str(credited),
+            'amount_debited': str(debited),
+            'fee': str(FAKE_FEE),
+            'kernel_excess': None
+        }
+
+    def tx(self, slate_id):
+        tx = self.txs.get(slate_id, None)
+        if tx is None:
+            raise FakeWalletError('Transaction {} not found'.format(slate_id))
+        return tx
+
+    def mine(self, blocks=1):
+        with self.lock:
+            self.height += blocks
+            for tx in self.txs.values():
+                if tx['kernel_excess'] is not None and not tx['tx_type'].endswith('Cancelled'):
+                    tx['confirmed'] = True
+                    self.confirmOutputs(tx['tx_slate_id'])
+
+    def spendable(self):
+        return sum(o['value'] for o in self.outputs if o['status'] == 'Unspent')
+
+    #
+    # Owner API v3
+    #
+
+    def node_height(self, params):
+        return {
+            'height': str(self.height),
+            'header_hash': '00' * 32,
+            'updated_from_node': True
+        }
+
+    def retrieve_summary_info(self, params):
+        return [True, {
+            'last_confirmed_height': str(self.height),
+            'minimum_confirmations': '1',
+            'total': str(self.spendable()),
+            'amount_currently_spendable': str(self.spendable()),
+            'amount_awaiting_confirmation': '0',
+            'amount_awaiting_finalization': '0',
+            'amount_immature': '0',
+            'amount_locked': '0',
+            'amount_reverted': '0'
+        }]
+
+    def retrieve_txs(self, params):
+        txs = list(self.txs.values())
+        if params.get('tx_slate_id', None) is not None:
+            txs = [tx for tx in txs if tx['tx_slate_id'] == params['tx_slate_id']]
+        return [True, txs]
+
+    def retrieve_outputs(self, params):
+        outputs = []
+        for output in self.outputs:
+            if output['status'] == 'Spent' and not params.get('include_spent', False):
+                continue
+            outputs.append({
+                'commit': output['commit'],
+                'output': {
+                    'commit': output['commit'],
+                    'value': str(output['value']),
+                    'status': output['status'],
+                    'height': str(output['height']),
+                    'is_coinbase': False
+                }
+            })
+        return [True, outputs]
+
+    def scan(self, params):
+        return None
+
+    def init_send_tx(self, params):
+        args = params['args']
+        amount = int(args['amount'])
+        inputs = self.selectOutputs(
+            amount + FAKE_FEE,
+            args.get('selection_strategy_is_use_all', True),
+            args.get('max_outputs', None))
+        slate_id = self.nextSlateId()
+
+        # inputs locked by tx_lock_outputs, the change is split evenly
+        change = sum(o['value'] for o in inputs) - amount - FAKE_FEE
+        self.inputs[slate_id] = inputs
+        num_change_outputs = max(1, int(args.get('num_change_outputs', 1)))
+        if change > 0:
+            for i in range(num_change_outputs):
+                value = change // num_change_outputs
+                if i == 0:
+                    value += change % num_change_outputs
+                self.addOutput(value, 'Unconfirmed', slate_id)
+
+        self.logTx(slate_id, 'TxSent', credited=change, debited=change + amount + FAKE_FEE)
+        return self.slate(slate_id, 'S1', amount)
+
+    def issue_invoice_tx(self, params):
+        amount = int(params['args']['amount'])
+        slate_id = self.nextSlateId()
+        self.logTx(slate_id, 'TxReceived', credited=amount)
+        return self.slate(slate_id, 'I1', amount)
+
+    # the inputs are locked until the tx confirms or gets cancelled
+    def tx_lock_outputs(self, params):
+        slate_id = params['slate']['id']
+        self.tx(slate_id)
+        inputs = self.inputs.pop(slate_id, [])
+        for output in inputs:
+            if output['status'] != 'Unspent':
+                raise FakeWalletError('Output {} already spent or locked'.format(
+                    output['commit']))
+        for output in inputs:
+            output['status'] = 'Locked'
+            output['tx_slate_id'] = slate_id
+        return None
+
+    def finalize_tx(self, params):
+        slate = params['slate']
+        tx = self.tx(slate['id'])
+        if tx['tx_type'].endswith('Cancelled'):
+            raise FakeWalletError('Transaction {} cancelled'.format(slate['id']))
+        sta = {'S2': 'S3', 'I2': 'I3'}.get(slate.get('sta', None), None)
+        if sta is None:
+            raise FakeWalletError('Invalid slate state')
+        tx['kernel_excess'] = '08' + slate['id'].replace('-', '') * 2
+        return self.slate(slate['id'], sta, slate.get('amt', 0))
+
+    def post_tx(self, params):
+        tx = self.tx(params['slate']['id'])
+        if tx['kernel_excess'] is None:
+            raise FakeWalletError('Transaction not finalized')
+        if self.confirm_on_post:
+            tx['confirmed'] = True
+            self.confirmOutputs(tx['tx_slate_id'])
+        return None
+
+    def cancel_tx(self, params):
+        tx = self.tx(params['tx_slate_id'])
+        if tx['confirmed']:
+            raise FakeWalletError('Transaction already confirmed')
+        if not tx['tx_type'].endswith('Cancelled'):
+            tx['tx_type'] += 'Cancelled'
+        self.inputs.pop(tx['tx_slate_id'], None)
+
+        # unlock the inputs, drop the change
+        outputs = []
+        for output in self.outputs:
+            if output['tx_slate_id'] == tx['tx_slate_id']:
+                if output['status'] == 'Unconfirmed':
+                    continue
+                if output['status'] == 'Locked':
+                    output['status'] = 'Unspent'
+                    output['tx_slate_id'] = None
+            outputs.append(output)
+        self.outputs = outputs
+        return None
+
+    def create_slatepack_message(self, params):
+        slate = params['slate']
+        return encodeSlatepack(
+            slate['id'], slate['sta'],
+            amt=slate.get('amt', 0), fee=slate.get('fee', 0))
+
+    def slate_from_slatepack_message(self, params):
+        valid, reason, header = parseSlatepack(params['message'])
+        if not valid:
+            raise FakeWalletError(reason)
+        return {key: header[key] for key in ['ver', 'id', 'sta', 'amt', 'fee']}
+
+    #
+    # Foreign API v2
+    #
+
+    def receive_tx(self, params):
+        slate = params[0]
+        if slate.get('sta', None) != 'S1':
+            raise FakeWalletError('Invalid slate state')
+        amount = int(slate.get('amt', 0))
+        self.logTx(slate['id'], 'TxReceived', credited=amount)
+        return self.slate(slate['id'], 'S2', amount)
+
+    def finalize_invoice_tx(self, params):
+        return self.finalize_tx({'slate': params[0]})
+
+
+OWNER_METHODS = [
+    'node_height', 'retrieve_summary_info', 'retrieve_txs',
+    'retrieve_outputs', 'scan',
+    'init_send_tx', 'issue_invoice_tx', 'tx_lock_outputs', 'finalize_tx',
+    'post_tx', 'cancel_tx', 'create_slatepack_message',
+    'slate_from_slatepack_message']
+
+FOREIGN_METHODS = ['receive_tx', 'finalize_invoice_tx']
+
+
+class FakeWalletHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length))
+        fake = self.server.fake
+
+        # stopped wallet, kept-alive connections are dropped unanswered
+        if fake.stopped:
+            self.close_connection = True
+            return
+
+        if not fake.isAuthorized(self.headers.get('Authorization', None)):
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        response = fake.handle(self.server.api, request)
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Owner API on one port, Foreign API on the other, both served by threads
+class FakeWalletServer:
+    def __init__(self, host='127.0.0.1', owner_port=0, foreign_port=0,
+                 api_user='grin', api_password=None, wallet_password='',
+                 latency={}, errors={}, seed=0, height=1000,
+                 confirm_on_post=True, outputs=DEFAULT_OUTPUTS, batches=True):
+        self.api_user = api_user
+        self.api_password = api_password
+        self.wallet_password = wallet_password
+
+        # method -> seconds
+        self.latency = dict(latency)
+
+        # method -> [message, remaining count or None for always]
+        self.errors = {}
+        for method, message in errors.items():
+            self.setError(method, message)
+
+        # number of calls per method
+        self.calls = {}
+
+        # False answers the JSON-RPC batches with a single error
+        # like the wallets which do not take them
+        self.batches = batches
+
+        self.state = FakeWalletState(
+            seed=seed, height=height, confirm_on_post=confirm_on_post,
+            outputs=outputs)
+
+        # init_secure_api and open_wallet state
+        self.key = PrivateKey()
+        self.shared_secret = None
+        self.token = None
+        self.lock = threading.Lock()
+
+        self.owner = ThreadingHTTPServer((host, owner_port), FakeWalletHandler)
+        self.owner.fake = self
+        self.owner.api = 'owner'
+        self.foreign = ThreadingHTTPServer((host, foreign_port), FakeWalletHandler)
+        self.foreign.fake = self
+        self.foreign.api = 'foreign'
+        self.threads = []
+        self.stopped = False
+
+    @property
+    def owner_url(self):
+        host, port = self.owner.server_address[:2]
+        return 'http://{}:{}/v3/owner'.format(host, port)
+
+    @property
+    def foreign_url(self):
+        host, port = self.foreign.server_address[:2]
+        return 'http://{}:{}/v2/foreign'.format(host, port)
+
+    def start(self):
+        for server in [self.owner, self.foreign]:
+            thread = threading.Thread(
+                target=server.serve_forever, name='fake-wallet')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stopped = True
+        for server in [self.owner, self.foreign]:
+            server.shutdown()
+            server.server_close()
+        self.threads = []
+
+    def setLatency(self, method, seconds):
+        self.latency[method] = seconds
+
+    # count None fails every call until cleared
+    def setError(self, method, message, count=None):
+        self.errors[method] = [message, count]
+
+    def clearError(self, method):
+        self.errors.pop(method, None)
+
+    # forgets the session as if the grin-wallet restarted
+    def restart(self):
+        with self.lock:
+            self.shared_secret = None
+            self.token = None
+
+    def isAuthorized(self, authorization):
+        if self.api_password is None:
+            return True
+        expected = base64.b64encode('{}:{}'.format(
+            self.api_user, self.api_password).encode()).decode()
+        return authorization == 'Basic ' + expected
+
+    # returns the injected error message or None
+    def injectedError(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            error = self.errors.get(method, None)
+            if error is None:
+                return None
+            message, count = error
+            if count is not None:
+                if count <= 1:
+                    del self.errors[method]
+                else:
+                    error[1] = count - 1
+            return message
+
+    def handle(self, api, request):
+        method = request.get('method', None)
+        if api == 'owner' and method == 'init_secure_api':
+            return self.initSecureApi(request)
+        if api == 'owner' and method == 'encrypted_request_v3':
+            return self.encryptedRequest(request)
+        if api == 'foreign' and method in FOREIGN_METHODS:
+            return self.execute(request, request.get('params', []))
+        return self.error(request, 'Unknown method {}'.format(method))
+
+    def initSecureApi(self, request):
+        remote_pubkey = request['params']['ecdh_pubkey']
+        with self.lock:
+            self.shared_secret = PublicKey(bytes.fromhex(remote_pubkey)).multiply(
+                self.key.secret).format().hex()[2:]
+        return self.ok(request, self.key.public_key.format().hex())
+
+    def encryptedRequest(self, request):
+        shared_secret = self.shared_secret
+        if shared_secret is None:
+            return self.error(request, 'Encryption error: no shared key')
+        try:
+            nonce = bytes.fromhex(request['params']['nonce'])
+            inner = json.loads(decrypt(
+                shared_secret, request['params']['body_enc'], nonce))
+        except Exception:
+            return self.error(request, 'Encryption error: unable to decrypt')
+
+        with self.lock:
+            self.calls['encrypted_request_v3'] = \
+                self.calls.get('encrypted_request_v3', 0) + 1
+
+        # JSON-RPC batch, every response is serialized before the next
+        # request can change the state
+        if isinstance(inner, list) and not self.batches:
+            response = self.error({'id': None}, 'Invalid request')
+        elif isinstance(inner, list):
+            response = [json.loads(json.dumps(self.ownerRequest(item)))
+                        for item in inner]
+        else:
+            response = self.ownerRequest(inner)
+
+        nonce = os.urandom(12)
+        return self.ok(request, {
+            'nonce': nonce.hex(),
+            'body_enc': encrypt(shared_secret, json.dumps(response), nonce)
+        })
+
+    def ownerRequest(self, request):
+        method = request.get('method', None)
+        params = request.get('params', {})
+
+        if method == 'open_wallet':
+            if params.get('password', '') != self.wallet_password:
+                return self.err(request, 'Invalid password')
+            with self.lock:
+                self.token = uuid.uuid4().hex
+            return self.ok(request, self.token)
+
+        if method == 'close_wallet':
+            with self.lock:
+                self.token = None
+            return self.ok(request, None)
+
+        if method not in OWNER_METHODS:
+            return self.error(request, 'Unknown method {}'.format(method))
+
+        if self.token is None or params.get('token', None) != self.token:
+            return self.err(request, 'Invalid token')
+
+        return self.execute(request, params)
+
+    def execute(self, request, params):
+        method = request['method']
+        time.sleep(self.latency.get(method, 0))
+
+        message = self.injectedError(method)
+        if message is not None:
+            return self.err(request, message)
+
+        try:
+            with self.state.lock:
+                result = getattr(self.state, method)(params)
+        except (FakeWalletError, KeyError, TypeError, ValueError) as e:
+            return self.err(request, str(e))
+        return self.ok(request, result)
+
+    def ok(self, request, result):
+        return {
+            'jsonrpc': '2.0',
+            'id': request.get('id', 1),
+            'result': {'Ok': result}
+        }
+
+    # the method failed, the grin-wallet answers with the Err result
+    def err(self, request, message):
+        return {
+            'jsonrpc': '2.0',
+            'id': request.get('id', 1),
+            'result': {'Err': {'GenericError': message}}
+        }
+
+    # the request itself is wrong, unknown method or broken encryption
+    def error(self, request, message):
+        return {
+            'jsonrpc': '2.0',
+            'id': request.get('id', 1),
+            'error': {'code': ERROR_CODE, 'message': message}
+        }
+
+
+# method=value command line pairs
+def parsePairs(pairs, cast=str):
+    parsed = {}
+    for pair in pairs:
+        method, value = pair.split('=', 1)
+        parsed[method] = cast(value)
+    return parsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fake grin-wallet Owner v3 and Foreign v2 API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--owner-port', type=int, default=3420)
+    parser.add_argument('--foreign-port', type=int, default=3415)
+    parser.add_argument('--api-user', default='grin')
+    parser.add_argument('--api-password', default=None)
+    parser.add_argument('--wallet-password', default='')
+    parser.add_argument('--latency', action='append', default=[],
+                        metavar='METHOD=SECONDS')
+    parser.add_argument('--error', action='append', default=[],
+                        metavar='METHOD=MESSAGE')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = FakeWalletServer(
+        host=args.host, owner_port=args.owner_port,
+        foreign_port=args.foreign_port, api_user=args.api_user,
+        api_password=args.api_password,
+        wallet_password=args.wallet_password,
+        latency=parsePairs(args.latency, cast=float),
+        errors=parsePairs(args.error), seed=args.seed)
+    server.start()
+    print('Owner API at {}'.format(server.owner_url))
+    print('Foreign API at {}'.format(server.foreign_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
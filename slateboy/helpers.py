@@ -1,4 +1,12 @@
+import asyncio
+import threading
+
 from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+
+# nanogrin in one GRIN
+NANOGRIN = 1000000000
 
 
 def getNow():
@@ -8,19 +16,92 @@ def getNow():
     return cur_ts
 
 
-def extractIDs(update):
+# the personality and the wallet providers talk GRIN, the Owner API
+# and the slates nanogrin, the GRIN amount is None unless it is
+# a whole number of nanogrin
+def toNanogrin(amount):
     try:
-        chat_id = update.message.chat.id
-        user_id = update.message.from_user.is_bot
-    except:
-        # if update.callback_query
-        chat_id = update.effective_chat.id
-        user_id = update.effective_user.id
-    return chat_id, user_id
+        nanogrin = Decimal(str(amount)) * NANOGRIN
+    except InvalidOperation:
+        return None
+    if not nanogrin.is_finite() or nanogrin != nanogrin.to_integral_value():
+        return None
+    return int(nanogrin)
+
+
+def toGrin(nanogrin):
+    return int(nanogrin) / NANOGRIN
+
+
+# ids and flags of the update looked up once, the decorators build it
+# and hand it down to the handler as the request keyword argument
+class RequestContext:
+    __slots__ = (
+        'chat_id', 'user_id', 'is_bot', 'chat_type', 'requested_amount')
+
+    def __init__(self, update):
+        # the callback queries have no message of their own
+        message = update.message
+        if message is not None:
+            chat = message.chat
+            user = message.from_user
+        else:
+            chat = update.effective_chat
+            user = update.effective_user
+
+        self.chat_id = None
+        self.chat_type = None
+        if chat is not None:
+            self.chat_id = chat.id
+            self.chat_type = chat.type
+
+        self.user_id = None
+        self.is_bot = False
+        if user is not None:
+            self.user_id = user.id
+            self.is_bot = user.is_bot
+
+        # set by the parseRequestedAmountArgument decorator
+        self.requested_amount = None
+
+
+# the request of the decorated call, built by the first decorator
+def getRequest(update, kwargs):
+    request = kwargs.get('request', None)
+    if request is None:
+        request = RequestContext(update)
+        kwargs['request'] = request
+    return request
+
+
+def extractIDs(update):
+    request = RequestContext(update)
+    return request.chat_id, request.user_id
 
 
 def extractIsBot(update):
-    try:
-        return update.message.from_user.is_bot
-    except:
-        return update.effective_user.is_bot
+    return RequestContext(update).is_bot
+
+
+# asyncio event loop running in a background thread, lets the synchronous
+# dispatcher await coroutines of the asynchronous providers, the calling
+# thread still waits for the result
+class EventLoopThread:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name='slateboy-loop')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, coroutine, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        return future.result(timeout)
+
+    # closed loop, later runs raise RuntimeError instead of hanging
+    def stop(self):
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
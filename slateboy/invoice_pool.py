@@ -0,0 +1,120 @@
+import threading
+
+from collections import deque
+
+from slateboy.helpers import getNow
+
+
+# keeps a few pre-issued invoices for the common deposit amounts
+# so the /deposit command can reply without waiting for the wallet
+#
+# the invoices stay open in the wallet across restarts, the state dict
+# (bot_data[namespace]['invoice_pool'] in SlateBoy) keeps a copy of the
+# pool so they are served or cancelled after the restart
+class InvoicePool:
+    def __init__(self, buckets, size=3, max_age=86400, state=None):
+        self.size = size
+        self.max_age = max_age
+
+        # amount -> deque of (slatepack, tx_id, issued_ts)
+        self.pool = {}
+        for amount in buckets:
+            self.pool[amount] = deque()
+
+        # tx_ids of the invoices waiting to be cancelled
+        self.expired = []
+
+        if state is None:
+            state = {}
+        self.state = state
+
+        self.lock = threading.Lock()
+        self.restore()
+
+    # invoices issued before the restart, those of the amounts
+    # no longer in the buckets are cancelled by the next expire
+    def restore(self):
+        with self.lock:
+            for amount, slatepack, tx_id, ts in self.state.get('invoices', []):
+                if amount in self.pool:
+                    self.pool[amount].append((slatepack, tx_id, ts))
+                else:
+                    self.expired.append(tx_id)
+            self.expired += self.state.get('expired', [])
+            self.save()
+
+    # called with the lock held
+    def save(self):
+        self.state['invoices'] = [
+            [amount, slatepack, tx_id, ts]
+            for amount, invoices in self.pool.items()
+            for slatepack, tx_id, ts in invoices]
+        self.state['expired'] = list(self.expired)
+
+    def buckets(self):
+        return list(self.pool.keys())
+
+    def available(self, amount):
+        with self.lock:
+            return len(self.pool.get(amount, []))
+
+    # returns slatepack (str) tx_id (str), None if there is no
+    # ready invoice for the requested amount
+    def take(self, amount):
+        now = getNow()
+        with self.lock:
+            invoices = self.pool.get(amount, None)
+            while invoices:
+                slatepack, tx_id, ts = invoices.popleft()
+                if now - ts < self.max_age:
+                    self.save()
+                    return slatepack, tx_id
+                self.expired.append(tx_id)
+            self.save()
+        return None, None
+
+    # issues the missing invoices using the provided function
+    # invoice(amount) -> success (bool) reason (str) slatepack (str) tx_id (str)
+    # returns the number of issued invoices
+    def topUp(self, invoice):
+        issued = 0
+        for amount in self.buckets():
+            missing = self.size - self.available(amount)
+            for i in range(missing):
+                success, reason, slatepack, tx_id = invoice(amount)
+                if not success:
+                    return issued
+                with self.lock:
+                    self.pool[amount].append((slatepack, tx_id, getNow()))
+                    self.save()
+                issued += 1
+        return issued
+
+    # moves the stale invoices out of the pool and cancels them in bulk
+    # using the provided function releaseLock(tx_id) -> success (bool) reason (str)
+    # returns the number of cancelled invoices
+    def expire(self, releaseLock):
+        now = getNow()
+        with self.lock:
+            for amount, invoices in self.pool.items():
+                fresh = deque()
+                for slatepack, tx_id, ts in invoices:
+                    if now - ts < self.max_age:
+                        fresh.append((slatepack, tx_id, ts))
+                    else:
+                        self.expired.append(tx_id)
+                self.pool[amount] = fresh
+            self.save()
+            expired = list(self.expired)
+
+        # the failed ones are kept for the next round
+        cancelled = set()
+        for tx_id in expired:
+            success, reason = releaseLock(tx_id)
+            if success:
+                cancelled.add(tx_id)
+        with self.lock:
+            self.expired = [
+                tx_id for tx_id in self.expired if tx_id not in cancelled]
+            self.save()
+        return len(cancelled)
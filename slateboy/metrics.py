@@ -0,0 +1,183 @@
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# latency histograms of the handlers, the decorator stages and the wallet
+# calls, exposed in the Prometheus text format and summarized by /stats
+
+# seconds
+DEFAULT_BUCKETS = [
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0 for i in range(len(buckets) + 1)]
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    # upper bound of the bucket holding the quantile, None if empty
+    def quantile(self, q):
+        with self.lock:
+            if self.count == 0:
+                return None
+            target = q * self.count
+            cumulative = 0
+            for i, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= target:
+                    break
+        if i < len(self.buckets):
+            return self.buckets[i]
+        return float('inf')
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+# returned when the metrics are disabled, costs a single attribute lookup
+class NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_TIMER = NoopTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+
+        # (name, label, value) -> Histogram
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, label, value):
+        key = (name, label, value)
+        histogram = self.histograms.get(key, None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(
+                    key, Histogram(self.buckets))
+        return histogram
+
+    # with metrics.time('slateboy_handler_seconds', 'handler', 'handlerBalance'):
+    def time(self, name, label, value):
+        if not self.enabled:
+            return NOOP_TIMER
+        return Timer(self.histogram(name, label, value))
+
+    def observe(self, name, label, value, seconds):
+        if not self.enabled:
+            return
+        self.histogram(name, label, value).observe(seconds)
+
+    # Prometheus text exposition format
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        described = set()
+        for (name, label, value), histogram in histograms:
+            if name not in described:
+                lines.append('# TYPE {} histogram'.format(name))
+                described.add(name)
+            with histogram.lock:
+                counts = list(histogram.counts)
+                count = histogram.count
+                total = histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(
+                    name, label, value, bound, cumulative))
+            lines.append('{}_bucket{{{}="{}",le="+Inf"}} {}'.format(
+                name, label, value, count))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(name, label, value, total))
+            lines.append('{}_count{{{}="{}"}} {}'.format(name, label, value, count))
+        return '\n'.join(lines) + '\n'
+
+    # returns [(name, value, count, average ms, p95 ms), ...]
+    def summary(self):
+        rows = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        for (name, label, value), histogram in histograms:
+            if histogram.count == 0:
+                continue
+            average = histogram.sum / histogram.count * 1000
+            p95 = histogram.quantile(0.95) * 1000
+            rows.append((name, value, histogram.count, average, p95))
+        return rows
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# local scrape endpoint, http://host:port/metrics
+class MetricsServer:
+    def __init__(self, metrics, host='127.0.0.1', port=9464):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.metrics = metrics
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/metrics'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name='slateboy-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,185 @@
+import logging
+import threading
+import contextvars
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram import Update
+from telegram.ext import Dispatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+# per-user ordering of the updates, the tasks with the same key run one
+# after another in the submitted order while the tasks of different keys
+# run in parallel on the workers
+#
+# the personalities keep the balances in context.user_data and update
+# them read-modify-write, two commands of one user may never overlap
+
+
+# key of the telegram.Update, the user or the chat for the updates
+# without a user, None if neither is known
+def updateKey(update):
+    if update is None:
+        return None
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+
+# the same for the raw JSON of the update as received by the webhook
+def updateDataKey(data):
+    for name, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from', None)
+        if isinstance(user, dict) and 'id' in user:
+            return user['id']
+        chat = value.get('chat', None)
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+class KeyedSerialExecutor:
+    def __init__(self, workers=4, max_queue=32, name='slateboy-ordered'):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=name)
+
+        # running plus waiting tasks may not exceed this limit
+        self.slots = threading.BoundedSemaphore(workers + max_queue)
+
+        # key -> deque of the waiting tasks, a key is in the dict
+        # while one of its tasks is running or waiting
+        self.lock = threading.Lock()
+        self.queues = {}
+
+        # accepted tasks not finished yet
+        self.pending = 0
+        self.idle = threading.Condition(self.lock)
+
+    # tasks without a key are not ordered
+    # returns True if the task got accepted, False if the queue is full
+    def submit(self, key, function, *args, **kwargs):
+        if not self.slots.acquire(blocking=False):
+            return False
+        if key is None:
+            key = object()
+
+        # the task runs in the context of the submitter,
+        # the locale of the update goes along
+        task = (contextvars.copy_context(), function, args, kwargs)
+        with self.lock:
+            self.pending += 1
+            if key in self.queues:
+                # runs once the previous tasks of the key are done
+                self.queues[key].append(task)
+                return True
+            self.queues[key] = deque([task])
+        try:
+            self.executor.submit(self.drain, key)
+        except RuntimeError:
+            # already shut down
+            with self.lock:
+                del self.queues[key]
+                self.finished()
+            self.slots.release()
+            return False
+        return True
+
+    # runs the oldest task of the key, the next one of the same key goes
+    # to the back of the executor queue so the other keys get their turn
+    def drain(self, key):
+        with self.lock:
+            context, function, args, kwargs = self.queues[key][0]
+        try:
+            context.run(function, *args, **kwargs)
+        except Exception:
+            logger.exception('Task %s failed', getattr(function, '__name__', function))
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.queues[key].popleft()
+                self.finished()
+                more = len(self.queues[key]) > 0
+                if not more:
+                    del self.queues[key]
+            if more:
+                self.resubmit(key)
+
+    def resubmit(self, key):
+        try:
+            self.executor.submit(self.drain, key)
+        except RuntimeError:
+            # shutting down, finish the remaining tasks of the key here
+            self.drain(key)
+
+    # called with the lock held
+    def finished(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.idle.notify_all()
+
+    # blocks until all the accepted tasks are done
+    # returns False on timeout
+    def join(self, timeout=None):
+        with self.lock:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def stop(self, wait=True):
+        if wait:
+            self.join()
+        self.executor.shutdown(wait=wait)
+
+
+# the handlers running inline and the jobs touching the data of one user
+# hold its lock, the locks of the keys nobody waits for are dropped
+class KeyedThreadLocks:
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def run(self, key, function, *args, **kwargs):
+        if key is None:
+            return function(*args, **kwargs)
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.RLock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+
+
+# dispatcher handing every update over to submit(key, function, *args)
+# -> accepted (bool) under the key of its user, the handlers of one user
+# never overlap with each other nor with the jobs submitted under the
+# same key, rejected(update) is called if the update was not accepted
+class OrderedDispatcher(Dispatcher):
+    def __init__(self, *args, submit=None, rejected=None, **kwargs):
+        Dispatcher.__init__(self, *args, **kwargs)
+        self.submit = submit
+        self.rejected = rejected
+
+    def process_update(self, update):
+        # the errors and the other objects put in the queue are not ordered
+        if self.submit is None or not isinstance(update, Update):
+            return Dispatcher.process_update(self, update)
+        accepted = self.submit(
+            updateKey(update), Dispatcher.process_update, self, update)
+        if not accepted and self.rejected is not None:
+            self.rejected(update)
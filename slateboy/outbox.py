@@ -0,0 +1,246 @@
+import time
+import logging
+import threading
+
+from collections import deque
+
+from telegram.error import RetryAfter
+
+
+logger = logging.getLogger(__name__)
+
+
+# outbound message queue keeping the bot under the Telegram flood limits,
+# about 30 messages a second overall, one a second per chat and 20 a
+# minute per group, every message waits for a token of the global and
+# of its chat bucket
+#
+# consecutive plain text messages to the same chat are merged into one
+# if they fit the message size limit, the messages with markup or any
+# other option are sent on their own
+
+# characters
+MAX_MESSAGE_LENGTH = 4096
+
+SEPARATOR = '\n\n'
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # returns seconds until a token is available
+    def delay(self, now):
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+
+class OutboxMessage:
+    def __init__(self, chat_id, text, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.queued = time.monotonic()
+        self.retries = 0
+
+    # merged with the next message if plain text and short enough
+    def canMerge(self, other, max_length):
+        if len(self.kwargs) > 0 or len(other.kwargs) > 0:
+            return False
+        return len(self.text) + len(SEPARATOR) + len(other.text) <= max_length
+
+
+class Outbox:
+    def __init__(self, bot, rate=30, burst=30, chat_rate=1, chat_burst=3,
+                 group_rate=20 / 60, coalesce=True, linger=0.05,
+                 max_length=MAX_MESSAGE_LENGTH, max_queue=10000,
+                 max_retries=3):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.coalesce = coalesce
+        self.max_length = max_length
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+
+        # seconds a message waits for the following ones to be merged in
+        self.linger = linger
+
+        # chat_id -> deque of OutboxMessage, chats in the order
+        # they got their first pending message
+        self.chats = {}
+        self.buckets = {}
+        self.size = 0
+        self.sending = 0
+        self.condition = threading.Condition()
+
+        # nothing is sent before, set by the retry after responses
+        self.paused_until = 0
+
+        self.running = False
+        self.thread = None
+
+    # queues the message, keyword arguments are those of send_message
+    # returns True if queued, False if the queue is full
+    def send(self, chat_id, text, **kwargs):
+        with self.condition:
+            if self.size >= self.max_queue:
+                logger.warning('Outbox is full, message to %s dropped', chat_id)
+                return False
+            self.chats.setdefault(chat_id, deque()).append(
+                OutboxMessage(chat_id, text, kwargs))
+            self.size += 1
+            self.condition.notify_all()
+        return True
+
+    def chatBucket(self, chat_id):
+        bucket = self.buckets.get(chat_id, None)
+        if bucket is None:
+            # groups and channels have negative ids
+            rate = self.chat_rate
+            if isinstance(chat_id, int) and chat_id < 0:
+                rate = self.group_rate
+            bucket = TokenBucket(rate, self.chat_burst)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    # called with the condition held
+    # returns message (OutboxMessage) or None, seconds to wait
+    def next(self, now):
+        wait = self.paused_until - now
+        if wait > 0:
+            return None, wait
+        wait = self.bucket.delay(now)
+        if wait > 0:
+            return None, wait
+
+        wait = None
+        for chat_id, messages in self.chats.items():
+            chat_wait = max(
+                self.chatBucket(chat_id).delay(now),
+                messages[0].queued + self.linger - now)
+            if chat_wait <= 0:
+                return self.take(chat_id, now), 0
+            if wait is None or chat_wait < wait:
+                wait = chat_wait
+        return None, wait
+
+    # called with the condition held
+    def take(self, chat_id, now):
+        messages = self.chats[chat_id]
+        message = messages.popleft()
+        self.size -= 1
+        while self.coalesce and len(messages) > 0 and \
+                message.canMerge(messages[0], self.max_length):
+            following = messages.popleft()
+            self.size -= 1
+            message.text = message.text + SEPARATOR + following.text
+        # the chat goes to the back so the others get their turn
+        del self.chats[chat_id]
+        if len(messages) > 0:
+            self.chats[chat_id] = messages
+
+        self.bucket.take(now)
+        self.chatBucket(chat_id).take(now)
+        self.sending += 1
+        return message
+
+    # puts the message back in front of its chat
+    def retry(self, message):
+        with self.condition:
+            self.chats.setdefault(message.chat_id, deque()).appendleft(message)
+            # keep the retried chat first
+            self.chats = {message.chat_id: self.chats.pop(message.chat_id), **self.chats}
+            self.size += 1
+            self.condition.notify_all()
+
+    def deliver(self, message):
+        try:
+            self.bot.send_message(
+                chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            # flood limit hit anyway, everything waits as asked
+            with self.condition:
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + e.retry_after)
+            message.retries += 1
+            if message.retries > self.max_retries:
+                logger.error('Message to %s dropped after %d retries',
+                             message.chat_id, self.max_retries)
+                return
+            self.retry(message)
+        except Exception:
+            # blocked by the user and alike, retrying would not help
+            logger.exception('Failed to send a message to %s', message.chat_id)
+
+    def work(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.running and self.size == 0:
+                        return
+                    message, wait = self.next(time.monotonic())
+                    if message is not None:
+                        break
+                    self.condition.wait(wait)
+            try:
+                self.deliver(message)
+            finally:
+                with self.condition:
+                    self.sending -= 1
+                    self.condition.notify_all()
+
+    # blocks until all the queued messages are sent,
+    # returns False on timeout
+    def flush(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.size == 0 and self.sending == 0, timeout)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.work, name='slateboy-outbox')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    # the queued messages are still sent
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+# stands in for the bot of the dispatcher, the messages go
+# through the outbox and everything else to the bot
+class OutboxBot:
+    def __init__(self, bot, outbox):
+        self.bot = bot
+        self.outbox = outbox
+
+    # returns None instead of the sent message, it is not sent yet
+    def send_message(self, chat_id, text, **kwargs):
+        self.outbox.send(chat_id, text, **kwargs)
+        return None
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
@@ -0,0 +1,125 @@
+import threading
+
+
+# spendable outputs are what limits the withdrawals in flight, every
+# withdrawal locks its inputs until it confirms, the manager keeps about
+# target_outputs of them around by splitting the change of the withdrawals
+# and plans each send so that it locks as few outputs as possible
+#
+# the Owner API does not let us pick the inputs directly, the plan mirrors
+# the wallet's "smallest" selection strategy and limits it with max_outputs
+
+OUTPUT_UNSPENT = 'Unspent'
+OUTPUT_LOCKED = 'Locked'
+OUTPUT_UNCONFIRMED = 'Unconfirmed'
+
+
+def outputValue(output):
+    return int(output.get('output', output).get('value', 0))
+
+
+def outputStatus(output):
+    return output.get('output', output).get('status', None)
+
+
+def outputHeight(output):
+    return int(output.get('output', output).get('height', 0))
+
+
+def isNanogrin(amount):
+    return isinstance(amount, int) and not isinstance(amount, bool)
+
+
+class OutputManager:
+    def __init__(self, target_outputs=8, max_change_outputs=4,
+                 min_change_value=100000000, fee=8000000):
+        self.target_outputs = target_outputs
+        self.max_change_outputs = max_change_outputs
+
+        # no point in splitting the change into dust
+        self.min_change_value = min_change_value
+
+        # rough fee estimate used when planning
+        self.fee = fee
+
+        # values of the spendable, locked and pending change outputs
+        self.spendable = []
+        self.locked = 0
+        self.unconfirmed = 0
+
+        # refresh and send have to happen together, otherwise two
+        # withdrawals plan with the same free outputs
+        self.lock = threading.Lock()
+
+    # takes the Owner API retrieve_outputs entries, the outputs with fewer
+    # than minimum_confirmations at the given height are not spendable yet
+    def update(self, outputs, height=None, minimum_confirmations=1):
+        spendable = []
+        locked = 0
+        unconfirmed = 0
+        for output in outputs:
+            status = outputStatus(output)
+            if status == OUTPUT_UNSPENT:
+                if height is not None and height - outputHeight(output) + 1 < minimum_confirmations:
+                    unconfirmed += 1
+                    continue
+                spendable.append(outputValue(output))
+            elif status == OUTPUT_LOCKED:
+                locked += 1
+            elif status == OUTPUT_UNCONFIRMED:
+                unconfirmed += 1
+        spendable.sort()
+        self.spendable = spendable
+        self.locked = locked
+        self.unconfirmed = unconfirmed
+
+    # amount in nanogrin, the fractions are not truncated but refused
+    # returns success (bool) reason (str) max_outputs (int) num_change_outputs (int)
+    def plan(self, amount):
+        if not isNanogrin(amount):
+            success = False
+            reason = 'Amount {} is not a whole number of nanogrin'.format(amount)
+            return success, reason, None, None
+        needed = amount + self.fee
+
+        # smallest first, just like the wallet
+        inputs = []
+        total = 0
+        for value in self.spendable:
+            if total >= needed:
+                break
+            inputs.append(value)
+            total += value
+        if total < needed:
+            success = False
+            reason = 'Not enough spendable outputs, {} locked and {} awaiting confirmation'.format(
+                self.locked, self.unconfirmed)
+            return success, reason, None, None
+
+        # top the free outputs back up to the target with the change
+        free_after = len(self.spendable) - len(inputs)
+        num_change_outputs = self.target_outputs - free_after
+        num_change_outputs = min(num_change_outputs, self.max_change_outputs)
+        num_change_outputs = min(
+            num_change_outputs, (total - needed) // max(1, self.min_change_value))
+        num_change_outputs = max(1, num_change_outputs)
+
+        success = True
+        reason = None
+        return success, reason, len(inputs), num_change_outputs
+
+    # number of withdrawals of the given amount that can be in flight
+    # with the current spendable outputs
+    def capacity(self, amount):
+        if not isNanogrin(amount):
+            raise ValueError(
+                'Amount {} is not a whole number of nanogrin'.format(amount))
+        needed = amount + self.fee
+        capacity = 0
+        total = 0
+        for value in self.spendable:
+            total += value
+            if total >= needed:
+                capacity += 1
+                total = 0
+        return capacity
@@ -28,6 +28,12 @@ class BlankPersonality:
     def canDeposit(self, update, context, amount):
         return True, None, True, None
 
+    # amounts for which SlateBoy keeps pre-issued invoices
+    # ready for the /deposit command, empty list disables the pool
+    # returns [amount, ...]
+    def invoicePoolBuckets(self):
+        return []
+
     # puts amount as awaiting_finalization balance
     # (bool, str | None, str | None)
     # str is the formatted message to the user
@@ -55,7 +61,7 @@ class BlankPersonality:
 
     # is called if user does not "pay" on time
     # removes amount from awaiting_finalization balance
-    def cancelDeposit(self, context, amount, tx_id, update=None):
+    def cancelDepositTx(self, context, amount, tx_id, update=None):
         raise Exception('Unimplemented')
 
     # withdraw behavior
@@ -63,7 +69,7 @@ class BlankPersonality:
     # (bool, str)
     # bool indicates whether user can withdraw the amount
     # str is the formatted message to the user
-    def canWithdraw(self, update, context, amount):
+    def canWithdraw(self, update, context, amount, maximum=False):
         return True, None, True, None
 
     # moves amount from spendable balance to locked balance
@@ -72,7 +78,7 @@ class BlankPersonality:
     # it can contain {slatepack} tag to put the slatepack
     # inside of it, if the tag is not included, the slatepack
     # will be sent in the separate message
-    def assignWithdrawTx(self, update, context, tx_id):
+    def assignWithdrawTx(self, update, context, amount, tx_id):
         raise Exception('Unimplemented')
 
     # return bool and reason
@@ -112,6 +118,10 @@ class BlankPersonality:
     def buttonPressed(self, update, context, data):
         return None
 
+    # whether the user may run the admin commands like /rescan
+    def isAdmin(self, update, context):
+        return False
+
     # what to do if being added to the group, should leave it?
     def shouldLeave(self, update, context):
         return False, None
@@ -200,6 +210,11 @@ class BlankPersonality:
     def registerCustomJobs(self):
         return []
 
+    # translation keys of the personality, checked at startup
+    # returns {'namespace.key': (placeholder, ...)}
+    def translationKeys(self):
+        return {}
+
     def atStart(self, context):
         return True
 
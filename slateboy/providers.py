@@ -1,12 +1,32 @@
 class WalletProvider:
+    # full - rescan the whole chain instead of continuing
+    # from the last scanned height
     # returns success (bool) reason (str)
-    def sync(self):
+    def sync(self, full=False):
         raise Exception('Unimplemented')
 
     # returns boolean
     def isReady(self):
         raise Exception('Unimplemented')
 
+    # connects ahead of the first call, runs in the background
+    # while the bot is already serving the updates
+    # returns success (bool) reason (str)
+    def warmup(self):
+        return True, None
+
+    # cheap local check without calling the wallet, False if the wallet
+    # is known to be unreachable and the calls would only time out
+    # returns boolean
+    def isAvailable(self):
+        return True
+
+    # amount in GRIN, the unit of the personality hooks
+    # file the provider keeps its sync state in across the restarts,
+    # the providers without one ignore it
+    def setSyncStatePath(self, path):
+        pass
+
     # returns slatepack, tx_id
     def send(self, amount, slatepack_address=None):
         raise Exception('Unimplemented')
@@ -15,6 +35,7 @@ class WalletProvider:
     def releaseLock(self, tx_id):
         raise Exception('Unimplemented')
 
+    # amount in GRIN like in send
     # returns success (bool) reason (str), slatepack (str) tx_id (str)
     def invoice(self, amount, slatepack_address=None):
         raise Exception('Unimplemented')
@@ -23,13 +44,86 @@ class WalletProvider:
     def decodeSlatepack(self, slatepack):
         raise Exception('Unimplemented')
 
+    # slate is the already decoded slatepack, if provided
+    # the wallet does not need to decode it again
+    # returns success (bool) reason (str), slatepack (str) tx_id (str)
+    def receive(self, slatepack, slate=None):
+        raise Exception('Unimplemented')
+
+    # slate is the already decoded slatepack, if provided
+    # the wallet does not need to decode it again
+    # returns success (bool) reason (str), tx_id (str)
+    def finalize(self, slatepack, slate=None):
+        raise Exception('Unimplemented')
+
+    # wallet transaction log entries, only those with the
+    # given slate ids if tx_ids is provided
+    # returns success (bool) reason (str) txs (list)
+    def retrieveTxs(self, tx_ids=None):
+        raise Exception('Unimplemented')
+
+    # calls are (method, args, kwargs) tuples, providers able to send
+    # several requests to the wallet at once override it
+    # returns list of the return values of the calls
+    def batch(self, calls):
+        return [getattr(self, method)(*args, **kwargs)
+                for method, args, kwargs in calls]
+
+
+# same contract as WalletProvider but every call is a coroutine,
+# SlateBoy awaits them instead of blocking a dispatcher thread
+class AsyncWalletProvider:
+    # returns success (bool) reason (str)
+    async def sync(self, full=False):
+        raise Exception('Unimplemented')
+
+    # returns boolean
+    async def isReady(self):
+        raise Exception('Unimplemented')
+
+    # returns success (bool) reason (str)
+    async def warmup(self):
+        return True, None
+
+    # not a coroutine, it never waits for the wallet
+    def isAvailable(self):
+        return True
+
+    # not a coroutine, nothing is sent to the wallet
+    def setSyncStatePath(self, path):
+        pass
+
+    # returns slatepack, tx_id
+    async def send(self, amount, slatepack_address=None):
+        raise Exception('Unimplemented')
+
+    # returns success (bool) reason (str)
+    async def releaseLock(self, tx_id):
+        raise Exception('Unimplemented')
+
     # returns success (bool) reason (str), slatepack (str) tx_id (str)
-    def receive(self, slatepack):
+    async def invoice(self, amount, slatepack_address=None):
         raise Exception('Unimplemented')
 
-    # returns success (bool) reason (str), slatepack (str)
-    def finalize(self, slatepack):
+    # returns slate (dict)
+    async def decodeSlatepack(self, slatepack):
         raise Exception('Unimplemented')
 
+    # returns success (bool) reason (str), slatepack (str) tx_id (str)
+    async def receive(self, slatepack, slate=None):
+        raise Exception('Unimplemented')
+
+    # returns success (bool) reason (str), tx_id (str)
+    async def finalize(self, slatepack, slate=None):
+        raise Exception('Unimplemented')
 
+    # wallet transaction log entries, only those with the
+    # given slate ids if tx_ids is provided
+    # returns success (bool) reason (str) txs (list)
+    async def retrieveTxs(self, tx_ids=None):
+        raise Exception('Unimplemented')
 
+    # returns list of the return values of the calls
+    async def batch(self, calls):
+        return [await getattr(self, method)(*args, **kwargs)
+                for method, args, kwargs in calls]
@@ -0,0 +1,191 @@
+import logging
+
+from slateboy.helpers import getNow, toGrin
+
+
+logger = logging.getLogger(__name__)
+
+
+TX_PENDING = 'pending'
+TX_CONFIRMED = 'confirmed'
+TX_CANCELED = 'canceled'
+TX_MISSING = 'missing'
+
+TX_DEPOSIT = 'deposit'
+TX_WITHDRAWAL = 'withdrawal'
+
+# state of the wallet transaction log entry
+def txState(tx):
+    if tx is None:
+        return TX_MISSING
+    if tx.get('tx_type', '').endswith('Cancelled'):
+        return TX_CANCELED
+    if tx.get('confirmed', False):
+        return TX_CONFIRMED
+    return TX_PENDING
+
+
+# amount of the transaction as seen by the user, in GRIN like the
+# amounts the personality assign hooks get
+def txAmount(tx):
+    credited = int(tx.get('amount_credited', 0) or 0)
+    debited = int(tx.get('amount_debited', 0) or 0)
+    fee = int(tx.get('fee', 0) or 0)
+    if tx.get('tx_type', '').startswith('TxSent'):
+        return toGrin(debited - credited - fee)
+    return toGrin(credited - debited)
+
+
+def isDeposit(tx):
+    return tx.get('tx_type', '').startswith('TxReceived')
+
+
+# drives the personality confirm and cancel hooks from the wallet
+# transaction log, only the transactions in the pending index
+# bot_data[namespace]['txs'] are looked at and only those whose state
+# changed since the previous run reach the personality
+class TxReconciler:
+    def __init__(self, walletCall, personality, namespace,
+                 max_deposit_age=86400, max_withdrawal_age=600,
+                 on_ready=None, submit=None):
+        self.walletCall = walletCall
+        self.personality = personality
+        self.namespace = namespace
+        self.max_deposit_age = max_deposit_age
+        self.max_withdrawal_age = max_withdrawal_age
+
+        # on_ready(is_ready, reason) gets the wallet readiness which
+        # is then fetched in the same batch as the transactions
+        self.on_ready = on_ready
+
+        # submit(user_id, function, *args) -> accepted (bool) runs the
+        # hooks in line with the updates of the user, they change the
+        # user's data, None calls them right away
+        self.submit = submit
+
+    # remembers the amount and the direction the assign hook got,
+    # a transaction the wallet does not know is cancelled with them
+    def assigned(self, context, tx_id, amount, kind):
+        bot_data = context.bot_data.setdefault(self.namespace, {})
+        tx_states = bot_data.setdefault('tx_states', {})
+        previous = tx_states.setdefault(tx_id, {'state': None, 'seen': getNow()})
+        previous['amount'] = amount
+        previous['kind'] = kind
+
+    # returns the number of transactions handed to the personality
+    def reconcile(self, context):
+        bot_data = context.bot_data.get(self.namespace, None)
+        if bot_data is None:
+            return 0
+        pending = bot_data.get('txs', {})
+        tx_states = bot_data.setdefault('tx_states', {})
+
+        # forget the transactions no longer pending
+        for tx_id in list(tx_states.keys()):
+            if tx_id not in pending:
+                del tx_states[tx_id]
+        if len(pending) == 0:
+            return 0
+
+        # one bulk lookup for all the pending transactions
+        success, reason, txs = self.retrieveTxs(list(pending.keys()))
+        if not success:
+            logger.warning('Failed to retrieve the transactions: %s', reason)
+            return 0
+        txs = {tx.get('tx_slate_id', None): tx for tx in txs}
+
+        now = getNow()
+        processed = 0
+        for tx_id in list(pending.keys()):
+            tx = txs.get(tx_id, None)
+            state = txState(tx)
+            previous = tx_states.get(tx_id, None)
+            if previous is None:
+                previous = {'state': None, 'seen': now}
+                tx_states[tx_id] = previous
+
+            # stale transaction nobody completed
+            if state in [TX_PENDING, TX_MISSING] and self.isExpired(tx, previous, now):
+                if tx is not None:
+                    success, reason = self.walletCall('releaseLock', tx_id)
+                    if not success:
+                        continue
+                state = TX_CANCELED
+
+            if state == previous['state']:
+                continue
+            previous['state'] = state
+
+            if state in [TX_CONFIRMED, TX_CANCELED]:
+                if self.handOver(context, pending[tx_id], tx_id, tx, state, previous):
+                    processed += 1
+                else:
+                    # let the next run retry
+                    previous['state'] = None
+        return processed
+
+    # returns True if the personality has handled or got the transition
+    def handOver(self, context, user_id, tx_id, tx, state, previous):
+        if self.submit is None:
+            return self.notify(context, user_id, tx_id, tx, state, previous)
+        return self.submit(
+            user_id, self.notify, context, user_id, tx_id, tx, state, previous)
+
+    # returns True if the personality has handled the transition
+    def notify(self, context, user_id, tx_id, tx, state, previous):
+        if self.notifyPersonality(context, user_id, tx_id, tx, state, previous):
+            return True
+        # let the next run retry
+        previous['state'] = None
+        return False
+
+    # returns success (bool) reason (str) txs (list)
+    def retrieveTxs(self, tx_ids):
+        if self.on_ready is None:
+            return self.walletCall('retrieveTxs', tx_ids=tx_ids)
+        is_ready, txs = self.walletCall('batch', [
+            ('isReady', [], {}),
+            ('retrieveTxs', [], {'tx_ids': tx_ids})])
+        self.on_ready(*is_ready)
+        return txs
+
+    def isExpired(self, tx, previous, now):
+        # finalized ones only wait for the confirmations
+        if tx is not None and tx.get('kernel_excess', None) is not None:
+            return False
+        max_age = self.max_deposit_age
+        if tx is not None and not isDeposit(tx):
+            max_age = self.max_withdrawal_age
+        if tx is None and previous.get('kind', None) == TX_WITHDRAWAL:
+            max_age = self.max_withdrawal_age
+        return now - previous['seen'] > max_age
+
+    # returns True if the personality has handled the transition
+    def notifyPersonality(self, context, user_id, tx_id, tx, state, previous):
+        # unknown to the wallet, whatever was reserved for it is released,
+        # a deposit request unless assigned as a withdrawal
+        if tx is None:
+            hook = self.personality.cancelDepositTx
+            if previous.get('kind', None) == TX_WITHDRAWAL:
+                hook = self.personality.cancelWithdrawTx
+            amount = previous.get('amount', 0)
+        elif isDeposit(tx):
+            hook = self.personality.confirmDepositTx
+            if state == TX_CANCELED:
+                hook = self.personality.cancelDepositTx
+            amount = txAmount(tx)
+        else:
+            hook = self.personality.confirmWithdrawTx
+            if state == TX_CANCELED:
+                hook = self.personality.cancelWithdrawTx
+            amount = txAmount(tx)
+
+        try:
+            success, reason, reply_text = hook(context, amount, tx_id)
+        except Exception:
+            logger.exception('Personality failed to handle tx %s', tx_id)
+            return False
+
+        if success and reply_text is not None:
+            context.bot.send_message(chat_id=user_id, text=reply_text)
+        return success
@@ -0,0 +1,214 @@
+import gzip
+import json
+import time
+import threading
+
+from slateboy.providers import WalletProvider
+
+
+# record and replay of the wallet provider calls, a real session is
+# recorded to a JSON lines log and played back offline with the original
+# or scaled timings, so the production incidents can be profiled without
+# a wallet
+#
+# every line is one call
+#   {"t": start offset, "d": duration, "m": method, "a": args, "k": kwargs,
+#    "r": return value} or "e": error instead of "r"
+# the log is gzipped if the path ends with .gz
+
+LOG_VERSION = 1
+
+# the decoded slates are derived from the slatepacks,
+# no need to store them twice
+SKIPPED_ARGUMENTS = ['slate']
+
+
+def openLog(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+# lookup key of the call, the same arguments get the same responses
+def callKey(method, args, kwargs):
+    return json.dumps([method, args, kwargs], sort_keys=True)
+
+
+# tuples are lists in JSON
+def fromJSON(value):
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+class RecordingWalletProvider(WalletProvider):
+    def __init__(self, wallet, path):
+        self.wallet = wallet
+        self.path = path
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.log = openLog(path, 'w')
+        self.write({'version': LOG_VERSION, 'started': time.time()})
+
+    def write(self, entry):
+        line = json.dumps(entry, separators=(',', ':'))
+        with self.lock:
+            self.log.write(line + '\n')
+
+    def call(self, method, *args, **kwargs):
+        started = time.monotonic()
+        entry = {
+            't': round(started - self.start, 6),
+            'm': method,
+            'a': list(args),
+            'k': {key: value for key, value in kwargs.items()
+                  if key not in SKIPPED_ARGUMENTS}
+        }
+        try:
+            ret = getattr(self.wallet, method)(*args, **kwargs)
+        except Exception as e:
+            entry['d'] = round(time.monotonic() - started, 6)
+            entry['e'] = str(e)
+            self.write(entry)
+            raise e
+        entry['d'] = round(time.monotonic() - started, 6)
+        entry['r'] = ret
+        self.write(entry)
+        return ret
+
+    def isAvailable(self):
+        return self.wallet.isAvailable()
+
+    def setSyncStatePath(self, path):
+        self.wallet.setSyncStatePath(path)
+
+    def sync(self, *args, **kwargs):
+        return self.call('sync', *args, **kwargs)
+
+    def isReady(self):
+        return self.call('isReady')
+
+    def warmup(self):
+        return self.call('warmup')
+
+    def send(self, *args, **kwargs):
+        return self.call('send', *args, **kwargs)
+
+    def releaseLock(self, tx_id):
+        return self.call('releaseLock', tx_id)
+
+    def invoice(self, *args, **kwargs):
+        return self.call('invoice', *args, **kwargs)
+
+    def decodeSlatepack(self, slatepack):
+        return self.call('decodeSlatepack', slatepack)
+
+    def receive(self, *args, **kwargs):
+        return self.call('receive', *args, **kwargs)
+
+    def finalize(self, *args, **kwargs):
+        return self.call('finalize', *args, **kwargs)
+
+    def retrieveTxs(self, *args, **kwargs):
+        return self.call('retrieveTxs', *args, **kwargs)
+
+    def batch(self, calls):
+        return self.call('batch', calls)
+
+    # flushes the log, has to be called at the end of the session
+    def close(self):
+        with self.lock:
+            self.log.close()
+
+
+# answers the calls from a recorded log, the call with the same arguments
+# gets the recorded response, if the arguments differ (for instance the
+# random tx ids of synthetic updates) the next recorded response of the
+# same method is used, the responses are cycled through in the recorded
+# order
+#
+# scale multiplies the recorded durations, 0 answers immediately
+class ReplayWalletProvider(WalletProvider):
+    def __init__(self, path, scale=1.0):
+        self.path = path
+        self.scale = scale
+        self.lock = threading.Lock()
+
+        # key -> [entry, ...] and method -> [entry, ...] in recorded order
+        self.by_key = {}
+        self.by_method = {}
+        with openLog(path, 'r') as log:
+            header = json.loads(log.readline())
+            if header.get('version', None) != LOG_VERSION:
+                raise Exception('Unsupported wallet log version {}'.format(
+                    header.get('version', None)))
+            for line in log:
+                if line.strip() == '':
+                    continue
+                entry = json.loads(line)
+                key = callKey(entry['m'], entry['a'], entry['k'])
+                self.by_key.setdefault(key, []).append(entry)
+                self.by_method.setdefault(entry['m'], []).append(entry)
+
+        # key or method -> number of the responses already replayed
+        self.cursors = {}
+
+    def pick(self, name, candidates):
+        cursor = self.cursors.get(name, 0)
+        self.cursors[name] = cursor + 1
+        return candidates[cursor % len(candidates)]
+
+    def call(self, method, *args, **kwargs):
+        kwargs = {key: value for key, value in kwargs.items()
+                  if key not in SKIPPED_ARGUMENTS}
+        key = callKey(method, list(args), kwargs)
+        with self.lock:
+            if key in self.by_key:
+                entry = self.pick(key, self.by_key[key])
+            elif method in self.by_method:
+                entry = self.pick(method, self.by_method[method])
+            else:
+                raise Exception('No recorded {} calls'.format(method))
+
+        if self.scale > 0:
+            time.sleep(entry['d'] * self.scale)
+        if 'e' in entry:
+            raise Exception(entry['e'])
+        if method == 'batch':
+            return [fromJSON(ret) for ret in entry['r']]
+        return fromJSON(entry['r'])
+
+    def sync(self, *args, **kwargs):
+        return self.call('sync', *args, **kwargs)
+
+    def isReady(self):
+        return self.call('isReady')
+
+    def warmup(self):
+        if 'warmup' not in self.by_method:
+            return True, None
+        return self.call('warmup')
+
+    def send(self, *args, **kwargs):
+        return self.call('send', *args, **kwargs)
+
+    def releaseLock(self, tx_id):
+        return self.call('releaseLock', tx_id)
+
+    def invoice(self, *args, **kwargs):
+        return self.call('invoice', *args, **kwargs)
+
+    def decodeSlatepack(self, slatepack):
+        return self.call('decodeSlatepack', slatepack)
+
+    def receive(self, *args, **kwargs):
+        return self.call('receive', *args, **kwargs)
+
+    def finalize(self, *args, **kwargs):
+        return self.call('finalize', *args, **kwargs)
+
+    def retrieveTxs(self, *args, **kwargs):
+        return self.call('retrieveTxs', *args, **kwargs)
+
+    def batch(self, calls):
+        return self.call('batch', calls)
@@ -1,18 +1,89 @@
 from __future__ import unicode_literals
 
 import re
+import os
+import time
 
 from functools import wraps
 
-from telegram.ext import Updater, Filters, CommandHandler, MessageHandler, CallbackQueryHandler
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from queue import Queue
+
+from telegram.ext import Updater, Filters, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, PicklePersistence, JobQueue, ExtBot
+from telegram.utils.request import Request
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+
+from slateboy.helpers import RequestContext, getRequest, EventLoopThread, toGrin
+from slateboy.providers import AsyncWalletProvider
+from slateboy.invoice_pool import InvoicePool
+from slateboy.slates import DecodedSlate, SlateCache
+from slateboy.slatepack import parseSlatepack
+from slateboy.reconciler import TxReconciler, TX_DEPOSIT, TX_WITHDRAWAL
+from slateboy.workers import WalletWorkerPool
+from slateboy.metrics import Metrics, MetricsServer
+from slateboy.webhook import WebhookServer
+from slateboy.ordering import updateDataKey, KeyedThreadLocks, OrderedDispatcher
+from slateboy.outbox import Outbox, OutboxBot
+from slateboy.translations import Translations, t, setLocale
+
+
+# translation keys of SlateBoy and their placeholders,
+# checked against the translations at startup
+TRANSLATION_KEYS = {
+    'slateboy.eula_approve': (),
+    'slateboy.eula_deny': (),
+    'slateboy.msg_eula_info': (),
+    'slateboy.msg_generic_ignored_unknown': (),
+    'slateboy.msg_callback_query_ignored_unknown': (),
+    'slateboy.msg_balance_ignored_unknown': (),
+    'slateboy.msg_balance': (
+        'spendable', 'awaiting_confirmation', 'awaiting_finalization', 'locked'),
+    'slateboy.msg_deposit_ignored_unknown': (),
+    'slateboy.msg_deposit_missing_amount': (),
+    'slateboy.msg_deposit_invalid_amount': ('0',),
+    'slateboy.msg_deposit_rejected_unknown': (),
+    'slateboy.msg_deposit_rejected_known': ('0', '1'),
+    'slateboy.msg_deposit_instructions': (),
+    'slateboy.msg_deposit_slatepack_formatting': ('slatepack',),
+    'slateboy.msg_deposit_srs_instructions': (),
+    'slateboy.msg_deposit_srs_slatepack_formatting': ('slatepack',),
+    'slateboy.msg_deposit_finalized': (),
+    'slateboy.msg_s2_deposit_rejected_unknown': (),
+    'slateboy.msg_withdraw_ignored_unknown': (),
+    'slateboy.msg_withdraw_missing_amount': (),
+    'slateboy.msg_withdraw_invalid_amount': ('0',),
+    'slateboy.msg_withdraw_rejected_unknown': (),
+    'slateboy.msg_withdraw_rejected_known': ('0', '1'),
+    'slateboy.msg_withdraw_instructions': (),
+    'slateboy.msg_withdraw_slatepack_formatting': ('slatepack',),
+    'slateboy.msg_withdraw_finalized': (),
+    'slateboy.msg_i2_withdraw_rejected_unknown': (),
+    'slateboy.msg_invalid_slatepack': (),
+    'slateboy.msg_ignoring_invoices': (),
+    'slateboy.msg_wallet_not_ready': (),
+    'slateboy.msg_wallet_busy': (),
+    'slateboy.msg_wallet_unavailable': (),
+    'slateboy.msg_wallet_starting': (),
+    'slateboy.msg_admin_only': (),
+    'slateboy.msg_rescan_started': (),
+    'slateboy.msg_rescan_finished': (),
+    'slateboy.msg_rescan_failed': (),
+    'slateboy.msg_stats_disabled': (),
+    'slateboy.msg_stats_header': (),
+    'slateboy.msg_stats_line': ('name', 'count', 'average', 'p95'),
+}
 
-from i18n.translator import t
 
-from slateboy.helpers import extractIDs
+# just bunch of wrappers to avoid repeating code
 
 
-# just bunch of wrappers to avoid repeating code
+# latency of the whole handler
+def timeHandler(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        self = args[0]
+        with self.metrics.time('slateboy_handler_seconds', 'handler', func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
 
 
 def preCommand(func):
@@ -23,11 +94,13 @@ def preCommand(func):
         update = args[1]
         context = args[2]
 
-        # get the user_id
-        chat_id, user_id = extractIDs(update)
+        # built once per update
+        request = getRequest(update, kwargs)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # pre-command callback
-        self.personality.atCommand(context, user_id)
+        with self.metrics.time('slateboy_stage_seconds', 'stage', 'preCommand'):
+            self.personality.atCommand(context, user_id)
 
         # proceed
         return func(*args, **kwargs)
@@ -41,13 +114,23 @@ def checkWallet(func):
         update = args[1]
         context = args[2]
 
-        # get the user_id
-        chat_id, user_id = extractIDs(update)
+        # built once per update
+        request = getRequest(update, kwargs)
+        chat_id, user_id = request.chat_id, request.user_id
+
+        # wallet known to be down, reject right away
+        if not self.wallet.isAvailable():
+            reply_text = t('slateboy.msg_wallet_unavailable')
+            return context.bot.send_message(
+                chat_id=chat_id, text=reply_text)
 
-        # check if wallet is operational
-        is_wallet_ready, reason = self.wallet.isReady()
+        # check if wallet is operational, uses the cached state
+        with self.metrics.time('slateboy_stage_seconds', 'stage', 'checkWallet'):
+            is_wallet_ready, reason = self.isWalletReady()
         if not is_wallet_ready:
-            return update.context.bot.send_message(
+            if reason is None:
+                reason = t('slateboy.msg_wallet_not_ready')
+            return context.bot.send_message(
                 chat_id=chat_id, text=reason)
         return func(*args, **kwargs)
     return wrapper
@@ -61,12 +144,14 @@ def checkEULA(func):
         update = args[1]
         context = args[2]
 
-        # get the user_id
-        chat_id, user_id = extractIDs(update)
+        # built once per update
+        request = getRequest(update, kwargs)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # check if the personality wishes this user to see the EULA
-        needs_to_see, EULA, EULA_verion = self.personality.shouldSeeEULA(
-            update, context)
+        with self.metrics.time('slateboy_stage_seconds', 'stage', 'checkEULA'):
+            needs_to_see, EULA, EULA_verion = self.personality.shouldSeeEULA(
+                update, context)
         if not needs_to_see:
             return func(*args, **kwargs)
 
@@ -100,10 +185,14 @@ class checkShouldIgnore:
             update = args[1]
             context = args[2]
 
-            chat_id, user_id = extractIDs(update)
+            # built once per update
+            request = getRequest(update, kwargs)
+            chat_id = request.chat_id
 
             # check if personality wishes to reject this flow
-            ignore, reason = otherself.personality.shouldIgnore(update, context)
+            with otherself.metrics.time(
+                    'slateboy_stage_seconds', 'stage', 'checkShouldIgnore'):
+                ignore, reason = otherself.personality.shouldIgnore(update, context)
             if ignore:
                 if reason is not None:
                     return context.bot.send_message(
@@ -134,14 +223,17 @@ class parseRequestedAmountArgument:
             update = args[1]
             context = args[2]
 
-            # get the user_id
-            chat_id, user_id = extractIDs(update)
+            # built once per update
+            request = getRequest(update, kwargs)
+            chat_id, user_id = request.chat_id, request.user_id
 
             # check if there is amount specified
-            if len(context.args) == 0 and self.is_mandatory:
-                reply_text = t(self.msg_missing)
-                return context.bot.send_message(
-                    chat_id=chat_id, text=reply_text)
+            if len(context.args) == 0:
+                if self.is_mandatory:
+                    reply_text = t(self.msg_missing)
+                    return context.bot.send_message(
+                        chat_id=chat_id, text=reply_text)
+                return func(*args, **kwargs)
 
             # validate the requested amount
             requested_amount = None
@@ -157,7 +249,7 @@ class parseRequestedAmountArgument:
                         chat_id=chat_id, text=reply_text)
 
             # either valid either ignored
-            kwargs['requested_amount'] = requested_amount
+            request.requested_amount = requested_amount
             return func(*args, **kwargs)
         return wrapper
 
@@ -165,7 +257,7 @@ class parseRequestedAmountArgument:
 # legit SlateBoy class!
 
 class SlateBoy:
-    def __init__(self, name, api_key, personality, wallet_provider, namespace='slateboy', config={}, bot=None):
+    def __init__(self, name, api_key, personality, wallet_provider, namespace='slateboy', config={}, bot=None, translations=None):
         self.bot = bot
         self.name = name
         self.api_key = api_key
@@ -178,6 +270,111 @@ class SlateBoy:
         # register the personality instance
         self.personality = personality
 
+        # precompiled translations, python-i18n serves the messages
+        # without them, a missing key or placeholder fails right here
+        if translations is None and self.config.get('translations', None) is not None:
+            translations = Translations(
+                self.config.get('translations'),
+                locale=self.config.get('locale', 'en'),
+                fallback=self.config.get('fallback', 'en'))
+        self.translations = translations
+        if self.translations is not None:
+            self.translations.validate(self.translationKeys())
+
+        # the last scanned height survives the restarts, by default
+        # next to the persistence file
+        sync_state_path = self.config.get('sync_state_path', None)
+        if sync_state_path is None and self.config.get('persistence', None) is not None:
+            sync_state_path = os.path.join(
+                os.path.dirname(self.config.get('persistence')), 'sync_state.json')
+        if sync_state_path is not None:
+            self.wallet.setSyncStatePath(sync_state_path)
+
+        # event loop for awaiting the asynchronous wallet providers,
+        # created once so concurrent handlers share the same loop
+        self.event_loop = None
+        if isinstance(self.wallet, AsyncWalletProvider):
+            self.event_loop = EventLoopThread()
+
+        # cached wallet readiness (is_ready, reason, timestamp)
+        self.wallet_ready_ttl = self.config.get('wallet_ready_ttl', 60)
+        self.wallet_ready = None
+
+        # set while the wallet connection is being established
+        self.wallet_warming_up = False
+
+        # optional pool of pre-issued deposit invoices
+        self.invoice_pool = None
+
+        # drives the transaction confirmations and cancellations
+        self.reconciler = TxReconciler(
+            self.walletCall, self.personality, self.namespace,
+            max_deposit_age=self.config.get('max_request_age', 86400),
+            max_withdrawal_age=self.config.get('max_withdrawal_age', 600),
+            on_ready=self.setWalletReadiness,
+            submit=self.submitOrdered)
+
+        # recently decoded slatepacks
+        self.slate_cache = SlateCache(
+            size=self.config.get('slate_cache_size', 256))
+
+        # latency histograms, nearly free when disabled
+        self.metrics = Metrics(
+            enabled=self.config.get('metrics_enabled', False))
+        self.metrics_server = None
+
+        # embedded listener of the webhook mode
+        self.webhook_server = None
+
+        # rate limited queue of the outgoing messages
+        self.outbox = None
+
+        # the updates run off the dispatcher thread in per-user order,
+        # zero workers keeps them inline on the dispatcher thread
+        self.wallet_workers = None
+        wallet_workers = self.config.get('wallet_workers', 0)
+        if wallet_workers > 0:
+            self.wallet_workers = WalletWorkerPool(
+                workers=wallet_workers,
+                max_queue=self.config.get('wallet_queue_size', 32))
+
+        # per-user locks of the inline updates and jobs
+        self.inline_locks = KeyedThreadLocks()
+
+    # runs the updates and the parts of the jobs changing the data of the
+    # user in turn, on the worker pool if there is one, the key is the
+    # user id, the int of the update and the str of bot_data alike
+    # returns True if the task got accepted
+    def submitOrdered(self, key, function, *args, **kwargs):
+        if key is not None:
+            key = str(key)
+        function = self.translated(function)
+        if self.wallet_workers is None:
+            self.inline_locks.run(key, function, *args, **kwargs)
+            return True
+        return self.wallet_workers.submitOrdered(key, function, *args, **kwargs)
+
+    # the function answers with the translations of this instance, the
+    # dispatcher, the workers and the jobs run it outside of any update
+    def translated(self, function):
+        if self.translations is None:
+            return function
+        return self.translations.bind(function)
+
+    # too many updates waiting already
+    def rejectUpdate(self, update):
+        chat = update.effective_chat
+        if chat is None:
+            return
+        reply_text = t('slateboy.msg_wallet_busy')
+        self.updater.dispatcher.bot.send_message(
+            chat_id=chat.id, text=reply_text)
+
+    # returns {'namespace.key': (placeholder, ...)}
+    def translationKeys(self):
+        keys = dict(TRANSLATION_KEYS)
+        keys.update(self.personality.translationKeys())
+        return keys
 
     def initiate(self):
         # relevant configs
@@ -187,14 +384,52 @@ class SlateBoy:
         frequency_wallet_sync = self.config.get('frequency_wallet_sync', 600)
         first_wallet_sync = self.config.get('first_wallet_sync', 5)
 
+        frequency_wallet_ready = self.config.get('frequency_wallet_ready', 30)
+        first_wallet_ready = self.config.get('first_wallet_ready', 1)
+
         # check if personality requested to update standard command names
         names = self.personality.renameStandardCommands()
 
         # command callbacks
-        if self.bot is not None:
-            self.updater = Updater(bot=self.bot)
-        else:
-            self.updater = Updater(self.api_key, use_context=True)
+        # bot_data keeps the pending transactions and the invoice pool,
+        # they have to survive the restarts
+        persistence = None
+        if self.config.get('persistence', None) is not None:
+            persistence = PicklePersistence(
+                filename=self.config.get('persistence'))
+        bot = self.bot
+        if bot is None:
+            # the dispatcher, the jobs and the wallet workers send too
+            con_pool_size = 8 + self.config.get('wallet_workers', 0)
+            bot = ExtBot(self.api_key, request=Request(con_pool_size=con_pool_size))
+
+        # every update of a user is processed in turn
+        job_queue = JobQueue()
+        dispatcher = OrderedDispatcher(
+            bot, Queue(), job_queue=job_queue, persistence=persistence,
+            submit=self.submitOrdered,
+            rejected=self.translated(self.rejectUpdate))
+        job_queue.set_dispatcher(dispatcher)
+        self.updater = Updater(dispatcher=dispatcher, workers=None)
+
+        # the handlers and the jobs send through the outbox,
+        # context.bot is the bot of the dispatcher
+        if self.config.get('outbox_enabled', False):
+            self.outbox = Outbox(
+                self.updater.bot,
+                rate=self.config.get('outbox_rate', 30),
+                burst=self.config.get('outbox_burst', 30),
+                chat_rate=self.config.get('outbox_chat_rate', 1),
+                chat_burst=self.config.get('outbox_chat_burst', 3),
+                group_rate=self.config.get('outbox_group_rate', 20 / 60),
+                coalesce=self.config.get('outbox_coalesce', True),
+                linger=self.config.get('outbox_linger', 0.05))
+            self.updater.dispatcher.bot = OutboxBot(self.updater.bot, self.outbox)
+
+        # every update is answered in the locale of its user
+        if self.translations is not None:
+            self.updater.dispatcher.add_handler(
+                TypeHandler(Update, self.handlerLocale), group=-1)
 
         # register standard commands
         self.updater.dispatcher.add_handler(
@@ -206,6 +441,12 @@ class SlateBoy:
         self.updater.dispatcher.add_handler(
             CommandHandler(names.get('balance', 'balance'),
                            self.handlerBalance))
+        self.updater.dispatcher.add_handler(
+            CommandHandler(names.get('rescan', 'rescan'),
+                           self.handlerRescan))
+        self.updater.dispatcher.add_handler(
+            CommandHandler(names.get('stats', 'stats'),
+                           self.handlerStats))
 
         # register custom commands
         custom_commands = self.personality.registerCustomCommands()
@@ -217,43 +458,192 @@ class SlateBoy:
         self.updater.dispatcher.add_handler(
             MessageHandler(Filters.text, self.genericTextHandler))
 
+        # connect to the wallet in the background, the updates not
+        # touching the wallet are served meanwhile
+        self.updater.job_queue.run_once(self.translated(self.jobWalletWarmup), when=0)
+
         # transaction status update job for deposits and withdrawals
         self.updater.job_queue.run_repeating(
-            self.jobTXs, interval=frequency_job_txs,
+            self.translated(self.jobTXs), interval=frequency_job_txs,
             first=first_job_txs)
 
         # wallet refresh job for keeping it in sync
         self.updater.job_queue.run_repeating(
-            self.jobWalletSync, interval=frequency_wallet_sync,
+            self.translated(self.jobWalletSync), interval=frequency_wallet_sync,
             first=first_wallet_sync)
 
+        # keeps the cached wallet readiness fresh so the commands
+        # do not need to ask the wallet
+        self.updater.job_queue.run_repeating(
+            self.translated(self.jobWalletReady), interval=frequency_wallet_ready,
+            first=first_wallet_ready)
+
+        # pre-issued invoices for the amounts suggested by the personality
+        invoice_pool_buckets = self.personality.invoicePoolBuckets()
+        invoice_pool_size = self.config.get('invoice_pool_size', 3)
+        if len(invoice_pool_buckets) > 0 and invoice_pool_size > 0:
+            bot_data = self.updater.dispatcher.bot_data
+            self.invoice_pool = InvoicePool(
+                invoice_pool_buckets, size=invoice_pool_size,
+                max_age=self.config.get('invoice_pool_max_age', 86400),
+                state=bot_data.setdefault(self.namespace, {}).setdefault(
+                    'invoice_pool', {}))
+            self.updater.job_queue.run_repeating(
+                self.translated(self.jobInvoicePool),
+                interval=self.config.get('frequency_invoice_pool', 60),
+                first=self.config.get('first_invoice_pool', 10))
+
         # register custom jobs requested by the personality
         custom_jobs = self.personality.registerCustomJobs()
         for fist_interval, frequency, function in custom_jobs:
             self.updater.job_queue.run_repeating(
-                function, interval=frequency,
+                self.translated(function), interval=frequency,
                 first=first_interval)
 
         # callback query for button presses
         self.updater.dispatcher.add_handler(
             CallbackQueryHandler(self.callbackQueryHandler))
 
-        self.updater.job_queue.run_once(self.personality.atStart, when=0)
+        self.updater.job_queue.run_once(self.translated(self.personality.atStart), when=0)
 
     def run(self, idle=True):
+        self.startServices()
+        if self.config.get('webhook_enabled', False):
+            self.startWebhook()
+            if idle:
+                # the updater is not running, the listener waits
+                # for the stop signal instead
+                self.webhook_server.idle()
+                self.stop()
+            return
         self.updater.start_polling()
         if idle:
             self.updater.idle()
 
     def stop(self):
+        # no new updates, the queued ones are finished first
+        if self.webhook_server is not None:
+            self.webhook_server.stop()
+            self.webhook_server = None
+            # saved by the signal handler of the updater when polling
+            if self.updater.persistence is not None:
+                self.updater.dispatcher.update_persistence()
+                self.updater.persistence.flush()
+        # stops the job queue in both modes
         self.updater.stop()
-
+        self.stopServices()
+
+    # the updates are POSTed by Telegram instead of being polled
+    def startWebhook(self):
+        secret_token = self.config.get('webhook_secret_token', None)
+        self.webhook_server = WebhookServer(
+            self.processUpdate,
+            key=updateDataKey,
+            host=self.config.get('webhook_listen', '127.0.0.1'),
+            port=self.config.get('webhook_port', 8443),
+            path=self.config.get('webhook_path', '/telegram'),
+            secret_token=secret_token,
+            max_queue=self.config.get('webhook_queue_size', 256),
+            workers=self.config.get('webhook_workers', 8)).start()
+
+        # public address Telegram delivers to, usually a reverse proxy
+        # in front of the listener, nothing is registered without it
+        webhook_url = self.config.get('webhook_url', None)
+        if webhook_url:
+            self.updater.bot.set_webhook(
+                url=webhook_url, secret_token=secret_token,
+                max_connections=self.config.get('webhook_max_connections', 40))
+
+        # the updater does not poll, only its job queue is needed,
+        # the listener itself is stopped by stop
+        self.updater.job_queue.start()
+
+    def processUpdate(self, data):
+        update = Update.de_json(data, self.updater.bot)
+        self.updater.dispatcher.process_update(update)
+
+    def startServices(self):
+        if self.outbox is not None:
+            self.outbox.start()
+
+        # local scrape endpoint for the latency histograms
+        metrics_port = self.config.get('metrics_port', None)
+        if self.metrics.enabled and metrics_port is not None:
+            self.metrics_server = MetricsServer(
+                self.metrics,
+                host=self.config.get('metrics_host', '127.0.0.1'),
+                port=metrics_port).start()
+
+    def stopServices(self):
+        if self.wallet_workers is not None:
+            self.wallet_workers.stop()
+        # the replies of the finished operations are still sent
+        if self.outbox is not None:
+            self.outbox.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.event_loop is not None:
+            self.event_loop.stop()
+
+    # single entry point for the wallet calls, handles both
+    # the synchronous and the asynchronous wallet providers
+    def walletCall(self, method, *args, **kwargs):
+        function = getattr(self.wallet, method)
+        try:
+            with self.metrics.time('slateboy_wallet_call_seconds', 'method', method):
+                if not isinstance(self.wallet, AsyncWalletProvider):
+                    ret = function(*args, **kwargs)
+                else:
+                    ret = self.event_loop.run(function(*args, **kwargs))
+        except Exception as e:
+            self.invalidateWalletReadiness()
+            raise e
+
+        # failed wallet call, next command has to ask the wallet again
+        if method != 'isReady' and isinstance(ret, tuple) and ret[0] is False:
+            self.invalidateWalletReadiness()
+        return ret
+
+    # returns is_ready (bool) reason (str)
+    def isWalletReady(self):
+        cached = self.wallet_ready
+
+        # do not wait for the wallet while it is starting
+        if self.wallet_warming_up and cached is not None:
+            is_ready, reason, ts = cached
+            return is_ready, reason
+
+        if cached is not None:
+            is_ready, reason, ts = cached
+            if time.monotonic() - ts < self.wallet_ready_ttl:
+                return is_ready, reason
+        return self.refreshWalletReadiness()
+
+    # returns is_ready (bool) reason (str)
+    def refreshWalletReadiness(self):
+        is_ready, reason = self.walletCall('isReady')
+        self.setWalletReadiness(is_ready, reason)
+        return is_ready, reason
+
+    def setWalletReadiness(self, is_ready, reason):
+        self.wallet_ready = is_ready, reason, time.monotonic()
+
+    def invalidateWalletReadiness(self):
+        self.wallet_ready = None
+
+    # runs ahead of the other handlers, the replies to the
+    # update use the cached locale of its user
+    def handlerLocale(self, update, context):
+        setLocale(self.translations.userLocale(update.effective_user))
+
+    @timeHandler
     @preCommand
     @checkShouldIgnore('slateboy.msg_callback_query_ignored_unknown')
-    def callbackQueryHandler(self, update, context):
+    def callbackQueryHandler(self, update, context, request=None):
         # get the user_id
         print('callbackQueryHandler')
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # extract the query
         query = update.callback_query
@@ -282,6 +672,7 @@ class SlateBoy:
         query.edit_message_reply_markup(reply_markup=None)
         return False
 
+    @timeHandler
     @checkWallet
     @preCommand
     @checkShouldIgnore('slateboy.msg_withdraw_ignored_unknown')
@@ -289,11 +680,13 @@ class SlateBoy:
         'slateboy.msg_withdraw_missing_amount',
         'slateboy.msg_withdraw_invalid_amount',
         is_mandatory=False, allowed_max=True)
-    def handlerRequestWithdraw(self, update, context, requested_amount=None):
+    def handlerRequestWithdraw(self, update, context, request=None):
         # get the user_id
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # consult the personality
+        requested_amount = request.requested_amount
+        is_maximum_request = requested_amount == 'max'
         success, reason, result, approved_amount = self.personality.canWithdraw(
             update, context, requested_amount, maximum=is_maximum_request)
 
@@ -302,18 +695,19 @@ class SlateBoy:
             update, context, success, reason, result,
             requested_amount, approved_amount,
             'slateboy.msg_withdraw_rejected_known',
-            'slateboy.msg_withdraw_rejected_unknown')
+            'slateboy.msg_withdraw_rejected_unknown',
+            request=request)
         if not shall_continue:
             return shall_continue
 
         # if reached here, it means it is approved
         # begin the SRS flow
-        success, reason, slatepack, tx_id = self.wallet.send(approved_amount)
+        success, reason, slatepack, tx_id = self.walletCall('send', approved_amount)
 
         # check if for some reason it has failed,
         # example reason could be all the outputs are locked at the moment
         if not success:
-            update.context.bot.send_message(
+            context.bot.send_message(
                 chat_id=chat_id, text=reason)
             shall_continue = False
             return shall_continue
@@ -325,14 +719,17 @@ class SlateBoy:
         # did it not work for some reason?
         if not success:
             # release the locked outputs by cancelling the tx
-            self.wallet.releaseLock(tx_id)
+            self.walletCall('releaseLock', tx_id)
 
             # inform the user of the failure
-            update.context.bot.send_message(
+            context.bot.send_message(
                 chat_id=chat_id, text=reason)
             shall_continue = False
             return shall_continue
 
+        # released with the same amount if the wallet loses the tx
+        self.reconciler.assigned(context, tx_id, approved_amount, TX_WITHDRAWAL)
+
         # complete the RSR flow initialization
         shall_continue = self.completeFinancialOperation(
             update, context, slatepack,
@@ -340,10 +737,12 @@ class SlateBoy:
             self.personality.customWithdrawSlatepackFormatting,
             self.personality.customWithdrawFinalMessage,
             'slateboy.msg_withdraw_instructions',
-            'slateboy.msg_withdraw_slatepack_formatting')
+            'slateboy.msg_withdraw_slatepack_formatting',
+            request=request)
         return shall_continue
 
 
+    @timeHandler
     @checkWallet
     @preCommand
     @checkEULA
@@ -352,11 +751,12 @@ class SlateBoy:
         'slateboy.msg_deposit_missing_amount',
         'slateboy.msg_deposit_invalid_amount',
         allowed_max=False, is_mandatory=True)
-    def handlerRequestDeposit(self, update, context, requested_amount=None):
+    def handlerRequestDeposit(self, update, context, request=None):
         # get the user_id
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # consult the personality if this deposit is approved
+        requested_amount = request.requested_amount
         success, reason, result, approved_amount = self.personality.canDeposit(
             update, context, requested_amount)
 
@@ -365,13 +765,20 @@ class SlateBoy:
             update, context, success, reason, result,
             requested_amount, approved_amount,
             'slateboy.msg_deposit_rejected_known',
-            'slateboy.msg_deposit_rejected_unknown')
+            'slateboy.msg_deposit_rejected_unknown',
+            request=request)
         if not shall_continue:
             return shall_continue
 
         # if reached here, it means it is approved
-        # begin the RSR flow
-        success, reason, slatepack, tx_id = self.wallet.invoice(approved_amount)
+        # begin the RSR flow, with a pre-issued invoice if there is one
+        slatepack, tx_id = None, None
+        if self.invoice_pool is not None:
+            slatepack, tx_id = self.invoice_pool.take(approved_amount)
+        if slatepack is not None:
+            success, reason = True, None
+        else:
+            success, reason, slatepack, tx_id = self.walletCall('invoice', approved_amount)
 
         # check if for some reason it has failed
         if not success:
@@ -387,7 +794,7 @@ class SlateBoy:
         # did it not work for some reason?
         if not success:
             # release the locked outputs
-            self.wallet.releaseLock(tx_id)
+            self.walletCall('releaseLock', tx_id)
 
             # inform the user of the failure
             context.bot.send_message(
@@ -395,6 +802,9 @@ class SlateBoy:
             shall_continue = False
             return shall_continue
 
+        # released with the same amount if the wallet loses the tx
+        self.reconciler.assigned(context, tx_id, approved_amount, TX_DEPOSIT)
+
         # complete the RSR flow initialization
         shall_continue = self.completeFinancialOperation(
             update, context, slatepack,
@@ -402,15 +812,17 @@ class SlateBoy:
             self.personality.customDepositSlatepackFormatting,
             self.personality.customDepositFinalMessage,
             'slateboy.msg_deposit_instructions',
-            'slateboy.msg_deposit_slatepack_formatting')
+            'slateboy.msg_deposit_slatepack_formatting',
+            request=request)
         return shall_continue
 
 
+    @timeHandler
     @preCommand
     @checkShouldIgnore('slateboy.msg_balance_ignored_unknown')
-    def handlerBalance(self, update, context):
+    def handlerBalance(self, update, context, request=None):
         # get the user_id
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # consult the personality to get the balance
         success, reason, balance = self.personality.getBalance(
@@ -418,7 +830,7 @@ class SlateBoy:
 
         # is something wrong?
         if not success:
-            update.context.bot.send_message(
+            context.bot.send_message(
                 chat_id=chat_id, text=reason)
             shall_continue = False
             return shall_continue
@@ -446,10 +858,72 @@ class SlateBoy:
         return shall_continue
 
 
+    @timeHandler
+    @preCommand
+    def handlerRescan(self, update, context, request=None):
+        # get the user_id
+        chat_id, user_id = request.chat_id, request.user_id
+
+        # full rescan takes minutes, only admins may order it
+        if not self.personality.isAdmin(update, context):
+            reply_text = t('slateboy.msg_admin_only')
+            context.bot.send_message(
+                chat_id=chat_id, text=reply_text)
+            shall_continue = False
+            return shall_continue
+
+        # run it in the background and report when done
+        self.updater.job_queue.run_once(
+            self.translated(self.jobWalletRescan), when=0, context=chat_id)
+        reply_text = t('slateboy.msg_rescan_started')
+        context.bot.send_message(
+            chat_id=chat_id, text=reply_text)
+        shall_continue = False
+        return shall_continue
+
+
+    @timeHandler
+    @preCommand
+    def handlerStats(self, update, context, request=None):
+        # get the user_id
+        chat_id, user_id = request.chat_id, request.user_id
+
+        # the latencies are for the operators only
+        if not self.personality.isAdmin(update, context):
+            reply_text = t('slateboy.msg_admin_only')
+            context.bot.send_message(
+                chat_id=chat_id, text=reply_text)
+            shall_continue = False
+            return shall_continue
+
+        if not self.metrics.enabled:
+            reply_text = t('slateboy.msg_stats_disabled')
+            context.bot.send_message(
+                chat_id=chat_id, text=reply_text)
+            shall_continue = False
+            return shall_continue
+
+        # one line per handler, stage and wallet method
+        lines = [t('slateboy.msg_stats_header')]
+        for name, value, count, average, p95 in self.metrics.summary():
+            lines.append(t('slateboy.msg_stats_line').format(**{
+                'name': value,
+                'count': count,
+                'average': average,
+                'p95': p95
+            }))
+        reply_text = '\n'.join(lines)
+        context.bot.send_message(
+            chat_id=chat_id, text=reply_text)
+        shall_continue = False
+        return shall_continue
+
+
+    @timeHandler
     @checkShouldIgnore('slateboy.msg_generic_ignored_unknown')
-    def genericTextHandler(self, update, context):
+    def genericTextHandler(self, update, context, request=None):
         # get the user_id and the message_id
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
         message_id = update.message.message_id
 
         # does it contain a slatepack?
@@ -465,7 +939,7 @@ class SlateBoy:
             return shall_continue
 
         # is it a group message?
-        is_group_message = update.message.chat.type != 'private'
+        is_group_message = request.chat_type != 'private'
         if is_group_message:
             shall_continue, reason = self.personality.incomingTextGroup(
                 update, context, contains_slatepack)
@@ -476,7 +950,7 @@ class SlateBoy:
                 return shall_continue
 
         # is it a DM?
-        is_direct_message = update.message.chat.type == 'private'
+        is_direct_message = request.chat_type == 'private'
         if is_direct_message:
             shall_continue, reason = self.personality.incomingTextDM(
                 update, context, contains_slatepack)
@@ -497,8 +971,46 @@ class SlateBoy:
             shall_continue = False
             return shall_continue
 
-        # looks like it is direct message with a slatepack
-        slate = self.wallet.decodeSlatepack(slatepack)
+        # nothing more to do with the text without a slatepack
+        if not contains_slatepack:
+            shall_continue = False
+            return shall_continue
+
+        # validate the armor locally, the malformed or truncated ones
+        # are rejected without asking the wallet
+        valid, reason, header = self.parseSlatepack(slatepack)
+        if not valid:
+            reply_text = t('slateboy.msg_invalid_slatepack')
+            return context.bot.send_message(
+                        chat_id=chat_id, text=reply_text,
+                        reply_to_message_id=message_id)
+
+        # unencrypted invoices can be turned down straight away
+        if header.get('sta', None) == 'I1':
+            reply_text = t('slateboy.msg_ignoring_invoices')
+            return context.bot.send_message(
+                        chat_id=chat_id, text=reply_text,
+                        reply_to_message_id=message_id)
+
+        # the rest of the flow talks to the wallet
+        return self.dispatchSlatepack(
+            update, context, slatepack, request=request)
+
+    # looks like it is direct message with a slatepack,
+    # it is decoded only once and the slate travels along the flow
+    @timeHandler
+    def dispatchSlatepack(self, update, context, slatepack, request=None):
+        # get the user_id and the message_id
+        chat_id, user_id = request.chat_id, request.user_id
+        message_id = update.message.message_id
+
+        success, reason, slate = self.decodeSlatepack(slatepack)
+        if not success:
+            if reason is None:
+                reason = t('slateboy.msg_invalid_slatepack')
+            return context.bot.send_message(
+                        chat_id=chat_id, text=reason,
+                        reply_to_message_id=message_id)
         tx_id = slate.get('id', -1)
         sta = slate.get('sta', -1)
 
@@ -507,14 +1019,16 @@ class SlateBoy:
             # the following processing function will execute
             # the logic along with the personality to ensure
             # such a deposit is approved
-            return self.processS1Slatepack(update, context, slate, tx_id)
+            return self.processS1Slatepack(
+                update, context, slate, tx_id, request=request)
 
         # S2 - withdrawal flow, user responded with a slatepack
         if sta == 'S2':
             # the following processing function will execute
             # the logic along with the personality to ensure
             # such a withdrawal may continue
-            return self.processS2Slatepack(update, context, slate, tx_id)
+            return self.processS2Slatepack(
+                update, context, slate, tx_id, request=request)
 
         # I1 - user sent us an invoice
         if sta == 'I1':
@@ -528,26 +1042,75 @@ class SlateBoy:
         # I2 - user responded to our invoice
         if sta == 'I2':
             # complete the deposit using the invoice flow
-            return self.processI2Slatepack(update, context, slate, tx_id)
+            return self.processI2Slatepack(
+                update, context, slate, tx_id, request=request)
 
 
     def jobTXs(self, context):
-        pass
+        self.reconciler.reconcile(context)
 
     def jobWalletSync(self, context):
-        pass
+        # routine sync, the provider continues from the last scanned height
+        self.walletCall('sync')
+        self.refreshWalletReadiness()
+
+    # full rescan ordered by an admin, the chat to report to
+    # is stored as the job context
+    def jobWalletRescan(self, context):
+        chat_id = context.job.context
+        success, reason = self.walletCall('sync', full=True)
+        if success:
+            reply_text = t('slateboy.msg_rescan_finished')
+        elif reason is not None:
+            reply_text = reason
+        else:
+            reply_text = t('slateboy.msg_rescan_failed')
+        context.bot.send_message(chat_id=chat_id, text=reply_text)
+
+    def jobWalletWarmup(self, context):
+        self.wallet_warming_up = True
+        self.setWalletReadiness(False, t('slateboy.msg_wallet_starting'))
+        try:
+            self.walletCall('warmup')
+        finally:
+            self.wallet_warming_up = False
+        self.refreshWalletReadiness()
+
+    def jobWalletReady(self, context):
+        if self.wallet_warming_up:
+            return
+        # already refreshed along with the transactions
+        cached = self.wallet_ready
+        frequency_wallet_ready = self.config.get('frequency_wallet_ready', 30)
+        if cached is not None and time.monotonic() - cached[2] < frequency_wallet_ready / 2:
+            return
+        self.refreshWalletReadiness()
+
+    def jobInvoicePool(self, context):
+        # cancel the stale ones first so they do not linger in the wallet
+        self.invoice_pool.expire(
+            lambda tx_id: self.walletCall('releaseLock', tx_id))
+        self.invoice_pool.topUp(
+            lambda amount: self.walletCall('invoice', amount))
+        # the jobs do not save bot_data, the new invoices would be
+        # forgotten if the bot stopped before the next update
+        context.dispatcher.update_persistence()
 
     # wrappers
 
     @checkWallet
     @checkEULA
-    def processS1Slatepack(self, update, context, slate, tx_id):
+    def processS1Slatepack(self, update, context, slate, tx_id, request=None):
         # get the user_id and the message_id
-        chat_id, user_id = extractIDs(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
-        # get the amount from the slatepack
-        requested_amount = slate.get('amt', -1)
-        if requested_amount == -1:
+        # get the amount from the slatepack, the slates carry
+        # nanogrin while the personality gets GRIN
+        try:
+            requested_amount = toGrin(slate.get('amt', None))
+        except (TypeError, ValueError):
+            requested_amount = None
+        if requested_amount is None:
             reply_text = t('slateboy.msg_invalid_slatepack')
             context.bot.send_message(
                 chat_id=user_id, text=reply_text)
@@ -563,13 +1126,16 @@ class SlateBoy:
             update, context, success, reason, result,
             requested_amount, approved_amount,
             'slateboy.msg_deposit_rejected_known',
-            'slateboy.msg_deposit_rejected_unknown')
+            'slateboy.msg_deposit_rejected_unknown',
+            request=request)
         if not shall_continue:
             return shall_continue
 
         # if reached here, it means it is approved
-        # begin the SRS flow
-        success, reason, slatepack, tx_id = self.wallet.receive(approved_amount) # TODO this should be slatepack!
+        # begin the SRS flow, reusing the already decoded slate
+        slatepack = getattr(slate, 'slatepack', None)
+        success, reason, slatepack, tx_id = self.walletCall(
+            'receive', slatepack, slate=slate)
 
         # check if for some reason it has failed
         if not success:
@@ -586,7 +1152,7 @@ class SlateBoy:
         # did it not work for some reason?
         if not success:
             # release the locked outputs
-            self.wallet.releaseLock(tx_id)
+            self.walletCall('releaseLock', tx_id)
 
             # inform the user of the failure
             context.bot.send_message(
@@ -594,6 +1160,9 @@ class SlateBoy:
             shall_continue = False
             return shall_continue
 
+        # released with the same amount if the wallet loses the tx
+        self.reconciler.assigned(context, tx_id, approved_amount, TX_DEPOSIT)
+
         # complete the SRS flow instructions
         shall_continue = self.completeFinancialOperation(
             update, context, slatepack,
@@ -601,30 +1170,53 @@ class SlateBoy:
             self.personality.customSRSDepositSlatepackFormatting,
             self.personality.customSRSDepositFinalMessage,
             'slateboy.msg_deposit_srs_instructions',
-            'slateboy.msg_deposit_srs_slatepack_formatting')
+            'slateboy.msg_deposit_srs_slatepack_formatting',
+            request=request)
         return shall_continue
 
     @checkWallet
-    def processS2Slatepack(self, update, context, slatepack, tx_id):
+    def processS2Slatepack(self, update, context, slate, tx_id, request=None):
         return self.processSlatepack(
-            update, context, slatepack, tx_id,
+            update, context, slate, tx_id,
             self.personality.shouldFinalizeWithdrawTx,
             self.personality.finalizeWithdrawTx,
             'slateboy.msg_i2_withdraw_rejected_unknown',
-            'slateboy.msg_withdraw_finalized')
+            'slateboy.msg_withdraw_finalized',
+            request=request)
 
 
     @checkWallet
-    def processI2Slatepack(update, context, slatepack, tx_id):
+    def processI2Slatepack(self, update, context, slate, tx_id, request=None):
         return self.processSlatepack(
-            update, context, slatepack, tx_id,
+            update, context, slate, tx_id,
             self.personality.shouldFinalizeDepositTx,
             self.personality.finalizeDepositTx,
             'slateboy.msg_s2_deposit_rejected_unknown',
-            'slateboy.msg_deposit_finalized')
+            'slateboy.msg_deposit_finalized',
+            request=request)
 
     # some helpers
 
+    # returns success (bool) reason (str) slate (DecodedSlate)
+    def decodeSlatepack(self, slatepack):
+        decoded = self.slate_cache.get(slatepack)
+        if decoded is not None:
+            return True, None, decoded
+
+        # providers return either the slate either
+        # the success, reason, slate tuple
+        ret = self.walletCall('decodeSlatepack', slatepack)
+        if isinstance(ret, tuple):
+            success, reason, slate = ret
+        else:
+            success, reason, slate = ret is not None, None, ret
+        if not success:
+            return success, reason, None
+
+        decoded = DecodedSlate(slatepack, slate)
+        self.slate_cache.put(decoded)
+        return True, None, decoded
+
     def containsSlatepack(self, text):
         regex = 'BEGINSLATEPACK[\\s\\S]*\\sENDSLATEPACK'
         matches = re.search(regex, text, flags=re.DOTALL)
@@ -635,6 +1227,12 @@ class SlateBoy:
             slatepack = matches.group(0).replace('\n', '')
         return contains_slatepack, slatepack
 
+    # returns valid (bool) reason (str) header (dict)
+    # header contains the slate 'id' and 'sta' only if
+    # the slatepack is not encrypted
+    def parseSlatepack(self, slatepack):
+        return parseSlatepack(slatepack)
+
     def validateFinancialOperation(
             self,
             update,
@@ -643,9 +1241,12 @@ class SlateBoy:
             reason_of_failure,
             allowed,
             requested_amount,
-            approved_amount, reject_reason_known, reject_reason_unknown):
+            approved_amount, reject_reason_known, reject_reason_unknown,
+            request=None):
         # get the user_id and the message_id
-        chat_id, user_id = extractIDs(update)
+        if request is None:
+            request = RequestContext(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # check if user has violated ny terms
         if not allowed and reason_of_failure is None and approved_amount is not None:
@@ -683,9 +1284,12 @@ class SlateBoy:
             customInstructionsMethod,
             customSlatepackFormattingMethod,
             finalMessageMethod,
-            standard_instructions, standard_slatepack_formatting):
+            standard_instructions, standard_slatepack_formatting,
+            request=None):
         # get the user_id
-        chat_id, user_id = extractIDs(update)
+        if request is None:
+            request = RequestContext(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # check if personality wants custom instruction send
         send_instructions, custom_instructions = customInstructionsMethod(update, context)
@@ -719,13 +1323,16 @@ class SlateBoy:
         return shall_continue
 
     def processSlatepack(
-            self, update, context, slatepack, tx_id,
+            self, update, context, slate, tx_id,
             shouldFinalizeQueryMethod,
             finalizedTxMethod,
             msg_slatepack_rejected,
-            msg_slatepack_finalized):
+            msg_slatepack_finalized,
+            request=None):
         # get the user_id and the message_id
-        chat_id, user_id = extractIDs(update)
+        if request is None:
+            request = RequestContext(update)
+        chat_id, user_id = request.chat_id, request.user_id
 
         # check if personality wishes to finalize it
         should_finalize, reason = shouldFinalizeQueryMethod(update, context, tx_id)
@@ -742,7 +1349,13 @@ class SlateBoy:
             return shall_continue
 
         # finalization approved
-        success, reason, finalized_slatepack = self.wallet.finalize(slatepack)
+        # the decoded slate spares the wallet from decoding it again
+        if isinstance(slate, dict):
+            success, reason, finalized_tx_id = self.walletCall(
+                'finalize', getattr(slate, 'slatepack', None), slate=slate)
+        else:
+            success, reason, finalized_tx_id = self.walletCall(
+                'finalize', slate)
 
         # did it not work for some reason?
         if not success:
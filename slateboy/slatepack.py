@@ -0,0 +1,237 @@
+import uuid
+import struct
+import hashlib
+
+
+# local, in-process reading of the slatepack armor, lets the bot validate
+# and classify the slatepacks without asking the wallet
+#
+# armor:  BEGINSLATEPACK. <base58(checksum + payload)>. ENDSLATEPACK.
+# payload: SlatepackBin, for unencrypted slatepacks it wraps the binary slate
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BASE58_INDEX = {c: i for i, c in enumerate(BASE58_ALPHABET)}
+
+HEADER = 'BEGINSLATEPACK.'
+FOOTER = '.ENDSLATEPACK'
+
+# anything longer than that is not a slatepack a human pasted
+MAX_SLATEPACK_LENGTH = 65536
+
+# words of the armored payload
+WORD_LENGTH = 15
+WORDS_PER_LINE = 200
+
+SLATEPACK_MODE_PLAIN = 0
+SLATEPACK_MODE_ENCRYPTED = 1
+
+SLATE_STATES = ['NA', 'S1', 'S2', 'S3', 'I1', 'I2', 'I3']
+
+
+class SlatepackError(ValueError):
+    pass
+
+
+def base58decode(text):
+    number = 0
+    for c in text:
+        if c not in BASE58_INDEX:
+            raise SlatepackError('Invalid base58 character')
+        number = number * 58 + BASE58_INDEX[c]
+    decoded = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    padding = len(text) - len(text.lstrip('1'))
+    return b'\x00' * padding + decoded
+
+
+def base58encode(data):
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number > 0:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    padding = len(data) - len(data.lstrip(b'\x00'))
+    return '1' * padding + encoded
+
+
+def checksum(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
+
+# returns the payload (bytes) of the armored slatepack,
+# raises SlatepackError if the framing or the checksum is invalid
+def decodeArmor(slatepack):
+    if len(slatepack) > MAX_SLATEPACK_LENGTH:
+        raise SlatepackError('Slatepack too long')
+
+    compact = ''.join(slatepack.split())
+    if compact.endswith('.'):
+        compact = compact[:-1]
+    if not compact.startswith(HEADER):
+        raise SlatepackError('Missing BEGINSLATEPACK header')
+    if not compact.endswith(FOOTER):
+        raise SlatepackError('Missing ENDSLATEPACK footer')
+
+    encoded = compact[len(HEADER):-len(FOOTER)]
+    if len(encoded) == 0:
+        raise SlatepackError('Empty slatepack')
+
+    data = base58decode(encoded)
+    if len(data) <= 4:
+        raise SlatepackError('Truncated slatepack')
+    if checksum(data[4:]) != data[:4]:
+        raise SlatepackError('Invalid slatepack checksum')
+    return data[4:]
+
+
+# returns the armored slatepack (str) for the given payload (bytes)
+def encodeArmor(payload):
+    encoded = base58encode(checksum(payload) + payload)
+    words = [encoded[i:i + WORD_LENGTH]
+             for i in range(0, len(encoded), WORD_LENGTH)]
+    lines = [' '.join(words[i:i + WORDS_PER_LINE])
+             for i in range(0, len(words), WORDS_PER_LINE)]
+    return HEADER + ' ' + '\n'.join(lines) + '. ENDSLATEPACK.'
+
+
+class Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def read(self, length):
+        if self.position + length > len(self.data):
+            raise SlatepackError('Truncated slatepack')
+        chunk = self.data[self.position:self.position + length]
+        self.position += length
+        return chunk
+
+    def u8(self):
+        return self.read(1)[0]
+
+    def u16(self):
+        return struct.unpack('>H', self.read(2))[0]
+
+    def u32(self):
+        return struct.unpack('>I', self.read(4))[0]
+
+    def u64(self):
+        return struct.unpack('>Q', self.read(8))[0]
+
+
+# header fields of a binary v4 slate, the remaining fields
+# (signatures, commitments, proofs) are left to the wallet
+def parseSlateHeader(data):
+    reader = Reader(data)
+    version = reader.u16()
+    block_header_version = reader.u16()
+    if version != 4:
+        raise SlatepackError('Unsupported slate version')
+    slate_id = str(uuid.UUID(bytes=reader.read(16)))
+    state = reader.u8()
+    if state >= len(SLATE_STATES):
+        raise SlatepackError('Invalid slate state')
+
+    header = {
+        'ver': '{}:{}'.format(version, block_header_version),
+        'id': slate_id,
+        'sta': SLATE_STATES[state],
+        'num_parts': 2,
+        'amt': '0',
+        'fee': '0',
+    }
+
+    # optional fields, the status byte tells which are present
+    status = reader.u8()
+    if status & 0x01:
+        header['num_parts'] = reader.u8()
+    if status & 0x02:
+        header['amt'] = str(reader.u64())
+    if status & 0x04:
+        header['fee'] = str(reader.u64())
+    if status & 0x08:
+        header['feat'] = reader.u8()
+    if status & 0x10:
+        header['ttl'] = str(reader.u64())
+    return header
+
+
+def parseSlatepackBin(data):
+    reader = Reader(data)
+    major = reader.u8()
+    minor = reader.u8()
+    mode = reader.u8()
+    if mode not in [SLATEPACK_MODE_PLAIN, SLATEPACK_MODE_ENCRYPTED]:
+        raise SlatepackError('Invalid slatepack mode')
+
+    # optional fields
+    opt_flags = reader.u16()
+    opt_fields = Reader(reader.read(reader.u32()))
+    sender = None
+    if opt_flags & 0x01:
+        sender = opt_fields.read(opt_fields.u8()).decode('ascii', 'replace')
+
+    payload = reader.read(reader.u64())
+
+    header = {}
+    if mode == SLATEPACK_MODE_PLAIN:
+        header = parseSlateHeader(payload)
+    header['slatepack'] = '{}.{}'.format(major, minor)
+    header['mode'] = mode
+    header['sender'] = sender
+    return header
+
+
+# validates the armor and reads the header fields, the slate fields
+# ('id', 'sta', 'amt'...) are only available for unencrypted slatepacks
+# returns valid (bool) reason (str) header (dict)
+def parseSlatepack(slatepack):
+    try:
+        data = decodeArmor(slatepack)
+        if data[0] == 1:
+            header = parseSlatepackBin(data)
+        else:
+            # bare binary slate without the SlatepackBin envelope
+            header = parseSlateHeader(data)
+            header['slatepack'] = None
+            header['mode'] = SLATEPACK_MODE_PLAIN
+            header['sender'] = None
+    except SlatepackError as e:
+        valid = False
+        reason = str(e)
+        header = None
+        return valid, reason, header
+    valid = True
+    reason = None
+    return valid, reason, header
+
+
+# builds an unencrypted slatepack carrying just the slate header fields,
+# used to produce deterministic slatepacks for testing
+def encodeSlatepack(slate_id, sta, amt=0, fee=0, num_parts=2, sender=None):
+    slate = struct.pack('>HH', 4, 3)
+    slate += uuid.UUID(slate_id).bytes
+    slate += bytes([SLATE_STATES.index(sta)])
+    status = 0
+    fields = b''
+    if num_parts != 2:
+        status |= 0x01
+        fields += bytes([num_parts])
+    if int(amt) > 0:
+        status |= 0x02
+        fields += struct.pack('>Q', int(amt))
+    if int(fee) > 0:
+        status |= 0x04
+        fields += struct.pack('>Q', int(fee))
+    slate += bytes([status]) + fields
+
+    opt_flags = 0
+    opt_fields = b''
+    if sender is not None:
+        opt_flags |= 0x01
+        opt_fields += bytes([len(sender)]) + sender.encode('ascii')
+
+    data = bytes([1, 0, SLATEPACK_MODE_PLAIN])
+    data += struct.pack('>H', opt_flags)
+    data += struct.pack('>I', len(opt_fields)) + opt_fields
+    data += struct.pack('>Q', len(slate)) + slate
+    return encodeArmor(data)
@@ -0,0 +1,49 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+
+# whitespace and line breaks do not change the slatepack
+def slatepackDigest(slatepack):
+    normalized = ''.join(slatepack.split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+# slate decoded from a slatepack, behaves like the slate dict and remembers
+# the armored slatepack it came from so it never needs to be decoded again
+class DecodedSlate(dict):
+    def __init__(self, slatepack, slate):
+        dict.__init__(self, slate)
+        self.slatepack = slatepack
+        self.digest = slatepackDigest(slatepack)
+
+
+# LRU cache of the decoded slates keyed by the slatepack digest,
+# a re-pasted slatepack does not cost another wallet call
+class SlateCache:
+    def __init__(self, size=256):
+        self.size = size
+        self.slates = OrderedDict()
+        self.lock = threading.Lock()
+
+    # returns DecodedSlate or None
+    def get(self, slatepack):
+        digest = slatepackDigest(slatepack)
+        with self.lock:
+            decoded = self.slates.get(digest, None)
+            if decoded is not None:
+                self.slates.move_to_end(digest)
+            return decoded
+
+    def put(self, decoded):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.slates[decoded.digest] = decoded
+            self.slates.move_to_end(decoded.digest)
+            while len(self.slates) > self.size:
+                self.slates.popitem(last=False)
+
+    def __len__(self):
+        return len(self.slates)
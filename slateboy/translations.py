@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import string
+import threading
+import functools
+import contextvars
+
+from i18n import translator
+
+
+# precompiled translations, the translations/*.json files are loaded once
+# at startup and every template is parsed right away, the lookup of a
+# message is a dict access instead of a walk through the python-i18n
+# configuration and resources
+#
+# the templates are checked against the keys SlateBoy and the personality
+# use, a missing key or placeholder fails the startup instead of the reply
+#
+# the files follow the python-i18n layout, {namespace}.{locale}.json with
+# the locale as the root key, a locale misses nothing, the keys it lacks
+# come from the fallback locale
+
+
+class TranslationError(Exception):
+    pass
+
+
+FORMATTER = string.Formatter()
+
+
+# (literal, field, conversion, spec) parts of the template, the
+# automatically numbered fields get their position like in str.format,
+# the spec is a str or the parts of a nested template
+def parseTemplate(text, position=None):
+    if position is None:
+        position = [0, False]
+    parts = []
+    for literal, field, spec, conversion in FORMATTER.parse(text):
+        if field is None:
+            parts.append((literal, None, None, ''))
+            continue
+        # {} and {.name} take the next argument, {0} and {name} do not
+        if field == '' or field[0] in '.[':
+            if position[1]:
+                raise ValueError('cannot switch from manual field '
+                                 'specification to automatic field numbering')
+            field = str(position[0]) + field
+            position[0] += 1
+        elif re.split(r'[.\[]', field, maxsplit=1)[0].isdigit():
+            if position[0] > 0:
+                raise ValueError('cannot switch from automatic field '
+                                 'numbering to manual field specification')
+            position[1] = True
+        if spec and '{' in spec:
+            spec = tuple(parseTemplate(spec, position))
+        parts.append((literal, field, conversion, spec))
+    return parts
+
+
+# names of the placeholders of the parsed template
+def partsFields(parts):
+    fields = set()
+    for literal, field, conversion, spec in parts:
+        if field is None:
+            continue
+        # {user.name} and {balances[0]} use the user and balances arguments
+        fields.add(re.split(r'[.\[]', field, maxsplit=1)[0])
+        if isinstance(spec, tuple):
+            fields |= partsFields(spec)
+    return frozenset(fields)
+
+
+def templateFields(text):
+    return partsFields(parseTemplate(text))
+
+
+# same as str.format without parsing the text again
+def renderTemplate(parts, args, kwargs):
+    chunks = []
+    for literal, field, conversion, spec in parts:
+        chunks.append(literal)
+        if field is None:
+            continue
+        value, first = FORMATTER.get_field(field, args, kwargs)
+        if conversion:
+            value = FORMATTER.convert_field(value, conversion)
+        if isinstance(spec, tuple):
+            spec = renderTemplate(spec, args, kwargs)
+        chunks.append(format(value, spec or ''))
+    return ''.join(chunks)
+
+
+# the translated text, the placeholders are parsed once and
+# format renders the parsed parts
+class Template(str):
+    def __new__(cls, text):
+        template = str.__new__(cls, text)
+        template.parts = parseTemplate(text)
+        template.fields = partsFields(template.parts)
+        return template
+
+    def format(self, *args, **kwargs):
+        return renderTemplate(self.parts, args, kwargs)
+
+
+# flattens the nested keys the same way python-i18n does
+def flattenTemplates(data, prefix):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from flattenTemplates(value, prefix + key + '.')
+        else:
+            yield prefix + key, value
+
+
+class Translations:
+    def __init__(self, directory, locale='en', fallback='en', cache_size=100000):
+        self.directory = directory
+        self.locale = locale
+        self.fallback = fallback
+        self.cache_size = cache_size
+
+        # problems found while loading, reported by validate
+        self.errors = []
+
+        # locale -> {'namespace.key': Template}, the fallback
+        # templates included
+        self.templates = {}
+
+        # user_id -> locale
+        self.users = {}
+        self.lock = threading.Lock()
+
+        self.load()
+
+    def load(self):
+        loaded = {}
+        for filename in sorted(os.listdir(self.directory)):
+            parts = filename.split('.')
+            if len(parts) != 3 or parts[2] != 'json':
+                continue
+            namespace, locale = parts[0], parts[1]
+            with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or locale not in data:
+                self.errors.append(
+                    '{}: the root key is not {}'.format(filename, locale))
+                continue
+
+            templates = loaded.setdefault(locale, {})
+            for key, text in flattenTemplates(data[locale], namespace + '.'):
+                try:
+                    templates[key] = Template(str(text))
+                except ValueError as e:
+                    self.errors.append('{}: {} is malformed, {}'.format(
+                        filename, key, e))
+
+        fallback = loaded.get(self.fallback, {})
+        for locale, templates in loaded.items():
+            self.templates[locale] = dict(fallback, **templates)
+
+    @property
+    def locales(self):
+        return sorted(self.templates)
+
+    # returns Template or None
+    def get(self, key, locale=None):
+        templates = self.templates.get(locale, None)
+        if templates is None:
+            templates = self.templates.get(self.locale, {})
+        return templates.get(key, None)
+
+    # the supported locale of the language code, pt-br falls back to
+    # pt and then to the default locale
+    def resolve(self, language_code):
+        if language_code:
+            language_code = language_code.lower().replace('_', '-')
+            if language_code in self.templates:
+                return language_code
+            language = language_code.split('-')[0]
+            if language in self.templates:
+                return language
+        return self.locale
+
+    # locale of the telegram.User, remembered for the next updates
+    def userLocale(self, user):
+        if user is None:
+            return self.locale
+        locale = self.users.get(user.id, None)
+        if locale is not None:
+            return locale
+
+        locale = self.resolve(getattr(user, 'language_code', None))
+        with self.lock:
+            while len(self.users) >= self.cache_size > 0:
+                self.users.pop(next(iter(self.users)))
+            self.users[user.id] = locale
+        return locale
+
+    # the function runs with these translations behind t() in a copy of
+    # the current context, the locale set inside stays there
+    def bind(self, function):
+        @functools.wraps(function)
+        def translated(*args, **kwargs):
+            def run():
+                current_translations.set(self)
+                return function(*args, **kwargs)
+            return contextvars.copy_context().run(run)
+        return translated
+
+    # required is {'namespace.key': placeholders}, every locale has to
+    # provide the key with exactly these placeholders
+    # raises TranslationError listing all the problems
+    def validate(self, required):
+        errors = list(self.errors)
+        for locale in (self.locale, self.fallback):
+            if locale not in self.templates:
+                errors.append('no translations for the locale {}'.format(locale))
+
+        for locale in self.locales:
+            templates = self.templates[locale]
+            for key, placeholders in sorted(required.items()):
+                template = templates.get(key, None)
+                if template is None:
+                    errors.append('{}: {} is missing'.format(locale, key))
+                    continue
+                expected = frozenset(str(placeholder) for placeholder in placeholders)
+                if template.fields != expected:
+                    errors.append('{}: {} has the placeholders {}, expected {}'.format(
+                        locale, key, sorted(template.fields), sorted(expected)))
+
+        if len(errors) > 0:
+            raise TranslationError('\n'.join(errors))
+
+
+# translations of the SlateBoy processing the update or the job and the
+# locale of its user, the threads and the tasks outside of them fall
+# back to python-i18n and the default locale
+current_translations = contextvars.ContextVar('slateboy_translations', default=None)
+current_locale = contextvars.ContextVar('slateboy_locale', default=None)
+
+
+def setLocale(locale):
+    current_locale.set(locale)
+
+
+# drop-in for i18n.translator.t, the templates are str and
+# formatted by the caller
+def t(key, locale=None, **kwargs):
+    translations = current_translations.get()
+    if translations is None or len(kwargs) > 0:
+        if locale is not None:
+            kwargs['locale'] = locale
+        return translator.t(key, **kwargs)
+    if locale is None:
+        locale = current_locale.get()
+    template = translations.get(key, locale)
+    if template is None:
+        return translator.t(key)
+    return template
@@ -0,0 +1,60 @@
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+
+# post uses the timeout of the endpoint unless the caller brings its
+# own, None waits as long as it takes
+DEFAULT_TIMEOUT = object()
+
+
+# HTTP transport shared by all the wallet RPC traffic, it keeps the
+# connections alive and pools them so the Owner and Foreign API calls
+# do not pay for the TCP setup every time
+class WalletTransport:
+    def __init__(self, pool_connections=2, pool_maxsize=8,
+                 timeout=60, timeouts={}):
+        # default timeout and the per-endpoint overrides
+        self.timeout = timeout
+        self.timeouts = dict(timeouts)
+
+        # bounded pool, callers wait for a free connection
+        # instead of opening extra ones
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True)
+
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def setTimeout(self, url, timeout):
+        self.timeouts[url] = timeout
+
+    def getTimeout(self, url):
+        return self.timeouts.get(url, self.timeout)
+
+    def post(self, url, payload, auth=None, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.getTimeout(url)
+        return self.session.post(
+            url, json=payload, auth=auth, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+# transport used when the caller does not bring its own
+def getDefaultTransport():
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = WalletTransport()
+        return _default_transport
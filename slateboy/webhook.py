@@ -0,0 +1,136 @@
+import hmac
+import json
+import logging
+import threading
+
+from signal import signal, SIGINT, SIGTERM, SIGABRT
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from slateboy.ordering import KeyedSerialExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+# webhook intake, Telegram POSTs the updates to the embedded HTTP server,
+# they are acknowledged as soon as they are queued and processed by a
+# fixed number of worker threads, the updates of one user are processed
+# in the received order
+#
+# a full queue answers 503 and Telegram delivers the update again later,
+# so a burst does not pile up unbounded work in memory
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# bytes, the updates are a few kilobytes at most
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def respond(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path.split('?')[0] != webhook.path:
+            return self.respond(404)
+
+        # updates not signed with our secret token are not from Telegram
+        if webhook.secret_token is not None:
+            token = self.headers.get(SECRET_TOKEN_HEADER, '')
+            if not hmac.compare_digest(token, webhook.secret_token):
+                return self.respond(403)
+
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length <= 0 or length > MAX_BODY_SIZE:
+            return self.respond(400)
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            return self.respond(400)
+        if not isinstance(data, dict):
+            return self.respond(400)
+
+        if not webhook.put(data):
+            return self.respond(503)
+        return self.respond(200)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# process(data) gets the decoded JSON of every accepted update,
+# key(data) orders the updates, none are ordered without it,
+# the listener is http://host:port/path
+class WebhookServer:
+    def __init__(self, process, key=None, host='127.0.0.1', port=8443,
+                 path='/', secret_token=None, max_queue=256, workers=4):
+        self.process = process
+        self.key = key
+        self.path = path
+        self.secret_token = secret_token
+        self.executor = KeyedSerialExecutor(
+            workers=workers, max_queue=max_queue, name='slateboy-webhook')
+        self.server = ThreadingHTTPServer((host, port), WebhookHandler)
+        self.server.daemon_threads = True
+        self.server.webhook = self
+        self.thread = None
+
+        # set by stop or by one of the signals idle waits for
+        self.stopping = threading.Event()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}{}'.format(host, port, self.path)
+
+    # returns True if the update got queued, False if the queue is full
+    def put(self, data):
+        key = None
+        if self.key is not None:
+            key = self.key(data)
+        if not self.executor.submit(key, self.process, data):
+            logger.warning('Webhook queue is full, update %s rejected',
+                           data.get('update_id', None))
+            return False
+        return True
+
+    # blocks until the queued updates are processed
+    def join(self, timeout=None):
+        return self.executor.join(timeout)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name='slateboy-webhook')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    # blocks until one of the signals arrives or stop is called,
+    # the signal handlers can be installed from the main thread only
+    def idle(self, stop_signals=(SIGINT, SIGTERM, SIGABRT)):
+        for sig in stop_signals:
+            signal(sig, self.signalHandler)
+        while not self.stopping.wait(1):
+            pass
+
+    def signalHandler(self, signum, frame):
+        logger.info('Received signal %s, stopping the webhook', signum)
+        self.stopping.set()
+
+    # stops the intake, the already queued updates are still processed
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+        self.executor.stop()
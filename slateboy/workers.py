@@ -0,0 +1,21 @@
+from slateboy.ordering import KeyedSerialExecutor
+
+
+# bounded pool of threads running the updates away from the dispatcher
+# thread, so a slow wallet call does not hold up the other users
+#
+# the updates and the jobs of one user are queued behind each other,
+# those of different users run in parallel
+class WalletWorkerPool(KeyedSerialExecutor):
+    def __init__(self, workers=4, max_queue=32):
+        KeyedSerialExecutor.__init__(
+            self, workers=workers, max_queue=max_queue,
+            name='slateboy-wallet')
+
+    # returns True if the task got accepted, False if the queue is full
+    def submit(self, function, *args, **kwargs):
+        return self.submitOrdered(None, function, *args, **kwargs)
+
+    # key is the user the operation belongs to
+    def submitOrdered(self, key, function, *args, **kwargs):
+        return KeyedSerialExecutor.submit(self, key, function, *args, **kwargs)
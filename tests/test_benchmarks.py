@@ -0,0 +1,52 @@
+import os
+import io
+import tempfile
+import unittest
+import warnings
+
+from contextlib import redirect_stdout
+
+from ptbtest import Mockbot
+
+from slateboy.slateboy import SlateBoy
+
+from benchmarks.handlers import (
+    setupTranslations, percentile, run, Workload,
+    BenchPersonality, LatencyWalletProvider, main)
+
+
+class TestHandlerBenchmark(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    # the benchmark keeps working as the handlers evolve
+    def test_run(self):
+        warnings.simplefilter('ignore')
+        setupTranslations()
+        bot = Mockbot()
+        slateboy = SlateBoy(
+            'slate-boy', '', BenchPersonality(), LatencyWalletProvider(),
+            bot=bot)
+        slateboy.initiate()
+        updates = Workload(bot, users=3, seed=1).generate(60)
+        results = run(slateboy, updates, concurrency=2)
+        self.assertEqual(results['updates'], 60)
+        self.assertEqual(results['errors'], {})
+        self.assertEqual(
+            sorted(results['handlers'].keys()),
+            ['balance', 'deposit', 'group', 's1', 's2', 'withdraw'])
+
+    # recorded wallet session played back offline
+    def test_record_replay(self):
+        warnings.simplefilter('ignore')
+        path = os.path.join(tempfile.mkdtemp(), 'wallet.jsonl.gz')
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(main(['--updates', '30', '--record', path]), 0)
+            self.assertEqual(main(['--updates', '30', '--replay', path,
+                                   '--replay-scale', '0']), 0)
+        self.assertNotIn('errors', out.getvalue())
@@ -0,0 +1,67 @@
+import unittest
+
+from unittest.mock import patch
+
+from slateboy.breaker import (
+    CircuitBreaker, BREAKER_CLOSED, BREAKER_OPEN, BREAKER_HALF_OPEN)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.P = patch('slateboy.breaker.time.monotonic',
+                       side_effect=lambda: self.now)
+        self.P.start()
+        self.breaker = CircuitBreaker(
+            failure_threshold=3, reset_timeout=5, max_reset_timeout=20)
+
+    def tearDown(self):
+        self.P.stop()
+
+    def test_opens_after_consecutive_failures(self):
+        for i in range(2):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+
+        # success resets the count
+        self.breaker.recordSuccess()
+        for i in range(2):
+            self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, BREAKER_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertFalse(self.breaker.isAvailable())
+
+    def test_probe_with_backoff(self):
+        for i in range(3):
+            self.breaker.recordFailure()
+
+        # single probe once the backoff elapsed
+        self.now += 5
+        self.assertTrue(self.breaker.isAvailable())
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, BREAKER_HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        # failed probes double the backoff up to the maximum
+        self.breaker.recordFailure()
+        self.now += 5
+        self.assertFalse(self.breaker.allow())
+        self.now += 5
+        self.assertTrue(self.breaker.allow())
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.backoff, 20)
+        self.now += 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.backoff, 20)
+
+        # recovered
+        self.now += 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.recordSuccess()
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+        self.assertEqual(self.breaker.backoff, 5)
@@ -0,0 +1,317 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+from unittest.mock import patch, MagicMock
+
+from grinmw.wallet_v3 import WalletError
+
+from requests.exceptions import ConnectTimeout
+
+from slateboy.core_wallet import CoreWallet, AsyncCoreWallet, WALLET_UNAVAILABLE
+from slateboy.translations import t
+
+
+class TestCoreWallet(unittest.TestCase):
+    def setUp(self):
+        self.P = patch('slateboy.core_wallet.PooledWalletV3')
+        self.PooledWalletV3 = self.P.start()
+        self.owner = self.PooledWalletV3.return_value
+        self.owner.open_wallet.return_value = 'token'
+        self.owner.retrieve_summary_info.return_value = {
+            'last_confirmed_height': 1000}
+
+    def tearDown(self):
+        self.P.stop()
+
+    # the session is opened once and reused by the consecutive calls
+    def test_session_reused(self):
+        wallet = CoreWallet('secret')
+        for i in range(5):
+            success, reason = wallet.isReady()
+            self.assertTrue(success)
+        self.assertEqual(self.owner.init_secure_api.call_count, 1)
+        self.assertEqual(self.owner.open_wallet.call_count, 1)
+        self.owner.close_wallet.assert_not_called()
+
+    # nothing is sent to the wallet until the first call
+    def test_lazy_connection(self):
+        wallet = CoreWallet('secret')
+        self.owner.init_secure_api.assert_not_called()
+        success, reason = wallet.isReady()
+        self.assertTrue(success)
+        self.assertEqual(self.owner.init_secure_api.call_count, 1)
+
+    # the wallet still starting, the warmup keeps trying
+    def test_warmup(self):
+        wallet = CoreWallet('secret', warmup_delay=0)
+        self.owner.init_secure_api.side_effect = [
+            ConnectionError(), ConnectionError(), 'shared secret']
+        self.assertEqual(wallet.warmup(), (True, None))
+        self.assertEqual(self.owner.init_secure_api.call_count, 3)
+
+        # the session is ready for the calls
+        wallet.isReady()
+        self.assertEqual(self.owner.open_wallet.call_count, 1)
+
+    def test_warmup_gives_up(self):
+        wallet = CoreWallet('secret', warmup_retries=3, warmup_delay=0)
+        self.owner.init_secure_api.side_effect = ConnectionError('refused')
+        success, reason = wallet.warmup()
+        self.assertFalse(success)
+        self.assertEqual(reason, 'refused')
+        self.assertEqual(self.owner.init_secure_api.call_count, 3)
+
+    # legacy mode opens and closes the wallet around every call
+    def test_no_session(self):
+        wallet = CoreWallet('secret', keep_session=False)
+        for i in range(3):
+            wallet.isReady()
+        self.assertEqual(self.owner.open_wallet.call_count, 4)
+        self.assertEqual(self.owner.close_wallet.call_count, 3)
+
+    # session is re-opened if the token got rejected by the wallet
+    def test_session_reopened_on_token_error(self):
+        wallet = CoreWallet('secret')
+        error = WalletError(
+            'retrieve_summary_info', {}, -32099, 'Invalid token')
+        self.owner.retrieve_summary_info.side_effect = [
+            error, {'last_confirmed_height': 1000}]
+        success, reason = wallet.isReady()
+        self.assertTrue(success)
+        self.assertEqual(self.owner.init_secure_api.call_count, 2)
+        self.assertEqual(self.owner.open_wallet.call_count, 2)
+
+    # other wallet errors are not retried
+    def test_session_not_reopened_on_other_error(self):
+        wallet = CoreWallet('secret')
+        error = WalletError(
+            'retrieve_summary_info', {}, -32099, 'Not enough funds')
+        self.owner.retrieve_summary_info.side_effect = error
+        success, reason = wallet.isReady()
+        self.assertFalse(success)
+        self.assertEqual(reason, str(error))
+        self.assertEqual(self.owner.open_wallet.call_count, 1)
+
+    # idle session gets replaced by a fresh one
+    def test_session_idle_timeout(self):
+        wallet = CoreWallet('secret', session_idle_timeout=10)
+        wallet.isReady()
+        wallet.session_last_used -= 11
+        wallet.isReady()
+        self.assertEqual(self.owner.open_wallet.call_count, 2)
+        self.assertEqual(self.owner.close_wallet.call_count, 1)
+
+    # routine sync continues from the last scanned height minus the margin
+    def test_sync_incremental(self):
+        path = os.path.join(tempfile.mkdtemp(), 'sync.json')
+        wallet = CoreWallet('secret', sync_state_path=path, reorg_margin=60)
+        self.owner.node_height.return_value = {'height': '1000'}
+        success, reason = wallet.sync()
+        self.assertTrue(success)
+        self.owner.scan.assert_called_with(
+            start_height=0, delete_unconfirmed=False)
+
+        self.owner.node_height.return_value = {'height': '1010'}
+        success, reason = wallet.sync()
+        self.assertTrue(success)
+        self.owner.scan.assert_called_with(
+            start_height=940, delete_unconfirmed=False)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['last_scanned_height'], 1010)
+
+        # survives the restart
+        wallet = CoreWallet('secret', sync_state_path=path, reorg_margin=60)
+        self.assertEqual(wallet.last_scanned_height, 1010)
+
+        # explicit full rescan
+        success, reason = wallet.sync(full=True)
+        self.assertTrue(success)
+        self.owner.scan.assert_called_with(
+            start_height=0, delete_unconfirmed=False)
+
+    # the path of SlateBoy is used unless the wallet has its own
+    def test_sync_state_path(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'data', 'sync.json')
+        wallet = CoreWallet('secret')
+        wallet.setSyncStatePath(path)
+        self.owner.node_height.return_value = {'height': '1000'}
+        self.assertEqual(wallet.sync(), (True, None))
+        with open(path) as f:
+            self.assertEqual(json.load(f)['last_scanned_height'], 1000)
+
+        wallet = CoreWallet('secret')
+        wallet.setSyncStatePath(path)
+        self.assertEqual(wallet.last_scanned_height, 1000)
+
+        own_path = os.path.join(directory, 'own.json')
+        wallet = CoreWallet('secret', sync_state_path=own_path)
+        wallet.setSyncStatePath(path)
+        self.assertEqual(wallet.sync_state_path, own_path)
+        self.assertIsNone(wallet.last_scanned_height)
+
+    # failed scan does not move the last scanned height
+    def test_sync_failed(self):
+        wallet = CoreWallet('secret')
+        wallet.last_scanned_height = 500
+        self.owner.node_height.return_value = {'height': '1000'}
+        self.owner.scan.side_effect = WalletError(
+            'scan', {}, -32099, 'Node unavailable')
+        success, reason = wallet.sync()
+        self.assertFalse(success)
+        self.assertEqual(wallet.last_scanned_height, 500)
+
+    # unreachable wallet opens the breaker, the calls are rejected
+    # without waiting for the timeouts
+    def test_circuit_breaker(self):
+        wallet = CoreWallet('secret')
+        self.owner.retrieve_summary_info.side_effect = ConnectionError()
+        for i in range(5):
+            success, reason = wallet.isReady()
+            self.assertFalse(success)
+        self.assertFalse(wallet.isAvailable())
+        self.assertEqual(self.owner.retrieve_summary_info.call_count, 5)
+
+        success, reason = wallet.isReady()
+        self.assertEqual(reason, t('slateboy.msg_wallet_unavailable'))
+        self.assertEqual(self.owner.retrieve_summary_info.call_count, 5)
+
+    # the wallet rejecting the call is still a reachable wallet
+    def test_circuit_breaker_wallet_error(self):
+        wallet = CoreWallet('secret')
+        self.owner.retrieve_summary_info.side_effect = WalletError(
+            'retrieve_summary_info', {}, -32099, 'Not enough funds')
+        for i in range(10):
+            wallet.isReady()
+        self.assertTrue(wallet.isAvailable())
+
+        # the Err result WalletV3 fails to unpack
+        self.owner.retrieve_summary_info.side_effect = KeyError('Ok')
+        for i in range(10):
+            success, reason = wallet.isReady()
+            self.assertFalse(success)
+        self.assertTrue(wallet.isAvailable())
+
+    # timeouts and the server errors mean the wallet did not answer
+    def test_circuit_breaker_transport_errors(self):
+        for error in [ConnectTimeout(), WalletError(
+                'retrieve_summary_info', {}, 502, 'Bad Gateway')]:
+            wallet = CoreWallet('secret')
+            self.owner.retrieve_summary_info.side_effect = error
+            for i in range(5):
+                self.assertEqual(
+                    wallet.isReady(), (False, t(WALLET_UNAVAILABLE)))
+            self.assertFalse(wallet.isAvailable())
+
+        # the handlers always have a reason to show
+        wallet = CoreWallet('secret')
+        self.owner.issue_invoice_tx.side_effect = ConnectTimeout()
+        self.assertEqual(
+            wallet.invoice(1), (False, t(WALLET_UNAVAILABLE), None, None))
+
+
+    # already decoded slate is not sent to the wallet for decoding again
+    def test_finalize_decoded_slate(self):
+        wallet = CoreWallet('secret')
+        slate = {'id': 'tx_id', 'sta': 'S2'}
+        self.owner.finalize_tx.return_value = {'id': 'tx_id', 'sta': 'S3'}
+        success, reason, tx_id = wallet.finalize('slatepack', slate=slate)
+        self.assertTrue(success)
+        self.assertEqual(tx_id, 'tx_id')
+        self.owner.slate_from_slatepack_message.assert_not_called()
+        self.owner.finalize_tx.assert_called_once_with(slate)
+        self.owner.post_tx.assert_called_once()
+
+        # without the slate it has to be decoded
+        self.owner.slate_from_slatepack_message.return_value = slate
+        wallet.finalize('slatepack', post=False)
+        self.owner.slate_from_slatepack_message.assert_called_once_with(
+            'slatepack', [0])
+
+    # the inputs are locked before the next withdrawal can plan
+    def test_send_locks_outputs(self):
+        wallet = CoreWallet('secret', target_outputs=8)
+        self.owner.retrieve_outputs.return_value = [{'output': {
+            'value': '1000000000000', 'status': 'Unspent', 'height': '1'}}]
+        self.owner.node_height.return_value = {'height': '1000'}
+        self.owner.init_send_tx.return_value = {'id': 'tx_id'}
+        self.owner.create_slatepack_message.return_value = 'slatepack'
+        held = []
+        self.owner.tx_lock_outputs.side_effect = \
+            lambda slate: held.append(wallet.output_manager.lock.locked())
+        success, reason, slatepack, tx_id = wallet.send(10)
+        self.assertTrue(success)
+        self.owner.tx_lock_outputs.assert_called_once_with({'id': 'tx_id'})
+        self.assertEqual(held, [True])
+        # GRIN in, nanogrin to the Owner API
+        self.assertEqual(
+            self.owner.init_send_tx.call_args[0][0]['amount'], 10000000000)
+
+        # the tx is not left behind with its inputs unlocked
+        self.owner.tx_lock_outputs.side_effect = WalletError(
+            'tx_lock_outputs', None, None, 'failed')
+        success, reason, slatepack, tx_id = wallet.send(10)
+        self.assertFalse(success)
+        self.owner.cancel_tx.assert_called_once_with(tx_slate_id='tx_id')
+
+    # the output manager is opt-in
+    def test_send_without_output_manager(self):
+        wallet = CoreWallet('secret')
+        self.assertIsNone(wallet.output_manager)
+        self.owner.init_send_tx.return_value = {'id': 'tx_id'}
+        held = []
+        self.owner.tx_lock_outputs.side_effect = \
+            lambda slate: held.append(wallet.send_lock.locked())
+        success, reason, slatepack, tx_id = wallet.send(1000)
+        self.assertTrue(success)
+        self.assertTrue(
+            self.owner.init_send_tx.call_args[0][0]['selection_strategy_is_use_all'])
+        self.owner.retrieve_outputs.assert_not_called()
+        # the inputs are locked all the same
+        self.owner.tx_lock_outputs.assert_called_once_with({'id': 'tx_id'})
+        self.assertEqual(held, [True])
+
+    # the amounts below one nanogrin never reach the wallet
+    def test_amount_units(self):
+        wallet = CoreWallet('secret')
+        self.owner.issue_invoice_tx.return_value = {'id': 'tx_id'}
+        self.assertTrue(wallet.invoice(1.5)[0])
+        self.assertEqual(
+            self.owner.issue_invoice_tx.call_args[0][0]['amount'], 1500000000)
+
+        success, reason, slatepack, tx_id = wallet.invoice(0.0000000001)
+        self.assertFalse(success)
+        self.assertIn('Invalid amount', reason)
+        success, reason, slatepack, tx_id = wallet.send(0.0000000001)
+        self.assertFalse(success)
+        self.owner.issue_invoice_tx.assert_called_once()
+        self.owner.init_send_tx.assert_not_called()
+
+    # one lookup per pending transaction, never the whole history
+    def test_retrieve_txs(self):
+        wallet = CoreWallet('secret')
+        self.owner.batch.return_value = [
+            (True, [{'tx_slate_id': 'a'}]), (True, [{'tx_slate_id': 'b'}])]
+        success, reason, txs = wallet.retrieveTxs(tx_ids=['a', 'b'])
+        self.assertTrue(success)
+        self.assertEqual(txs, [{'tx_slate_id': 'a'}, {'tx_slate_id': 'b'}])
+        requests = self.owner.batch.call_args[0][0]
+        self.assertEqual(
+            [(method, params['tx_slate_id']) for method, params in requests],
+            [('retrieve_txs', 'a'), ('retrieve_txs', 'b')])
+        self.owner.retrieve_txs.assert_not_called()
+
+    # coroutines of the async provider run concurrently on the executor
+    def test_async_core_wallet(self):
+        wallet = AsyncCoreWallet('secret', max_workers=2)
+
+        async def run():
+            return await asyncio.gather(
+                *[wallet.isReady() for i in range(10)])
+
+        results = asyncio.run(run())
+        wallet.close()
+        self.assertEqual(results, [(True, None)] * 10)
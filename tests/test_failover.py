@@ -0,0 +1,155 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from slateboy.failover import MultiCoreWallet
+from slateboy.core_wallet import WALLET_UNAVAILABLE
+from slateboy.translations import t
+from slateboy.fake_wallet import FakeWalletServer
+from slateboy.transport import WalletTransport
+
+
+class FakeMultiCoreWallet(MultiCoreWallet):
+    def __init__(self, wallets, warmup=True, **kwargs):
+        self.wallets = wallets
+        endpoints = [{'api_url': str(i)} for i in range(len(wallets))]
+        MultiCoreWallet.__init__(self, endpoints, **kwargs)
+        if warmup:
+            self.warmup()
+
+    def factory(self, options):
+        wallet = self.wallets[int(options['api_url'])]
+        if wallet is None:
+            def unreachable():
+                raise ConnectionError()
+            return unreachable
+        return lambda: wallet
+
+
+def wallet():
+    wallet = MagicMock()
+    wallet.isReady.return_value = True, None
+    wallet.isAvailable.return_value = True
+    return wallet
+
+
+class TestMultiCoreWallet(unittest.TestCase):
+    # read-only calls are spread over the healthy nodes
+    def test_read_only_round_robin(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        for w in wallets:
+            w.decodeSlatepack.return_value = True, None, {'id': 'x'}
+        for i in range(4):
+            self.assertTrue(provider.decodeSlatepack('slatepack')[0])
+        self.assertEqual(wallets[0].decodeSlatepack.call_count, 2)
+        self.assertEqual(wallets[1].decodeSlatepack.call_count, 2)
+
+        # unreachable node is skipped
+        wallets[0].decodeSlatepack.return_value = False, t(WALLET_UNAVAILABLE), None
+        for i in range(2):
+            self.assertTrue(provider.decodeSlatepack('slatepack')[0])
+        self.assertFalse(provider.nodes[0].healthy)
+
+    # state-changing calls stay on the primary
+    def test_primary_pinned(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        wallets[0].send.return_value = True, None, 'slatepack', 'tx_id'
+        for i in range(3):
+            provider.send(1000)
+        self.assertEqual(wallets[0].send.call_count, 3)
+        wallets[1].send.assert_not_called()
+
+    # wallet errors are answers, not failures
+    def test_wallet_error_no_failover(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        wallets[0].send.return_value = False, 'Not enough funds', None, None
+        self.assertEqual(provider.send(1000)[1], 'Not enough funds')
+        self.assertEqual(provider.primary, 0)
+
+    # rejected before reaching the wallet, retried on the new primary
+    def test_failover(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        wallets[0].invoice.return_value = False, t(WALLET_UNAVAILABLE), None, None
+        wallets[0].isAvailable.return_value = False
+        wallets[1].invoice.return_value = True, None, 'slatepack', 'tx_id'
+        self.assertEqual(provider.invoice(1000), (True, None, 'slatepack', 'tx_id'))
+        self.assertEqual(provider.primary, 1)
+
+    # timed out, it may have reached the wallet, not sent twice
+    def test_failover_no_retry(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        wallets[0].send.return_value = False, t(WALLET_UNAVAILABLE), None, None
+        self.assertEqual(provider.send(1000)[1], t(WALLET_UNAVAILABLE))
+        self.assertEqual(provider.primary, 1)
+        wallets[1].send.assert_not_called()
+
+        # answered without a reason, the node is fine
+        wallets[1].send.return_value = False, None, None, None
+        provider.send(1000)
+        self.assertEqual(provider.primary, 1)
+        self.assertTrue(provider.nodes[1].healthy)
+
+    # unreachable primary at the start
+    def test_primary_down_at_start(self):
+        wallets = [None, wallet()]
+        provider = FakeMultiCoreWallet(wallets)
+        self.assertEqual(provider.primary, 1)
+        self.assertEqual(provider.isReady(), (True, None))
+
+    # health check moves the primary and brings it back
+    def test_health_check(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets, health_interval=0)
+        wallets[0].isReady.return_value = False, None
+        self.assertEqual(provider.isReady(), (True, None))
+        self.assertEqual(provider.primary, 1)
+
+        wallets[1].isReady.return_value = False, None
+        self.assertEqual(provider.isReady(), (False, None))
+
+        wallets[0].isReady.return_value = True, None
+        self.assertEqual(provider.isReady(), (True, None))
+        self.assertEqual(provider.primary, 0)
+
+
+    # nothing is contacted until the warmup
+    def test_lazy(self):
+        wallets = [wallet(), wallet()]
+        provider = FakeMultiCoreWallet(wallets, warmup=False)
+        wallets[0].isReady.assert_not_called()
+        self.assertEqual(provider.warmup(), (True, None))
+        wallets[0].isReady.assert_called_once()
+
+
+class TestMultiCoreWalletFakeServers(unittest.TestCase):
+    def setUp(self):
+        self.servers = [FakeWalletServer(seed=i).start() for i in range(2)]
+        self.transport = WalletTransport()
+        self.provider = MultiCoreWallet(
+            [{'api_url': server.owner_url,
+              'foreign_api_url': server.foreign_url}
+             for server in self.servers],
+            api_password='', transport=self.transport)
+        self.assertEqual(self.provider.warmup(), (True, None))
+
+    def tearDown(self):
+        self.transport.close()
+        for server in self.servers:
+            server.stop()
+
+    # primary goes away, the next withdrawal lands on the replica
+    def test_primary_lost(self):
+        success, reason, slatepack, tx_id = self.provider.send(1)
+        self.assertEqual(tx_id, '00000000-0000-0000-0000-000000000001')
+
+        self.servers[0].stop()
+        success, reason, slatepack, tx_id = self.provider.send(1)
+        self.assertFalse(success)
+        success, reason, slatepack, tx_id = self.provider.send(1)
+        self.assertTrue(success)
+        self.assertEqual(tx_id, '00000000-0000-0001-0000-000000000001')
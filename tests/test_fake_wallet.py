@@ -0,0 +1,234 @@
+import time
+import unittest
+
+from slateboy.core_wallet import CoreWallet
+from slateboy.fake_wallet import FakeWalletServer
+from slateboy.slatepack import parseSlatepack, encodeSlatepack
+from slateboy.transport import WalletTransport
+
+
+class TestFakeWallet(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeWalletServer(
+            api_password='secret', wallet_password='pass', seed=7).start()
+        self.transport = WalletTransport()
+        self.wallet = CoreWallet(
+            'secret', api_url=self.server.owner_url,
+            foreign_api_url=self.server.foreign_url,
+            wallet_password='pass', transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_ready_and_sync(self):
+        self.assertEqual(self.wallet.isReady(), (True, None))
+        self.assertEqual(self.wallet.sync(), (True, None))
+        self.assertEqual(self.wallet.last_scanned_height, 1000)
+
+    # user sends, the bot receives and the user finalizes
+    def test_deposit_flow(self):
+        slatepack = encodeSlatepack(
+            '4bea91b8-19b8-4f00-81f9-25b6edd81537', 'S1', amt=1337000000)
+        success, reason, response, tx_id = self.wallet.receive(slatepack)
+        self.assertTrue(success)
+        self.assertEqual(tx_id, '4bea91b8-19b8-4f00-81f9-25b6edd81537')
+        valid, reason, header = parseSlatepack(response)
+        self.assertEqual(header['sta'], 'S2')
+
+        success, reason, txs = self.wallet.retrieveTxs(tx_ids=[tx_id])
+        self.assertEqual(len(txs), 1)
+        self.assertEqual(txs[0]['tx_type'], 'TxReceived')
+        self.assertEqual(txs[0]['amount_credited'], '1337000000')
+
+    # the bot sends, the user receives and the bot finalizes
+    def test_withdrawal_flow(self):
+        success, reason, slatepack, tx_id = self.wallet.send(1)
+        self.assertTrue(success)
+        valid, reason, header = parseSlatepack(slatepack)
+        self.assertEqual(header['sta'], 'S1')
+        self.assertEqual(header['id'], tx_id)
+        self.assertEqual(header['amt'], '1000000000')
+
+        response = encodeSlatepack(tx_id, 'S2', amt=1000000000)
+        success, reason, finalized_tx_id = self.wallet.finalize(response)
+        self.assertTrue(success)
+        self.assertEqual(finalized_tx_id, tx_id)
+
+        success, reason, txs = self.wallet.retrieveTxs(tx_ids=[tx_id])
+        self.assertTrue(txs[0]['confirmed'])
+
+    # the change gets split, the next withdrawals can run concurrently
+    def test_concurrent_withdrawals(self):
+        self.wallet = CoreWallet(
+            'secret', api_url=self.server.owner_url,
+            foreign_api_url=self.server.foreign_url,
+            wallet_password='pass', transport=self.transport,
+            target_outputs=8)
+        success, reason, slatepack, tx_id = self.wallet.send(100)
+        self.assertTrue(success)
+        # the only output is locked now
+        success, reason, slatepack, second_tx_id = self.wallet.send(1)
+        self.assertFalse(success)
+        self.assertIn('1 locked', reason)
+
+        self.wallet.finalize(encodeSlatepack(tx_id, 'S2', amt=100000000000))
+        self.server.state.mine(10)
+        tx_ids = []
+        for i in range(4):
+            success, reason, slatepack, tx_id = self.wallet.send(1)
+            self.assertTrue(success)
+            tx_ids.append(tx_id)
+        self.assertEqual(len(set(tx_ids)), 4)
+
+    # like the grin-wallet, only tx_lock_outputs locks the inputs,
+    # the send calls it without the output manager too
+    def test_lock_outputs(self):
+        success, reason, slatepack, tx_id = self.wallet.send(1)
+        self.assertTrue(success)
+        statuses = [o['status'] for o in self.server.state.outputs]
+        self.assertEqual(statuses, ['Locked', 'Unconfirmed'])
+
+        # the next withdrawal does not pick the same inputs
+        success, reason, slatepack, second_tx_id = self.wallet.send(1)
+        self.assertFalse(success)
+        self.assertIn('Not enough funds', reason)
+        self.assertEqual(self.wallet.releaseLock(tx_id), (True, None))
+
+        # the finalization locks the inputs of the sends made elsewhere
+        slate = self.server.state.init_send_tx({'args': {'amount': 1000000000}})
+        statuses = [o['status'] for o in self.server.state.outputs]
+        self.assertEqual(statuses, ['Unspent', 'Unconfirmed'])
+        response = encodeSlatepack(slate['id'], 'S2', amt=1000000000)
+        success, reason, finalized_tx_id = self.wallet.finalize(
+            response, lock=True, post=False)
+        self.assertTrue(success)
+        statuses = [o['status'] for o in self.server.state.outputs]
+        self.assertEqual(statuses, ['Locked', 'Unconfirmed'])
+
+    # the failed methods answer with the Err result, the broken
+    # requests with the JSON-RPC error
+    def test_error_responses(self):
+        self.server.setError('retrieve_txs', 'node offline', count=1)
+        response = self.server.execute({'id': 3, 'method': 'retrieve_txs'}, {})
+        self.assertEqual(response['result'], {'Err': {'GenericError': 'node offline'}})
+        self.assertNotIn('error', response)
+        response = self.server.execute({'id': 3, 'method': 'tx_lock_outputs'},
+                                       {'slate': {'id': 'unknown'}})
+        self.assertIn('Err', response['result'])
+
+        response = self.server.handle('foreign', {'id': 3, 'method': 'unknown'})
+        self.assertEqual(response['error']['code'], -32099)
+        self.assertNotIn('result', response)
+
+    def test_invoice_and_cancel(self):
+        success, reason, slatepack, tx_id = self.wallet.invoice(5)
+        self.assertTrue(success)
+        valid, reason, header = parseSlatepack(slatepack)
+        self.assertEqual(header['sta'], 'I1')
+        self.assertEqual(self.wallet.releaseLock(tx_id), (True, None))
+        success, reason, txs = self.wallet.retrieveTxs(tx_ids=[tx_id])
+        self.assertEqual(txs[0]['tx_type'], 'TxReceivedCancelled')
+
+    # same seed, same slates
+    def test_deterministic(self):
+        success, reason, slatepack, tx_id = self.wallet.send(1)
+        self.assertEqual(tx_id, '00000000-0000-0007-0000-000000000001')
+
+    # the wallet forgot the session, the provider opens a new one
+    def test_restart(self):
+        self.assertEqual(self.wallet.isReady(), (True, None))
+        self.server.restart()
+        self.assertEqual(self.wallet.isReady(), (True, None))
+
+    def test_error_injection(self):
+        self.server.setError('retrieve_summary_info', 'node offline', count=1)
+        success, reason = self.wallet.isReady()
+        self.assertFalse(success)
+        self.assertIn('node offline', reason)
+        self.assertEqual(self.wallet.isReady(), (True, None))
+
+    def test_latency(self):
+        self.server.setLatency('retrieve_summary_info', 0.2)
+        start = time.monotonic()
+        self.wallet.isReady()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    # the scan outlasts the timeout of the other calls, the timeouts
+    # of one wallet leave those of the shared transport alone
+    def test_scan_timeout(self):
+        wallet = CoreWallet(
+            'secret', api_url=self.server.owner_url,
+            foreign_api_url=self.server.foreign_url,
+            wallet_password='pass', transport=self.transport,
+            api_timeout=0.2)
+        self.server.setLatency('scan', 0.4)
+        self.assertEqual(wallet.sync(full=True), (True, None))
+        self.assertEqual(wallet.last_scanned_height, 1000)
+        self.assertEqual(self.transport.getTimeout(self.server.owner_url), 60)
+
+        self.server.setLatency('retrieve_summary_info', 0.4)
+        success, reason = wallet.isReady()
+        self.assertFalse(success)
+
+    # readiness and the lookups in a single encrypted exchange
+    def test_batch(self):
+        success, reason, slatepack, tx_id = self.wallet.invoice(5)
+        exchanges = self.server.calls['encrypted_request_v3']
+        ready, txs, released = self.wallet.batch([
+            ('isReady', [], {}),
+            ('retrieveTxs', [], {'tx_ids': [tx_id, 'unknown']}),
+            ('releaseLock', [tx_id], {})])
+        self.assertEqual(self.server.calls['encrypted_request_v3'], exchanges + 1)
+        self.assertTrue(self.wallet.wallet.batch_supported)
+        self.assertEqual(ready, (True, None))
+        self.assertEqual(len(txs[2]), 1)
+        self.assertEqual(txs[2][0]['tx_type'], 'TxReceived')
+        self.assertEqual(released, (True, None))
+
+        self.server.setError('retrieve_txs', 'node offline', count=1)
+        ready, txs = self.wallet.batch([
+            ('isReady', [], {}),
+            ('retrieveTxs', [], {'tx_ids': [tx_id]})])
+        self.assertEqual(ready, (True, None))
+        self.assertFalse(txs[0])
+        self.assertIn('node offline', txs[1])
+
+    # the session expired in between, the whole batch is repeated
+    def test_batch_restart(self):
+        self.assertEqual(self.wallet.isReady(), (True, None))
+        self.server.restart()
+        ready, txs = self.wallet.batch([
+            ('isReady', [], {}),
+            ('retrieveTxs', [], {})])
+        self.assertEqual(ready, (True, None))
+        self.assertEqual(txs, (True, None, []))
+
+    def test_unauthorized(self):
+        wallet = CoreWallet(
+            'wrong', api_url=self.server.owner_url,
+            foreign_api_url=self.server.foreign_url,
+            transport=self.transport)
+        success, reason = wallet.isReady()
+        self.assertFalse(success)
+        self.assertIn('Unauthorized', reason)
+
+    # the wallet answers the batch with a single error, the requests
+    # are made one by one and the batch is not tried again
+    def test_batch_unsupported(self):
+        self.server.batches = False
+        success, reason, slatepack, tx_id = self.wallet.invoice(5)
+        exchanges = self.server.calls['encrypted_request_v3']
+        calls = [
+            ('isReady', [], {}),
+            ('retrieveTxs', [], {'tx_ids': [tx_id]})]
+        ready, txs = self.wallet.batch(calls)
+        self.assertEqual(ready, (True, None))
+        self.assertEqual(len(txs[2]), 1)
+        # the rejected batch and one exchange per request
+        self.assertEqual(self.server.calls['encrypted_request_v3'], exchanges + 3)
+        self.assertFalse(self.wallet.wallet.batch_supported)
+
+        ready, txs = self.wallet.batch(calls)
+        self.assertEqual(ready, (True, None))
+        self.assertEqual(self.server.calls['encrypted_request_v3'], exchanges + 5)
@@ -0,0 +1,73 @@
+import unittest
+import warnings
+
+from unittest.mock import MagicMock
+
+from ptbtest import CallbackQueryGenerator
+from ptbtest import ChatGenerator
+from ptbtest import MessageGenerator
+from ptbtest import Mockbot
+from ptbtest import UserGenerator
+
+from slateboy.helpers import RequestContext, getRequest, extractIDs, extractIsBot
+from slateboy.helpers import toNanogrin, toGrin
+
+
+class TestRequestContext(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.mock_bot = Mockbot()
+        self.mg = MessageGenerator(self.mock_bot)
+        self.cqg = CallbackQueryGenerator(self.mock_bot)
+        self.alice = UserGenerator().get_user()
+        self.group = ChatGenerator().get_chat(type='group')
+
+    def test_message(self):
+        update = self.mg.get_message(
+            text='/balance', user=self.alice, chat=self.group)
+        request = RequestContext(update)
+        self.assertEqual(request.chat_id, self.group.id)
+        self.assertEqual(request.user_id, self.alice.id)
+        self.assertFalse(request.is_bot)
+        self.assertEqual(request.chat_type, 'group')
+        self.assertIsNone(request.requested_amount)
+        self.assertEqual(extractIDs(update), (self.group.id, self.alice.id))
+        self.assertFalse(extractIsBot(update))
+
+    # the callback queries carry no message of their own
+    def test_callback_query(self):
+        sent = self.mg.get_message(text='eula', chat=self.group).message
+        update = self.cqg.get_callback_query(
+            message=sent, data='eula-approve-v1', user=self.alice)
+        request = RequestContext(update)
+        self.assertEqual(request.user_id, self.alice.id)
+        self.assertEqual(request.chat_id, self.group.id)
+
+    # built by the first decorator, reused by the rest
+    def test_get_request(self):
+        update = MagicMock()
+        update.message.chat.id = 1
+        update.message.from_user.id = 2
+        kwargs = {}
+        request = getRequest(update, kwargs)
+        self.assertIs(kwargs['request'], request)
+        self.assertIs(getRequest(update, kwargs), request)
+        self.assertEqual((request.chat_id, request.user_id), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestAmounts(unittest.TestCase):
+    def test_to_nanogrin(self):
+        self.assertEqual(toNanogrin(12.3), 12300000000)
+        self.assertEqual(toNanogrin('0.000000001'), 1)
+        self.assertEqual(toNanogrin(2), 2000000000)
+        self.assertIsNone(toNanogrin(0.0000000001))
+        self.assertIsNone(toNanogrin('max'))
+        self.assertIsNone(toNanogrin(float('inf')))
+
+    def test_to_grin(self):
+        self.assertEqual(toGrin('6000000000'), 6.0)
+        self.assertEqual(toGrin(toNanogrin(12.3)), 12.3)
@@ -0,0 +1,89 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from slateboy.invoice_pool import InvoicePool
+
+
+class TestInvoicePool(unittest.TestCase):
+    def setUp(self):
+        self.counter = 0
+
+    def invoice(self, amount):
+        self.counter += 1
+        slatepack = 'slatepack-{}-{}'.format(amount, self.counter)
+        tx_id = 'tx-{}'.format(self.counter)
+        return True, None, slatepack, tx_id
+
+    def test_top_up_and_take(self):
+        pool = InvoicePool([1.0, 5.0], size=2)
+        issued = pool.topUp(self.invoice)
+        self.assertEqual(issued, 4)
+        self.assertEqual(pool.available(1.0), 2)
+
+        slatepack, tx_id = pool.take(5.0)
+        self.assertEqual(slatepack, 'slatepack-5.0-3')
+        self.assertEqual(tx_id, 'tx-3')
+        self.assertEqual(pool.available(5.0), 1)
+
+        # unknown amount is not served from the pool
+        self.assertEqual(pool.take(3.0), (None, None))
+
+        # only the missing invoice is issued
+        issued = pool.topUp(self.invoice)
+        self.assertEqual(issued, 1)
+        self.assertEqual(pool.available(5.0), 2)
+
+    def test_top_up_stops_on_wallet_failure(self):
+        pool = InvoicePool([1.0], size=3)
+        invoice = MagicMock(return_value=(False, 'wallet ricked', None, None))
+        self.assertEqual(pool.topUp(invoice), 0)
+        self.assertEqual(invoice.call_count, 1)
+        self.assertEqual(pool.available(1.0), 0)
+
+    def test_expire(self):
+        pool = InvoicePool([1.0], size=2, max_age=60)
+        pool.topUp(self.invoice)
+
+        # pretend the first invoice is old
+        slatepack, tx_id, ts = pool.pool[1.0][0]
+        pool.pool[1.0][0] = slatepack, tx_id, ts - 61
+
+        releaseLock = MagicMock(return_value=(True, None))
+        self.assertEqual(pool.expire(releaseLock), 1)
+        releaseLock.assert_called_once_with('tx-1')
+        self.assertEqual(pool.take(1.0), ('slatepack-1.0-2', 'tx-2'))
+
+    # stale invoices skipped by take are cancelled by the next expire
+    def test_take_skips_stale(self):
+        pool = InvoicePool([1.0], size=1, max_age=60)
+        pool.topUp(self.invoice)
+        slatepack, tx_id, ts = pool.pool[1.0][0]
+        pool.pool[1.0][0] = slatepack, tx_id, ts - 61
+        self.assertEqual(pool.take(1.0), (None, None))
+
+        releaseLock = MagicMock(return_value=(False, 'wallet ricked'))
+        self.assertEqual(pool.expire(releaseLock), 0)
+        self.assertEqual(pool.expired, ['tx-1'])
+
+    # the pool lives in the state dict, a new pool picks it up
+    def test_restore(self):
+        state = {}
+        pool = InvoicePool([1.0, 5.0], size=1, state=state)
+        pool.topUp(self.invoice)
+        pool.take(1.0)
+        self.assertEqual([entry[:3] for entry in state['invoices']],
+                         [[5.0, 'slatepack-5.0-2', 'tx-2']])
+
+        pool = InvoicePool([5.0], size=1, state=state)
+        self.assertEqual(pool.take(5.0), ('slatepack-5.0-2', 'tx-2'))
+
+        # an amount which is no longer a bucket is cancelled
+        pool.topUp(self.invoice)
+        pool = InvoicePool([1.0], size=1, state=state)
+        self.assertEqual(pool.available(1.0), 0)
+        self.assertEqual(state['expired'], ['tx-3'])
+        releaseLock = MagicMock(return_value=(True, None))
+        self.assertEqual(pool.expire(releaseLock), 1)
+        releaseLock.assert_called_once_with('tx-3')
+        self.assertEqual(state['expired'], [])
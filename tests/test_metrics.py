@@ -0,0 +1,50 @@
+import unittest
+import urllib.request
+
+from slateboy.metrics import Histogram, Metrics, MetricsServer, NOOP_TIMER
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram(buckets=[0.1, 1.0])
+        self.assertIsNone(histogram.quantile(0.5))
+        for seconds in [0.05, 0.05, 0.5, 5.0]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.75), 1.0)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+
+    # disabled metrics do not record anything
+    def test_disabled(self):
+        metrics = Metrics(enabled=False)
+        self.assertIs(metrics.time('x_seconds', 'handler', 'h'), NOOP_TIMER)
+        metrics.observe('x_seconds', 'handler', 'h', 1.0)
+        self.assertEqual(metrics.histograms, {})
+
+    def test_render(self):
+        metrics = Metrics(buckets=[0.1, 1.0])
+        with metrics.time('x_seconds', 'handler', 'h'):
+            pass
+        metrics.observe('x_seconds', 'handler', 'h', 0.5)
+        text = metrics.render()
+        self.assertIn('# TYPE x_seconds histogram', text)
+        self.assertIn('x_seconds_bucket{handler="h",le="0.1"} 1', text)
+        self.assertIn('x_seconds_bucket{handler="h",le="1.0"} 2', text)
+        self.assertIn('x_seconds_count{handler="h"} 2', text)
+
+        rows = metrics.summary()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][:3], ('x_seconds', 'h', 2))
+
+    def test_server(self):
+        metrics = Metrics()
+        metrics.observe('x_seconds', 'method', 'isReady', 0.01)
+        server = MetricsServer(metrics, port=0).start()
+        try:
+            with urllib.request.urlopen(server.url) as response:
+                text = response.read().decode()
+        finally:
+            server.stop()
+        self.assertIn('x_seconds_count{method="isReady"} 1', text)
@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+
+from queue import Queue
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+from slateboy.ordering import (
+    KeyedSerialExecutor, KeyedThreadLocks, OrderedDispatcher, updateDataKey)
+
+
+class TestKeyedSerialExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = KeyedSerialExecutor(workers=4, max_queue=16)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.done = []
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def task(self, key, i):
+        with self.lock:
+            self.running[key] = self.running.get(key, 0) + 1
+            self.max_running[key] = max(
+                self.max_running.get(key, 0), self.running[key])
+        time.sleep(0.02)
+        with self.lock:
+            self.running[key] -= 1
+            self.done.append((key, i))
+
+    # the tasks of one key never overlap and keep their order
+    def test_same_key(self):
+        for i in range(5):
+            self.assertTrue(self.executor.submit('alice', self.task, 'alice', i))
+        self.assertTrue(self.executor.join(5))
+        self.assertEqual(self.done, [('alice', i) for i in range(5)])
+        self.assertEqual(self.max_running['alice'], 1)
+        self.assertEqual(self.executor.queues, {})
+
+    # different keys run in parallel
+    def test_different_keys(self):
+        started = time.monotonic()
+        for key in ['alice', 'bob', 'carol', 'dave']:
+            for i in range(3):
+                self.assertTrue(self.executor.submit(key, self.task, key, i))
+        self.assertTrue(self.executor.join(5))
+        self.assertLess(time.monotonic() - started, 4 * 3 * 0.02)
+        for key in ['alice', 'bob', 'carol', 'dave']:
+            self.assertEqual([i for k, i in self.done if k == key], [0, 1, 2])
+            self.assertEqual(self.max_running[key], 1)
+
+    # waiting tasks of the busy keys count towards the limit
+    def test_queue_limit(self):
+        release = threading.Event()
+        executor = KeyedSerialExecutor(workers=1, max_queue=1)
+        try:
+            self.assertTrue(executor.submit('alice', release.wait, 5))
+            self.assertTrue(executor.submit('alice', release.wait, 5))
+            self.assertFalse(executor.submit('bob', release.wait, 5))
+        finally:
+            release.set()
+            executor.stop()
+        self.assertFalse(executor.submit('bob', release.wait, 5))
+
+    # failing task does not block the rest of its key
+    def test_failing_task(self):
+        def fail():
+            raise ValueError('ricked')
+
+        self.executor.submit('alice', fail)
+        self.executor.submit('alice', self.task, 'alice', 1)
+        self.assertTrue(self.executor.join(5))
+        self.assertEqual(self.done, [('alice', 1)])
+
+    def test_update_data_key(self):
+        message = {'update_id': 1, 'message': {
+            'from': {'id': 42}, 'chat': {'id': -100}}}
+        self.assertEqual(updateDataKey(message), 42)
+        post = {'update_id': 2, 'channel_post': {'chat': {'id': -100}}}
+        self.assertEqual(updateDataKey(post), -100)
+        self.assertIsNone(updateDataKey({'update_id': 3}))
+
+
+class TestKeyedThreadLocks(unittest.TestCase):
+    def test_run(self):
+        locks = KeyedThreadLocks()
+        lock = threading.Lock()
+        running = {'alice': 0, 'bob': 0}
+        max_running = {'alice': 0, 'bob': 0}
+
+        def task(key):
+            with lock:
+                running[key] += 1
+                max_running[key] = max(max_running[key], running[key])
+            time.sleep(0.02)
+            with lock:
+                running[key] -= 1
+            return key
+
+        threads = [threading.Thread(target=locks.run, args=(key, task, key))
+                   for key in ['alice', 'alice', 'alice', 'bob', 'bob']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max_running, {'alice': 1, 'bob': 1})
+        self.assertEqual(locks.run('alice', task, 'alice'), 'alice')
+        self.assertEqual(locks.locks, {})
+
+
+
+class TestOrderedDispatcher(unittest.TestCase):
+    # every update goes through submit under the key of its user
+    def test_process_update(self):
+        submit = MagicMock(return_value=True)
+        rejected = MagicMock()
+        dispatcher = OrderedDispatcher(
+            MagicMock(), Queue(), workers=0, submit=submit, rejected=rejected)
+        update = Update.de_json({'update_id': 1, 'message': {
+            'message_id': 1, 'date': 0, 'text': '/balance',
+            'from': {'id': 42, 'is_bot': False, 'first_name': 'Alice'},
+            'chat': {'id': 42, 'type': 'private'}}}, None)
+        dispatcher.process_update(update)
+        key, function, other_self, submitted = submit.call_args[0]
+        self.assertEqual((key, submitted), (42, update))
+        rejected.assert_not_called()
+
+        # the queue is full
+        submit.return_value = False
+        dispatcher.process_update(update)
+        rejected.assert_called_once_with(update)
+
+        # the errors put in the queue are not ordered
+        dispatcher.process_update(Exception('polling failed'))
+        self.assertEqual(submit.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import time
+import unittest
+import warnings
+
+from i18n import resource_loader
+from i18n import config as i18config
+
+from unittest.mock import patch, Mock, call
+
+from telegram.error import RetryAfter, Unauthorized
+
+from ptbtest import ChatGenerator
+from ptbtest import MessageGenerator
+from ptbtest import Mockbot
+from ptbtest import UserGenerator
+
+from slateboy.slateboy import SlateBoy
+from slateboy.personality import BlankPersonality
+from slateboy.providers import WalletProvider
+from slateboy.outbox import Outbox, OutboxBot, TokenBucket
+
+TRANSLATIONS_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep + '../translations' + os.sep
+i18config.set('file_format', 'json')
+i18config.set('load_path', [TRANSLATIONS_DIRECTORY])
+i18config.set('filename_format', '{namespace}.{locale}.{format}')
+i18config.set('locale', 'en')
+resource_loader.init_json_loader()
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.bot = Mock()
+        self.outbox = None
+
+    def tearDown(self):
+        if self.outbox is not None:
+            self.outbox.stop()
+
+    def start(self, **kwargs):
+        self.outbox = Outbox(self.bot, **kwargs).start()
+        return self.outbox
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        now = bucket.updated
+        self.assertEqual(bucket.delay(now), 0)
+        bucket.take(now)
+        bucket.take(now)
+        self.assertAlmostEqual(bucket.delay(now), 0.1)
+        self.assertEqual(bucket.delay(now + 0.11), 0)
+
+    # the parts of one reply end up in one message
+    def test_coalesce(self):
+        outbox = Outbox(self.bot)
+        outbox.send(1, 'instructions')
+        outbox.send(1, 'slatepack')
+        outbox.send(2, 'elsewhere')
+        outbox.send(1, 'final', reply_markup='buttons')
+        outbox.send(1, 'after')
+        self.outbox = outbox.start()
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual(self.bot.send_message.call_args_list, [
+            call(chat_id=1, text='instructions\n\nslatepack'),
+            call(chat_id=2, text='elsewhere'),
+            call(chat_id=1, text='final', reply_markup='buttons'),
+            call(chat_id=1, text='after')])
+
+    def test_coalesce_size_limit(self):
+        outbox = Outbox(self.bot, max_length=10)
+        for text in ['12345', '123', '12345']:
+            outbox.send(1, text)
+        self.outbox = outbox.start()
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual(self.bot.send_message.call_args_list, [
+            call(chat_id=1, text='12345\n\n123'),
+            call(chat_id=1, text='12345')])
+
+    def test_chat_rate(self):
+        outbox = self.start(chat_rate=20, chat_burst=1, coalesce=False, linger=0)
+        started = time.monotonic()
+        for i in range(4):
+            outbox.send(1, str(i))
+        self.assertTrue(outbox.flush(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.14)
+        self.assertEqual(self.bot.send_message.call_count, 4)
+
+    # the other chats are not held up by a busy one
+    def test_chats_interleave(self):
+        outbox = Outbox(self.bot, chat_rate=5, chat_burst=1, coalesce=False, linger=0)
+        outbox.send(1, 'a')
+        outbox.send(1, 'b')
+        outbox.send(2, 'c')
+        self.outbox = outbox.start()
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual([c.kwargs['text'] for c in self.bot.send_message.call_args_list],
+                         ['a', 'c', 'b'])
+
+    def test_global_rate(self):
+        outbox = self.start(rate=20, burst=1, linger=0)
+        started = time.monotonic()
+        for chat_id in range(4):
+            outbox.send(chat_id, 'hello')
+        self.assertTrue(outbox.flush(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.14)
+
+    def test_retry_after(self):
+        self.bot.send_message.side_effect = [RetryAfter(0.2), None, None]
+        outbox = Outbox(self.bot, linger=0)
+        outbox.send(1, 'first')
+        self.outbox = outbox.start()
+        started = time.monotonic()
+        self.assertTrue(outbox.flush(5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(self.bot.send_message.call_args_list, [
+            call(chat_id=1, text='first'), call(chat_id=1, text='first')])
+
+    def test_retry_after_gives_up(self):
+        self.bot.send_message.side_effect = RetryAfter(0.01)
+        outbox = self.start(linger=0, max_retries=2)
+        outbox.send(1, 'hello')
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual(self.bot.send_message.call_count, 3)
+
+    # failed message does not stop the rest
+    def test_failure(self):
+        self.bot.send_message.side_effect = [Unauthorized('blocked'), None]
+        outbox = self.start(linger=0)
+        outbox.send(1, 'hello')
+        outbox.send(2, 'hello')
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual(self.bot.send_message.call_count, 2)
+
+    def test_queue_limit(self):
+        outbox = Outbox(self.bot, max_queue=1)
+        self.assertTrue(outbox.send(1, 'hello'))
+        self.assertFalse(outbox.send(1, 'hello'))
+
+    def test_outbox_bot(self):
+        outbox = Outbox(self.bot)
+        bot = OutboxBot(self.bot, outbox)
+        self.assertIsNone(bot.send_message(chat_id=1, text='hello'))
+        self.assertEqual(outbox.size, 1)
+        self.assertEqual(bot.username, self.bot.username)
+        self.bot.send_message.assert_not_called()
+
+
+class TestSlateBoyOutbox(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.mock_bot = Mockbot()
+        self.chat = ChatGenerator().get_chat()
+        self.alice = UserGenerator().get_user()
+        self.mg = MessageGenerator(self.mock_bot)
+        self.slateboy = SlateBoy(
+            'slate-boy', '', BlankPersonality(), WalletProvider(),
+            config={'outbox_enabled': True}, bot=self.mock_bot)
+        self.slateboy.initiate()
+        self.slateboy.run(idle=False)
+
+    def tearDown(self):
+        self.slateboy.stop()
+
+    def test_balance(self):
+        with patch('slateboy.personality.BlankPersonality.getBalance',
+                   return_value=(True, None, 'all the grins')):
+            update = self.mg.get_message(
+                text='/balance', parse_mode='HTML', user=self.alice, chat=self.chat)
+            self.mock_bot.insertUpdate(update)
+        self.assertTrue(self.slateboy.outbox.flush(5))
+        self.assertEqual(self.mock_bot.sent_messages[-1]['text'], 'all the grins')
+
+
+if __name__ == '__main__':
+    unittest.main()
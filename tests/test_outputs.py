@@ -0,0 +1,66 @@
+import unittest
+
+from slateboy.outputs import OutputManager
+
+
+def output(value, status='Unspent', height=1):
+    return {'commit': '09', 'output': {
+        'value': str(value), 'status': status, 'height': str(height)}}
+
+
+class TestOutputManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = OutputManager(
+            target_outputs=4, max_change_outputs=3,
+            min_change_value=10, fee=1)
+
+    # smallest outputs covering the amount, change split up to the target
+    def test_plan(self):
+        self.manager.update([output(1000), output(5), output(30)])
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(30)
+        self.assertTrue(success)
+        self.assertEqual(max_outputs, 2)
+        # change of 4 is too small to be split
+        self.assertEqual(num_change_outputs, 1)
+
+        # 4 change outputs would bring the free ones to the target,
+        # at most 3 are allowed
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(500)
+        self.assertEqual(max_outputs, 3)
+        self.assertEqual(num_change_outputs, 3)
+
+    # change too small to be split
+    def test_plan_dust_change(self):
+        self.manager.update([output(30)])
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(20)
+        self.assertEqual((max_outputs, num_change_outputs), (1, 1))
+
+    # enough free outputs already, no split
+    def test_plan_target_reached(self):
+        self.manager.update([output(100) for i in range(6)])
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(20)
+        self.assertEqual((max_outputs, num_change_outputs), (1, 1))
+
+    # locked and immature outputs are not spendable
+    def test_not_enough(self):
+        self.manager.update([
+            output(100, status='Locked'),
+            output(100, status='Unconfirmed'),
+            output(100, height=995)], height=1000, minimum_confirmations=10)
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(20)
+        self.assertFalse(success)
+        self.assertIn('1 locked', reason)
+        self.assertIn('2 awaiting confirmation', reason)
+
+    def test_capacity(self):
+        self.manager.update([output(50), output(50), output(10), output(10)])
+        self.assertEqual(self.manager.capacity(40), 2)
+
+    # nanogrin only, a fraction is refused rather than truncated
+    def test_fractional_amount(self):
+        self.manager.update([output(50)])
+        success, reason, max_outputs, num_change_outputs = self.manager.plan(20.5)
+        self.assertFalse(success)
+        self.assertIn('nanogrin', reason)
+        with self.assertRaises(ValueError):
+            self.manager.capacity(20.5)
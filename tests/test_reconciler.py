@@ -0,0 +1,203 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from slateboy.reconciler import TxReconciler, TX_DEPOSIT, TX_WITHDRAWAL
+
+
+def wallet_tx(tx_id, tx_type='TxReceived', confirmed=False,
+              credited=0, debited=0, fee=None, kernel_excess=None):
+    return {
+        'tx_slate_id': tx_id,
+        'tx_type': tx_type,
+        'confirmed': confirmed,
+        'amount_credited': str(credited),
+        'amount_debited': str(debited),
+        'fee': fee,
+        'kernel_excess': kernel_excess
+    }
+
+
+class TestTxReconciler(unittest.TestCase):
+    def setUp(self):
+        self.txs = []
+        self.walletCall = MagicMock(side_effect=self.mockedWalletCall)
+        self.personality = MagicMock()
+        for hook in ['confirmDepositTx', 'cancelDepositTx',
+                     'confirmWithdrawTx', 'cancelWithdrawTx']:
+            getattr(self.personality, hook).return_value = (True, None, hook)
+        self.context = MagicMock()
+        self.context.bot_data = {'slateboy': {'txs': {}}}
+        self.reconciler = TxReconciler(
+            self.walletCall, self.personality, 'slateboy',
+            max_deposit_age=100, max_withdrawal_age=10)
+
+    def mockedWalletCall(self, method, *args, **kwargs):
+        if method == 'retrieveTxs':
+            tx_ids = kwargs['tx_ids']
+            return True, None, [
+                tx for tx in self.txs if tx['tx_slate_id'] in tx_ids]
+        if method == 'releaseLock':
+            return True, None
+        if method == 'batch':
+            return [self.mockedWalletCall(call_method, *call_args, **call_kwargs)
+                    for call_method, call_args, call_kwargs in args[0]]
+        if method == 'isReady':
+            return True, None
+
+    def pending(self):
+        return self.context.bot_data['slateboy']['txs']
+
+    # nothing pending, the wallet is not even asked
+    def test_nothing_pending(self):
+        self.assertEqual(self.reconciler.reconcile(self.context), 0)
+        self.walletCall.assert_not_called()
+
+    def test_confirmations(self):
+        self.pending()['d1'] = '1'
+        self.pending()['w1'] = '2'
+        self.txs = [
+            wallet_tx('d1', credited=5000000000),
+            wallet_tx('w1', tx_type='TxSent', debited=7000000000,
+                      credited=1000000000, fee=100000000, kernel_excess='08aa'),
+            wallet_tx('other', confirmed=True, credited=1)
+        ]
+
+        # still waiting, nothing to tell the personality
+        self.assertEqual(self.reconciler.reconcile(self.context), 0)
+        self.assertEqual(self.walletCall.call_count, 1)
+
+        self.txs[0]['confirmed'] = True
+        self.txs[1]['confirmed'] = True
+        self.assertEqual(self.reconciler.reconcile(self.context), 2)
+        # in GRIN like the amounts of the assign hooks
+        self.personality.confirmDepositTx.assert_called_once_with(
+            self.context, 5.0, 'd1')
+        self.personality.confirmWithdrawTx.assert_called_once_with(
+            self.context, 5.9, 'w1')
+        self.context.bot.send_message.assert_any_call(
+            chat_id='1', text='confirmDepositTx')
+
+    def test_state_change_reported_once(self):
+        self.pending()['d1'] = '1'
+        self.txs = [wallet_tx('d1', tx_type='TxReceivedCancelled')]
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+
+        # still in the index but the state did not change
+        self.assertEqual(self.reconciler.reconcile(self.context), 0)
+        self.assertEqual(self.personality.cancelDepositTx.call_count, 1)
+
+    # the personality failed to handle it, it is retried
+    def test_state_change_retried(self):
+        self.pending()['d1'] = '1'
+        self.txs = [wallet_tx('d1', tx_type='TxReceivedCancelled')]
+        self.personality.cancelDepositTx.return_value = (False, 'nope', None)
+        self.assertEqual(self.reconciler.reconcile(self.context), 0)
+        self.personality.cancelDepositTx.return_value = (True, None, None)
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+        self.assertEqual(self.personality.cancelDepositTx.call_count, 2)
+
+    def test_expiry(self):
+        self.pending()['w1'] = '2'
+        self.pending()['d1'] = '1'
+        self.txs = [
+            wallet_tx('w1', tx_type='TxSent', debited=100),
+            wallet_tx('d1', credited=100)
+        ]
+        self.reconciler.reconcile(self.context)
+
+        # only the withdrawal is past its deadline
+        tx_states = self.context.bot_data['slateboy']['tx_states']
+        for tx_id in tx_states.keys():
+            tx_states[tx_id]['seen'] -= 50
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+        self.walletCall.assert_any_call('releaseLock', 'w1')
+        self.personality.cancelWithdrawTx.assert_called_once()
+        self.personality.cancelDepositTx.assert_not_called()
+
+    # unknown to the wallet, the assigned amount is released
+    # once the request expires
+    def test_missing(self):
+        self.pending()['d1'] = '1'
+        self.pending()['w1'] = '2'
+        self.reconciler.assigned(self.context, 'd1', 1.5, TX_DEPOSIT)
+        self.reconciler.assigned(self.context, 'w1', 2.5, TX_WITHDRAWAL)
+        self.assertEqual(self.reconciler.reconcile(self.context), 0)
+
+        # only the withdrawal is past its deadline
+        tx_states = self.context.bot_data['slateboy']['tx_states']
+        for tx_id in tx_states.keys():
+            tx_states[tx_id]['seen'] -= 50
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+        self.personality.cancelWithdrawTx.assert_called_once_with(
+            self.context, 2.5, 'w1')
+        self.personality.cancelDepositTx.assert_not_called()
+
+        for tx_id in tx_states.keys():
+            tx_states[tx_id]['seen'] -= 100
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+        self.personality.cancelDepositTx.assert_called_once_with(
+            self.context, 1.5, 'd1')
+
+        # nothing to release with the wallet
+        for call in self.walletCall.call_args_list:
+            self.assertNotEqual(call[0][0], 'releaseLock')
+
+    # personality errors do not stop the job
+    def test_personality_failure(self):
+        self.pending()['d1'] = '1'
+        self.pending()['d2'] = '1'
+        self.txs = [
+            wallet_tx('d1', confirmed=True, credited=1),
+            wallet_tx('d2', confirmed=True, credited=2)
+        ]
+        self.personality.confirmDepositTx.side_effect = [
+            ValueError('Invalid Transaction'), (True, None, None)]
+        self.assertEqual(self.reconciler.reconcile(self.context), 1)
+        self.assertEqual(self.personality.confirmDepositTx.call_count, 2)
+
+    # readiness comes with the lookups in the same batch
+    def test_readiness(self):
+        on_ready = MagicMock()
+        reconciler = TxReconciler(
+            self.walletCall, self.personality, 'slateboy', on_ready=on_ready)
+        self.pending()['d1'] = '1'
+        self.txs = [wallet_tx('d1', confirmed=True, credited=1)]
+        self.assertEqual(reconciler.reconcile(self.context), 1)
+        self.assertEqual(self.walletCall.call_count, 1)
+        self.assertEqual(self.walletCall.call_args[0][0], 'batch')
+        on_ready.assert_called_once_with(True, None)
+
+    # the hooks go in line with the updates of the user
+    def test_submit(self):
+        submitted = []
+
+        def submit(key, function, *args):
+            submitted.append((key, function, args))
+            return True
+
+        reconciler = TxReconciler(
+            self.walletCall, self.personality, 'slateboy', submit=submit)
+        self.pending()['d1'] = '1'
+        self.pending()['d2'] = '2'
+        self.txs = [
+            wallet_tx('d1', confirmed=True, credited=1),
+            wallet_tx('d2', confirmed=True, credited=2)
+        ]
+        self.assertEqual(reconciler.reconcile(self.context), 2)
+        self.assertEqual([key for key, function, args in submitted], ['1', '2'])
+        self.personality.confirmDepositTx.assert_not_called()
+
+        # a failing hook is retried by the next run
+        self.personality.confirmDepositTx.side_effect = ValueError()
+        key, function, args = submitted[0]
+        self.assertFalse(function(*args))
+        self.assertEqual(reconciler.reconcile(self.context), 1)
+        self.assertEqual(submitted[-1][0], '1')
+
+        # the queue is full, also retried
+        submitted.clear()
+        self.context.bot_data['slateboy']['tx_states']['d2']['state'] = None
+        reconciler.submit = lambda key, function, *args: False
+        self.assertEqual(reconciler.reconcile(self.context), 0)
+        self.assertIsNone(self.context.bot_data['slateboy']['tx_states']['d2']['state'])
@@ -0,0 +1,83 @@
+import os
+import time
+import tempfile
+import unittest
+
+from slateboy.providers import WalletProvider
+from slateboy.recording import RecordingWalletProvider, ReplayWalletProvider
+
+
+class SlowWalletProvider(WalletProvider):
+    def __init__(self):
+        self.counter = 0
+
+    def isReady(self):
+        return True, None
+
+    def send(self, amount, slatepack_address=None):
+        time.sleep(0.05)
+        self.counter += 1
+        tx_id = 'tx{}'.format(self.counter)
+        return True, None, 'slatepack {}'.format(amount), tx_id
+
+    def receive(self, slatepack, slate=None):
+        return True, None, 'response', slate['id']
+
+    def releaseLock(self, tx_id):
+        raise ConnectionError('wallet went away')
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def record(self, name):
+        path = os.path.join(self.directory, name)
+        recorder = RecordingWalletProvider(SlowWalletProvider(), path)
+        self.assertEqual(recorder.isReady(), (True, None))
+        self.assertEqual(recorder.send(1000)[3], 'tx1')
+        self.assertEqual(recorder.send(2000)[3], 'tx2')
+        recorder.receive('slatepack', slate={'id': 'tx3', 'huge': 'x' * 1000})
+        with self.assertRaises(ConnectionError):
+            recorder.releaseLock('tx1')
+        recorder.close()
+        return path
+
+    def test_replay(self):
+        replay = ReplayWalletProvider(self.record('wallet.jsonl'), scale=0)
+        self.assertEqual(replay.isReady(), (True, None))
+
+        # same arguments, same response
+        self.assertEqual(replay.send(2000), (True, None, 'slatepack 2000', 'tx2'))
+        self.assertEqual(replay.send(1000), (True, None, 'slatepack 1000', 'tx1'))
+
+        # unknown arguments get the recorded responses in order
+        self.assertEqual(replay.send(5)[3], 'tx1')
+        self.assertEqual(replay.send(5)[3], 'tx2')
+        self.assertEqual(replay.send(5)[3], 'tx1')
+
+        # the decoded slate is not stored
+        self.assertEqual(replay.receive('slatepack', slate={'id': 'other'})[3], 'tx3')
+        with self.assertRaises(Exception):
+            replay.releaseLock('tx1')
+        with self.assertRaises(Exception):
+            replay.invoice(1000)
+
+    def test_compressed(self):
+        path = self.record('wallet.jsonl.gz')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(2), b'\x1f\x8b')
+        replay = ReplayWalletProvider(path, scale=0)
+        self.assertEqual(replay.send(1000)[3], 'tx1')
+
+    def test_timings(self):
+        path = self.record('wallet.jsonl')
+        replay = ReplayWalletProvider(path, scale=1.0)
+        start = time.monotonic()
+        replay.send(1000)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+        replay = ReplayWalletProvider(path, scale=0.1)
+        start = time.monotonic()
+        replay.send(1000)
+        self.assertLess(time.monotonic() - start, 0.04)
@@ -1,6 +1,10 @@
+import time
+import asyncio
+import threading
 import unittest
 import warnings
 import os
+import tempfile
 
 from i18n import resource_loader
 from i18n import config as i18config
@@ -8,6 +12,7 @@ from i18n.translator import t
 
 # from telegram.warning import TelegramDeprecationWarning
 from unittest.mock import patch, Mock, MagicMock, call
+from concurrent.futures import ThreadPoolExecutor
 
 from ptbtest import ChatGenerator
 from ptbtest import MessageGenerator
@@ -17,7 +22,13 @@ from ptbtest import CallbackQueryGenerator
 
 from slateboy.slateboy import SlateBoy
 from slateboy.personality import BlankPersonality
-from slateboy.providers import WalletProvider
+from slateboy.providers import WalletProvider, AsyncWalletProvider
+from slateboy.invoice_pool import InvoicePool
+from slateboy.workers import WalletWorkerPool
+from slateboy.core_wallet import CoreWallet
+from slateboy.fake_wallet import FakeWalletServer
+from slateboy.slatepack import encodeSlatepack
+from slateboy.transport import WalletTransport
 
 TRANSLATIONS_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep + '../translations' + os.sep
 i18config.set('file_format', 'json')
@@ -112,18 +123,43 @@ class TestSlateBoy(unittest.TestCase):
         self.slateboy.stop()
 
 
-    def interact(self, message, group=False):
+    # rebuilds the bot around another wallet provider, returns
+    # once the warmup job has found the wallet ready
+    def restartWith(self, wallet_provider):
+        self.slateboy.stop()
+        self.slateboy = SlateBoy(
+            'slate-boy', '',
+            self.personality, wallet_provider, bot=self.mock_bot)
+        self.slateboy.initiate()
+        self.slateboy.run(idle=False)
+        deadline = time.monotonic() + 5
+        while self.slateboy.isWalletReady() != (True, None):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+
+    def interact(self, message, group=False, user=None):
         w = self.chat
         if group:
             w = self.group
+        if user is None:
+            user = self.alice
         update = self.mg.get_message(
             text=message,
             parse_mode='HTML',
-            user=self.alice,
+            user=user,
             chat=w)
         return update
 
 
+    # the updates processed on the workers reply later
+    def waitForMessage(self, matches, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not any(matches(sent) for sent in self.mock_bot.sent_messages):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
     def callbackQuery(self, sent_message, data):
         update = self.cqg.get_callback_query(
             message=sent_message,
@@ -205,7 +241,7 @@ class TestSlateBoy(unittest.TestCase):
                 self.mock_bot.insertUpdate(update)
         sent = self.mock_bot.sent_messages[-1]
         response = sent['text']
-        expected_response = t('slateboy.msg_deposit_invalid_amount')
+        expected_response = t('slateboy.msg_deposit_invalid_amount').format('aaa')
         self.assertEqual(response, expected_response)
 
 
@@ -349,6 +385,140 @@ class TestSlateBoy(unittest.TestCase):
         expected_response = final_message
         self.assertEqual(response, expected_response)
 
+        # the reconciler knows what to release if the wallet loses the tx
+        tx_state = self.slateboy.updater.dispatcher.bot_data['slateboy']['tx_states']['<txid>']
+        self.assertEqual(tx_state['amount'], 1000)
+        self.assertEqual(tx_state['kind'], 'deposit')
+
+    # the personality talks GRIN, only the wallet sees nanogrin
+    def testDepositAmountUnits(self):
+        server = FakeWalletServer(api_password='secret', seed=3).start()
+        transport = WalletTransport()
+        self.addCleanup(server.stop)
+        self.addCleanup(transport.close)
+        wallet = CoreWallet(
+            'secret', api_url=server.owner_url,
+            foreign_api_url=server.foreign_url, transport=transport)
+        self.restartWith(wallet)
+        bot_data = self.slateboy.updater.dispatcher.bot_data
+
+        def assignDepositTx(update, context, amount, tx_id):
+            bot_data.setdefault('slateboy', {}).setdefault('txs', {})[tx_id] = \
+                str(update.effective_user.id)
+            return True, None, None, None
+
+        P1 = patch('slateboy.personality.BlankPersonality.shouldSeeEULA',
+                   return_value=(False, None, None))
+        P2 = patch('slateboy.personality.BlankPersonality.canDeposit',
+                   return_value=(True, None, True, 2.5))
+        P3 = patch('slateboy.personality.BlankPersonality.assignDepositTx',
+                   side_effect=assignDepositTx)
+        P4 = patch('slateboy.personality.BlankPersonality.confirmDepositTx',
+                   return_value=(True, None, None))
+        with P1, P2 as canDeposit, P3, P4 as confirmDepositTx:
+            update = self.interact('/deposit 2.5')
+            self.slateboy.processUpdate(update.to_dict())
+            self.assertEqual(canDeposit.call_args[0][2], 2.5)
+            tx_id, = bot_data['slateboy']['txs'].keys()
+            self.assertEqual(
+                server.state.txs[tx_id]['amount_credited'], '2500000000')
+
+            # the user pays the invoice, the bot finalizes and posts it
+            success, reason, finalized_tx_id = wallet.finalize(
+                encodeSlatepack(tx_id, 'I2', amt=2500000000))
+            self.assertTrue(success)
+            context = Mock(bot=self.mock_bot, bot_data=bot_data)
+            self.assertEqual(self.slateboy.reconciler.reconcile(context), 1)
+        confirmDepositTx.assert_called_once_with(context, 2.5, tx_id)
+
+    # the open invoices of the pool survive the restart, those of
+    # the amounts no longer suggested are cancelled
+    def testInvoicePoolRestart(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {
+            'persistence': os.path.join(directory.name, 'state.pickle'),
+            'invoice_pool_size': 2}
+        issued = []
+
+        def invoice(amount, slatepack_address=None):
+            issued.append('tx-{}'.format(len(issued) + 1))
+            return True, None, 'slatepack', issued[-1]
+
+        def restart(buckets):
+            self.slateboy.stop()
+            with patch('slateboy.personality.BlankPersonality.invoicePoolBuckets',
+                       return_value=buckets):
+                self.slateboy = SlateBoy(
+                    'slate-boy', '', self.personality, self.wallet_provider,
+                    config=config, bot=self.mock_bot)
+                self.slateboy.initiate()
+            return Mock(dispatcher=self.slateboy.updater.dispatcher)
+
+        P1 = patch('slateboy.providers.WalletProvider.invoice', side_effect=invoice)
+        P2 = patch('slateboy.providers.WalletProvider.releaseLock',
+                   return_value=(True, None))
+        with P1, P2 as releaseLock:
+            context = restart([1.0])
+            self.slateboy.jobInvoicePool(context)
+            self.assertEqual(issued, ['tx-1', 'tx-2'])
+
+            context = restart([1.0])
+            self.assertEqual(self.slateboy.invoice_pool.available(1.0), 2)
+            self.slateboy.jobInvoicePool(context)
+            self.assertEqual(issued, ['tx-1', 'tx-2'])
+            releaseLock.assert_not_called()
+
+            context = restart([5.0])
+            self.slateboy.jobInvoicePool(context)
+            self.assertEqual(
+                [c[0][0] for c in releaseLock.call_args_list], ['tx-1', 'tx-2'])
+            self.assertEqual(self.slateboy.invoice_pool.available(5.0), 2)
+
+    # the wallet keeps its sync state where the config says,
+    # next to the persistence file by default
+    def testSyncStatePath(self):
+        with patch('slateboy.providers.WalletProvider.setSyncStatePath') as setSyncStatePath:
+            SlateBoy('slate-boy', '', self.personality, self.wallet_provider,
+                     config={'sync_state_path': 'wallet/sync.json'})
+            setSyncStatePath.assert_called_once_with('wallet/sync.json')
+
+            setSyncStatePath.reset_mock()
+            SlateBoy('slate-boy', '', self.personality, self.wallet_provider,
+                     config={'persistence': os.path.join('data', 'state.pickle')})
+            setSyncStatePath.assert_called_once_with(
+                os.path.join('data', 'sync_state.json'))
+
+            setSyncStatePath.reset_mock()
+            SlateBoy('slate-boy', '', self.personality, self.wallet_provider)
+            setSyncStatePath.assert_not_called()
+
+    # deposit served from the pool of pre-issued invoices
+    def testDepositFromInvoicePool(self):
+        self.slateboy.invoice_pool = InvoicePool([1000], size=1)
+        self.slateboy.invoice_pool.topUp(
+            lambda amount: (True, None, '<pooled slatepack>', '<txid>'))
+        P1 = patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None))
+        P2 = patch('slateboy.personality.BlankPersonality.shouldSeeEULA',
+                   return_value=(False, 'very eula', 'eula_v1'))
+        P3 = patch('slateboy.personality.BlankPersonality.canDeposit',
+                   return_value=(True, None, True, 1000))
+        P4 = patch('slateboy.providers.WalletProvider.invoice')
+        P5 = patch('slateboy.personality.BlankPersonality.assignDepositTx',
+                   return_value=(True, None, None, None))
+        with P1, P2, P3, P4 as invoice, P5:
+            update = self.interact('/deposit 1000')
+            self.mock_bot.insertUpdate(update)
+            invoice.assert_not_called()
+        sent = self.mock_bot.sent_messages[-1]
+        response = sent['text']
+        expected_response = t('slateboy.msg_deposit_slatepack_formatting').format(**{
+            'slatepack': '<pooled slatepack>'
+        })
+        self.assertEqual(response, expected_response)
+        self.assertEqual(self.slateboy.invoice_pool.available(1000), 0)
+
     # standard instructions and custom slatepack formatting and no final message
     def testCompleteFinancialOperationCase2(self):
         P1 = patch('slateboy.providers.WalletProvider.isReady',
@@ -466,6 +636,236 @@ class TestSlateBoy(unittest.TestCase):
             'Locked: 2.0'
         self.assertEqual(response, expected_response)
 
+    # full rescan is an admin action running in the background
+    def testRescan(self):
+        with patch('slateboy.providers.WalletProvider.sync',
+                   return_value=(True, None)) as sync:
+            update = self.interact('/rescan')
+            self.mock_bot.insertUpdate(update)
+            sent = self.mock_bot.sent_messages[-1]
+            self.assertEqual(sent['text'], t('slateboy.msg_admin_only'))
+            sync.assert_not_called()
+
+            with patch('slateboy.personality.BlankPersonality.isAdmin',
+                       return_value=True):
+                update = self.interact('/rescan')
+                self.mock_bot.insertUpdate(update)
+                time.sleep(0.5)
+            sent = self.mock_bot.sent_messages
+            self.assertEqual(sent[-2]['text'], t('slateboy.msg_rescan_started'))
+            self.assertEqual(sent[-1]['text'], t('slateboy.msg_rescan_finished'))
+            sync.assert_called_once_with(full=True)
+
+    # latencies are recorded and reported to the admins
+    def testStats(self):
+        self.slateboy.metrics.enabled = True
+        with patch('slateboy.personality.BlankPersonality.getBalance',
+                   return_value=(True, None, (0.0, 0.0, 0.0, 0.0))):
+            update = self.interact('/balance')
+            self.mock_bot.insertUpdate(update)
+
+        update = self.interact('/stats')
+        self.mock_bot.insertUpdate(update)
+        sent = self.mock_bot.sent_messages[-1]
+        self.assertEqual(sent['text'], t('slateboy.msg_admin_only'))
+
+        with patch('slateboy.personality.BlankPersonality.isAdmin',
+                   return_value=True):
+            update = self.interact('/stats')
+            self.mock_bot.insertUpdate(update)
+        response = self.mock_bot.sent_messages[-1]['text']
+        self.assertTrue(response.startswith(t('slateboy.msg_stats_header')))
+        self.assertIn('handlerBalance: 1,', response)
+        self.assertIn('preCommand: ', response)
+
+    # wallet known to be down is not even asked
+    def testWalletUnavailable(self):
+        P1 = patch('slateboy.providers.WalletProvider.isAvailable',
+                   return_value=False)
+        P2 = patch('slateboy.providers.WalletProvider.isReady')
+        with P1, P2 as isReady:
+            update = self.interact('/deposit 12.3')
+            self.mock_bot.insertUpdate(update)
+            isReady.assert_not_called()
+        sent = self.mock_bot.sent_messages[-1]
+        self.assertEqual(sent['text'], t('slateboy.msg_wallet_unavailable'))
+
+    # routine sync does not ask for the full rescan
+    def testJobWalletSync(self):
+        P1 = patch('slateboy.providers.WalletProvider.sync',
+                   return_value=(True, None))
+        P2 = patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None))
+        with P1 as sync, P2:
+            self.slateboy.jobWalletSync(MagicMock())
+            sync.assert_called_once_with()
+
+    # slow wallet holds up only the updates of the same user, the other
+    # users are served meanwhile
+    def testWalletWorkers(self):
+        self.slateboy.wallet_workers = WalletWorkerPool(workers=2, max_queue=0)
+        bob = self.ug.get_user()
+        release = threading.Event()
+
+        def slowInvoice(*args, **kwargs):
+            release.wait(5)
+            return False, 'slow wallet', None, None
+
+        P1 = patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None))
+        P2 = patch('slateboy.personality.BlankPersonality.shouldSeeEULA',
+                   return_value=(False, 'very eula', 'eula_v1'))
+        P3 = patch('slateboy.personality.BlankPersonality.canDeposit',
+                   return_value=(True, None, True, 1000))
+        P4 = patch('slateboy.providers.WalletProvider.invoice',
+                   side_effect=slowInvoice)
+        P5 = patch('slateboy.personality.BlankPersonality.getBalance',
+                   return_value=(True, None, (1.0, 0.0, 0.0, 0.0)))
+        with P1, P2, P3, P4, P5:
+            self.mock_bot.insertUpdate(self.interact('/deposit 12.3'))
+
+            # answered while the deposit waits for the wallet
+            self.mock_bot.insertUpdate(self.interact('/balance', user=bob))
+            self.waitForMessage(
+                lambda sent: sent['text'].startswith('Spendable: 1.0'))
+
+            # the balance of the same user waits for the deposit,
+            # no more room for another update
+            self.mock_bot.insertUpdate(self.interact('/balance'))
+            self.mock_bot.insertUpdate(self.interact('/deposit 12.3'))
+            self.waitForMessage(
+                lambda sent: sent['text'] == t('slateboy.msg_wallet_busy'))
+
+            release.set()
+            self.assertTrue(self.slateboy.wallet_workers.join(5))
+        texts = [sent['text'] for sent in self.mock_bot.sent_messages]
+        self.assertEqual(texts[-2], 'slow wallet')
+        self.assertTrue(texts[-1].startswith('Spendable: 1.0'))
+
+    # commands are told to wait while the wallet connects
+    def testWalletWarmup(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slowWarmup():
+            started.set()
+            release.wait(5)
+            return True, None
+
+        P1 = patch('slateboy.providers.WalletProvider.warmup',
+                   side_effect=slowWarmup)
+        P2 = patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None))
+        with P1, P2 as isReady:
+            thread = threading.Thread(
+                target=self.slateboy.jobWalletWarmup, args=(MagicMock(),))
+            thread.start()
+            started.wait(5)
+            self.assertEqual(
+                self.slateboy.isWalletReady(),
+                (False, t('slateboy.msg_wallet_starting')))
+            isReady.assert_not_called()
+
+            release.set()
+            thread.join(5)
+            self.assertEqual(self.slateboy.isWalletReady(), (True, None))
+
+    # slateboy awaits the coroutines of an asynchronous wallet provider
+    def testAsyncWalletProvider(self):
+        class ReadyAsyncWalletProvider(AsyncWalletProvider):
+            async def isReady(self):
+                return True, None
+
+        self.restartWith(ReadyAsyncWalletProvider())
+        # the loop exists before the first call, concurrent handlers share it
+        event_loop = self.slateboy.event_loop
+        self.assertIsNotNone(event_loop)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(
+                lambda _: self.slateboy.walletCall('isReady'), range(8)))
+        self.assertEqual(results, [(True, None)] * 8)
+        self.assertIs(self.slateboy.event_loop, event_loop)
+
+        # a stopped loop fails the call instead of hanging it
+        self.slateboy.stop()
+        with self.assertRaises(RuntimeError):
+            self.slateboy.walletCall('isReady')
+
+    # the update goes through the dispatcher and the coroutines
+    # of the asynchronous provider are awaited on the way
+    def testAsyncWalletProviderDispatch(self):
+        class InvoicingAsyncWalletProvider(AsyncWalletProvider):
+            async def isReady(self):
+                return True, None
+
+            async def invoice(self, amount, slatepack_address=None):
+                await asyncio.sleep(0.01)
+                return True, None, 'slatepack-' + str(amount), 'tx-' + str(amount)
+
+        self.restartWith(InvoicingAsyncWalletProvider())
+        P1 = patch('slateboy.personality.BlankPersonality.shouldSeeEULA',
+                   return_value=(False, None, None))
+        P2 = patch('slateboy.personality.BlankPersonality.canDeposit',
+                   return_value=(True, None, True, 2.0))
+        P3 = patch('slateboy.personality.BlankPersonality.assignDepositTx',
+                   return_value=(True, None, True, None))
+        with P1, P2, P3 as assignDepositTx:
+            update = self.interact('/deposit 2')
+            self.slateboy.processUpdate(update.to_dict())
+        self.assertEqual(assignDepositTx.call_args[0][2:], (2.0, 'tx-2.0'))
+        texts = [sent['text'] for sent in self.mock_bot.sent_messages]
+        self.assertIn(t('slateboy.msg_deposit_slatepack_formatting').format(
+            slatepack='slatepack-2.0'), texts)
+
+    # wallet readiness is cached and invalidated by the failed wallet calls
+    def testWalletReadinessCache(self):
+        P1 = patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None))
+        P2 = patch('slateboy.providers.WalletProvider.releaseLock',
+                   return_value=(False, 'wallet ricked'))
+        with P1 as isReady, P2:
+            for i in range(3):
+                self.assertEqual(self.slateboy.isWalletReady(), (True, None))
+            self.assertEqual(isReady.call_count, 1)
+
+            self.slateboy.walletCall('releaseLock', 'tx_id')
+            self.assertEqual(self.slateboy.isWalletReady(), (True, None))
+            self.assertEqual(isReady.call_count, 2)
+
+        # expired entries are refreshed
+        self.slateboy.wallet_ready = False, 'down', time.monotonic() - 3600
+        with patch('slateboy.providers.WalletProvider.isReady',
+                   return_value=(True, None)) as isReady:
+            self.assertEqual(self.slateboy.isWalletReady(), (True, None))
+            self.assertEqual(isReady.call_count, 1)
+
+    # slatepack is decoded once, the re-pasted one comes from the cache
+    def testDecodeSlatepackCached(self):
+        P1 = patch('slateboy.providers.WalletProvider.decodeSlatepack',
+                   return_value=(True, None, example_slate_s1))
+        with P1 as decodeSlatepack:
+            success, reason, slate = self.slateboy.decodeSlatepack(
+                example_slatepack)
+            self.assertTrue(success)
+            self.assertEqual(slate['id'], example_slate_s1['id'])
+            self.assertEqual(slate.slatepack, example_slatepack)
+
+            # whitespace does not matter
+            success, reason, cached = self.slateboy.decodeSlatepack(
+                example_slatepack.replace('\n', ' '))
+            self.assertIs(cached, slate)
+            self.assertEqual(decodeSlatepack.call_count, 1)
+
+        # failures are not cached
+        P2 = patch('slateboy.providers.WalletProvider.decodeSlatepack',
+                   return_value=(False, 'bad slatepack', None))
+        with P2 as decodeSlatepack:
+            for i in range(2):
+                success, reason, slate = self.slateboy.decodeSlatepack('nope')
+                self.assertFalse(success)
+                self.assertEqual(reason, 'bad slatepack')
+            self.assertEqual(decodeSlatepack.call_count, 2)
+
     def test_contains_slatepack(self):
         some_message = '''
         and then I tell him bla bla bla
@@ -615,7 +1015,7 @@ class TestSlateBoy(unittest.TestCase):
                 return_value=slate)
 
         reply_text = 'cowabangaaaa'
-        def mockedProcessS1Slatepack(_self, update, context, slatepack, tx_id):
+        def mockedProcessS1Slatepack(_self, update, context, slatepack, tx_id, request=None):
             chat_id = update.message.chat.id
             context.bot.send_message(chat_id=chat_id, text=reply_text)
 
@@ -654,7 +1054,7 @@ class TestSlateBoy(unittest.TestCase):
                 return_value=slate)
 
         reply_text = 'cowabangaaaa'
-        def mockedProcessS2Slatepack(_self, update, context, slatepack, tx_id):
+        def mockedProcessS2Slatepack(_self, update, context, slatepack, tx_id, request=None):
             chat_id = update.message.chat.id
             context.bot.send_message(chat_id=chat_id, text=reply_text)
 
@@ -724,7 +1124,7 @@ class TestSlateBoy(unittest.TestCase):
                 return_value=slate)
 
         reply_text = 'cowabangaaaa'
-        def mockedProcessI2Slatepack(_self, update, context, slatepack, tx_id):
+        def mockedProcessI2Slatepack(_self, update, context, slatepack, tx_id, request=None):
             chat_id = update.message.chat.id
             context.bot.send_message(chat_id=chat_id, text=reply_text)
 
@@ -744,6 +1144,49 @@ class TestSlateBoy(unittest.TestCase):
         self.assertEqual(response, expected_reply_text)
 
 
+    # a DM message containing a malformed slatepack never reaches the wallet
+    def test_text_message_malformed_slatepack(self):
+        some_message = example_slatepack.replace('yC2gf', 'yC2gg')
+
+        P1 = patch('slateboy.personality.BlankPersonality.shouldIgnore',
+                return_value=(False, None))
+
+        P2 = patch('slateboy.personality.BlankPersonality.incomingText',
+                return_value=(True, None))
+
+        P3 = patch('slateboy.providers.WalletProvider.decodeSlatepack')
+
+        with P1, P2, P3 as decodeSlatepack:
+            update = self.interact(some_message)
+            self.mock_bot.insertUpdate(update)
+            decodeSlatepack.assert_not_called()
+
+        sent = self.mock_bot.sent_messages[-1]
+        response = sent['text']
+
+        expected_reply_text = t('slateboy.msg_invalid_slatepack')
+        self.assertEqual(response, expected_reply_text)
+
+    # plain direct message without any slatepack is left alone
+    def test_text_message_without_slatepack(self):
+        P1 = patch('slateboy.personality.BlankPersonality.shouldIgnore',
+                return_value=(False, None))
+
+        P2 = patch('slateboy.personality.BlankPersonality.incomingText',
+                return_value=(True, None))
+
+        P3 = patch('slateboy.personality.BlankPersonality.incomingTextDM',
+                return_value=(True, None))
+
+        P4 = patch('slateboy.providers.WalletProvider.decodeSlatepack')
+
+        sent_before = len(self.mock_bot.sent_messages)
+        with P1, P2, P3, P4 as decodeSlatepack:
+            update = self.interact('gm')
+            self.mock_bot.insertUpdate(update)
+            decodeSlatepack.assert_not_called()
+        self.assertEqual(len(self.mock_bot.sent_messages), sent_before)
+
     # test processS1Slatepack with invalid amount
     def test_processS1Slatepack_invalid_amount(self):
         update = MagicMock()
@@ -1410,6 +1853,3 @@ class TestSlateBoy(unittest.TestCase):
             call(chat_id=user_id, text='woohoo slatepack'),
             call(chat_id=user_id, text='kwisatz haderach')]
         context.bot.send_message.assert_has_calls(expected_calls, any_order=False)
-
-
-
@@ -0,0 +1,75 @@
+import unittest
+
+from slateboy.slatepack import parseSlatepack, encodeSlatepack, \
+    decodeArmor, encodeArmor, SlatepackError
+
+
+# unencrypted slatepack carrying a bare binary S1 slate
+example_slatepack = '''
+BEGINSLATEPACK. 4H1qx1wHe668tFW yC2gfL8PPd8kSgv
+pcXQhyRkHbyKHZg GN75o7uWoT3dkib R2tj1fFGN2FoRLY
+GWmtgsneoXf7N4D uVWuyZSamPhfF1u AHRaYWvhF7jQvKx
+wNJAc7qmVm9JVcm NJLEw4k5BU7jY6S eb. ENDSLATEPACK
+'''
+
+
+class TestSlatepack(unittest.TestCase):
+    def test_parse_example(self):
+        valid, reason, header = parseSlatepack(example_slatepack)
+        self.assertTrue(valid)
+        self.assertIsNone(reason)
+        self.assertEqual(header['ver'], '4:3')
+        self.assertEqual(header['id'], '4bea91b8-19b8-4f00-81f9-25b6edd81537')
+        self.assertEqual(header['sta'], 'S1')
+        self.assertEqual(header['amt'], '1337000000')
+        self.assertEqual(header['fee'], '8000000')
+
+    def test_round_trip(self):
+        slate_id = '0436430c-2b02-624c-2032-570501212b00'
+        sender = 'grin1dhvv9mvarqwl6fderuxp3qgl6qpphvc9p4u24347ec0mvgg6342q4w6x5r'
+        slatepack = encodeSlatepack(
+            slate_id, 'I1', amt=6000000000, sender=sender)
+        self.assertTrue(slatepack.startswith('BEGINSLATEPACK. '))
+        self.assertTrue(slatepack.endswith('. ENDSLATEPACK.'))
+        valid, reason, header = parseSlatepack(slatepack)
+        self.assertTrue(valid)
+        self.assertEqual(header['id'], slate_id)
+        self.assertEqual(header['sta'], 'I1')
+        self.assertEqual(header['amt'], '6000000000')
+        self.assertEqual(header['fee'], '0')
+        self.assertEqual(header['slatepack'], '1.0')
+        self.assertEqual(header['sender'], sender)
+
+    def test_armor_round_trip(self):
+        payload = b'\x00\x00hello slatepack'
+        self.assertEqual(decodeArmor(encodeArmor(payload)), payload)
+
+    def test_invalid(self):
+        # broken framing
+        for slatepack in [
+                'BEGINSLATEPACK. ENDSLATEPACK.',
+                example_slatepack.replace('BEGINSLATEPACK', 'BEGIN'),
+                example_slatepack.replace('ENDSLATEPACK', 'END')]:
+            valid, reason, header = parseSlatepack(slatepack)
+            self.assertFalse(valid)
+            self.assertIsNone(header)
+
+        # characters outside of base58
+        valid, reason, header = parseSlatepack(
+            example_slatepack.replace('4H1q', '0OIl'))
+        self.assertFalse(valid)
+
+        # a typo breaks the checksum
+        valid, reason, header = parseSlatepack(
+            example_slatepack.replace('yC2gf', 'yC2gg'))
+        self.assertFalse(valid)
+        self.assertEqual(reason, 'Invalid slatepack checksum')
+
+        # checksum is fine but the content is truncated
+        truncated = encodeArmor(decodeArmor(example_slatepack)[:10])
+        valid, reason, header = parseSlatepack(truncated)
+        self.assertFalse(valid)
+        self.assertEqual(reason, 'Truncated slatepack')
+
+        with self.assertRaises(SlatepackError):
+            decodeArmor('BEGINSLATEPACK. ' + 'a' * 70000 + '. ENDSLATEPACK.')
@@ -0,0 +1,317 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import warnings
+
+from i18n import resource_loader
+from i18n import config as i18config
+
+from unittest.mock import patch
+
+from ptbtest import ChatGenerator
+from ptbtest import MessageGenerator
+from ptbtest import Mockbot
+from ptbtest import UserGenerator
+
+from slateboy.slateboy import SlateBoy, TRANSLATION_KEYS
+from slateboy.contextbot import ContextBlankPersonality
+from slateboy.personality import BlankPersonality
+from slateboy.providers import WalletProvider
+from slateboy.ordering import KeyedSerialExecutor
+from slateboy.translations import (
+    Translations, TranslationError, Template, templateFields,
+    t, setLocale, current_locale)
+
+TRANSLATIONS_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep + '../translations' + os.sep
+i18config.set('file_format', 'json')
+i18config.set('load_path', [TRANSLATIONS_DIRECTORY])
+i18config.set('filename_format', '{namespace}.{locale}.{format}')
+i18config.set('locale', 'en')
+resource_loader.init_json_loader()
+
+
+def writeTranslations(directory, namespace, locale, templates):
+    path = os.path.join(directory, '{}.{}.json'.format(namespace, locale))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({locale: templates}, f)
+
+
+class User:
+    def __init__(self, id, language_code=None):
+        self.id = id
+        self.language_code = language_code
+
+
+class TestTemplates(unittest.TestCase):
+    def test_fields(self):
+        self.assertEqual(templateFields('plain'), frozenset())
+        self.assertEqual(templateFields('{0} of {1}'), {'0', '1'})
+        self.assertEqual(templateFields('{} of {}'), {'0', '1'})
+        self.assertEqual(templateFields('{name}: {average:.1f}'), {'name', 'average'})
+        self.assertEqual(templateFields('{user.name} {balances[0]}'), {'user', 'balances'})
+        self.assertEqual(templateFields('{value:{width}}'), {'value', 'width'})
+
+    def test_template_is_str(self):
+        template = Template('Your slatepack is\n{slatepack}')
+        self.assertEqual(template, 'Your slatepack is\n{slatepack}')
+        self.assertEqual(template.format(slatepack='x'), 'Your slatepack is\nx')
+        self.assertEqual(template.fields, {'slatepack'})
+
+    # the parsed template renders the same as str.format
+    def test_format(self):
+        class Amount:
+            value = 1.5
+
+        cases = [
+            ('{} of {}', (1, 2), {}),
+            ('{0} {name} {0}', (1,), {'name': 'x'}),
+            ('{{literal}} {name!r:>8}', (), {'name': 'x'}),
+            ('{amount.value:.2f} {balances[1]}', (), {'amount': Amount(), 'balances': [1, 2]}),
+            ('{value:{width}.{precision}f}', (), {'value': 3.14159, 'width': 10, 'precision': 2}),
+            ('{:{}}|', ('ab', 5), {})]
+        for text, args, kwargs in cases:
+            template = Template(text)
+            # rendering does not parse the text again
+            with patch('slateboy.translations.FORMATTER.parse', side_effect=AssertionError):
+                rendered = template.format(*args, **kwargs)
+            self.assertEqual(rendered, text.format(*args, **kwargs))
+        with self.assertRaises(KeyError):
+            Template('{name}').format()
+        with self.assertRaises(ValueError):
+            Template('{} {0}')
+
+
+class TestTranslations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        writeTranslations(self.directory, 'slateboy', 'en', {
+            'msg_hello': 'Hello {name}',
+            'msg_bye': 'Bye',
+            'nested': {'msg_deep': 'Deep'}})
+        writeTranslations(self.directory, 'slateboy', 'pl', {
+            'msg_hello': 'Cześć {name}'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookup(self):
+        translations = Translations(self.directory)
+        self.assertEqual(translations.locales, ['en', 'pl'])
+        self.assertEqual(translations.get('slateboy.msg_hello'), 'Hello {name}')
+        self.assertEqual(translations.get('slateboy.msg_hello', 'pl'), 'Cześć {name}')
+        self.assertEqual(translations.get('slateboy.nested.msg_deep'), 'Deep')
+        self.assertIsNone(translations.get('slateboy.msg_unknown'))
+
+    # the keys missing in a locale come from the fallback one
+    def test_fallback(self):
+        translations = Translations(self.directory)
+        self.assertEqual(translations.get('slateboy.msg_bye', 'pl'), 'Bye')
+        self.assertEqual(translations.get('slateboy.msg_bye', 'de'), 'Bye')
+
+    def test_validate(self):
+        translations = Translations(self.directory)
+        translations.validate({
+            'slateboy.msg_hello': ('name',), 'slateboy.msg_bye': ()})
+
+    def test_validate_missing_key(self):
+        translations = Translations(self.directory)
+        with self.assertRaises(TranslationError) as e:
+            translations.validate({'slateboy.msg_unknown': ()})
+        self.assertIn('en: slateboy.msg_unknown is missing', str(e.exception))
+
+    def test_validate_placeholders(self):
+        writeTranslations(self.directory, 'slateboy', 'pl', {
+            'msg_hello': 'Cześć {imie}'})
+        translations = Translations(self.directory)
+        with self.assertRaises(TranslationError) as e:
+            translations.validate({'slateboy.msg_hello': ('name',)})
+        self.assertNotIn('en:', str(e.exception))
+        self.assertIn('pl: slateboy.msg_hello', str(e.exception))
+
+    def test_validate_malformed(self):
+        writeTranslations(self.directory, 'slateboy', 'pl', {
+            'msg_hello': 'Cześć {name'})
+        translations = Translations(self.directory)
+        with self.assertRaises(TranslationError) as e:
+            translations.validate({})
+        self.assertIn('msg_hello is malformed', str(e.exception))
+
+    def test_validate_root_key(self):
+        path = os.path.join(self.directory, 'slateboy.de.json')
+        with open(path, 'w') as f:
+            json.dump({'en': {'msg_hello': 'Hallo {name}'}}, f)
+        translations = Translations(self.directory)
+        with self.assertRaises(TranslationError) as e:
+            translations.validate({})
+        self.assertIn('slateboy.de.json: the root key is not de', str(e.exception))
+
+    def test_resolve(self):
+        translations = Translations(self.directory)
+        self.assertEqual(translations.resolve('pl'), 'pl')
+        self.assertEqual(translations.resolve('pl-PL'), 'pl')
+        self.assertEqual(translations.resolve('de'), 'en')
+        self.assertEqual(translations.resolve(None), 'en')
+
+    # the locale of the user is resolved once
+    def test_user_locale_cache(self):
+        translations = Translations(self.directory, cache_size=2)
+        alice = User(1, 'pl')
+        self.assertEqual(translations.userLocale(alice), 'pl')
+        alice.language_code = 'en'
+        self.assertEqual(translations.userLocale(alice), 'pl')
+        self.assertEqual(translations.userLocale(User(2)), 'en')
+        self.assertEqual(translations.userLocale(User(3, 'pl')), 'pl')
+        self.assertEqual(len(translations.users), 2)
+        self.assertNotIn(1, translations.users)
+        self.assertEqual(translations.userLocale(None), 'en')
+
+    def test_t(self):
+        def lookup():
+            self.assertEqual(t('slateboy.msg_hello'), 'Hello {name}')
+            self.assertEqual(t('slateboy.msg_hello', locale='pl'), 'Cześć {name}')
+            context_locale = current_locale.set('pl')
+            try:
+                self.assertEqual(t('slateboy.msg_hello'), 'Cześć {name}')
+            finally:
+                current_locale.reset(context_locale)
+            # python-i18n serves the keys the translations do not have
+            self.assertEqual(t('slateboy.msg_wallet_busy'),
+                             'The wallet is busy at the moment, please try again in a minute.')
+
+        Translations(self.directory).bind(lookup)()
+
+    # each bound function sees its own translations, nothing
+    # stays behind for the caller
+    def test_bind(self):
+        writeTranslations(self.directory, 'other', 'en', {'msg_hello': 'Hi'})
+        first = Translations(self.directory, locale='pl')
+        second = Translations(self.directory)
+
+        def lookup():
+            setLocale('en')
+            return t('slateboy.msg_hello'), second.bind(lambda: t('slateboy.msg_hello'))()
+
+        self.assertEqual(first.bind(lookup)(), ('Hello {name}', 'Hello {name}'))
+        self.assertEqual(first.bind(lambda: t('slateboy.msg_hello'))(), 'Cześć {name}')
+        self.assertIsNone(current_locale.get())
+        self.assertEqual(t('slateboy.msg_admin_only'),
+                         'This command is reserved for the admins.')
+        self.assertEqual(first.bind(self.test_bind).__name__, 'test_bind')
+
+    def test_t_without_translations(self):
+        self.assertEqual(t('slateboy.msg_admin_only'),
+                         'This command is reserved for the admins.')
+
+    # the tasks keep the locale of the thread submitting them
+    def test_locale_follows_the_task(self):
+        translations = Translations(self.directory)
+        executor = KeyedSerialExecutor(workers=1)
+        seen = []
+        done = threading.Event()
+
+        def submit():
+            setLocale('pl')
+            executor.submit(1, lambda: seen.append(t('slateboy.msg_hello')))
+            executor.submit(2, done.set)
+
+        thread = threading.Thread(target=translations.bind(submit))
+        thread.start()
+        thread.join()
+        self.assertTrue(done.wait(5))
+        executor.submit(3, translations.bind(lambda: seen.append(t('slateboy.msg_hello'))))
+        executor.stop()
+        self.assertEqual(seen, ['Cześć {name}', 'Hello {name}'])
+
+
+# the translations shipped with the repo
+class TestShippedTranslations(unittest.TestCase):
+    def test_slateboy_keys(self):
+        translations = Translations(TRANSLATIONS_DIRECTORY)
+        translations.validate(TRANSLATION_KEYS)
+
+    def test_contextbot_keys(self):
+        translations = Translations(TRANSLATIONS_DIRECTORY)
+        translations.validate(ContextBlankPersonality('slateboy', admins=[1]).translationKeys())
+
+
+class TestSlateBoyTranslations(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(TRANSLATIONS_DIRECTORY, 'slateboy.en.json'),
+                    self.directory)
+        writeTranslations(self.directory, 'slateboy', 'pl', {
+            'msg_balance': 'Do wydania: {spendable}\n'
+                           'Oczekuje na potwierdzenie: {awaiting_confirmation}\n'
+                           'Oczekuje na finalizację: {awaiting_finalization}\n'
+                           'Zablokowane: {locked}'})
+        self.mock_bot = Mockbot()
+        self.chat = ChatGenerator().get_chat()
+        self.ug = UserGenerator()
+        self.mg = MessageGenerator(self.mock_bot)
+        self.slateboy = None
+
+    def tearDown(self):
+        if self.slateboy is not None:
+            self.slateboy.stop()
+        shutil.rmtree(self.directory)
+
+    def start(self, translations):
+        self.slateboy = SlateBoy(
+            'slate-boy', '', BlankPersonality(), WalletProvider(),
+            bot=self.mock_bot, translations=translations)
+        self.slateboy.initiate()
+        self.slateboy.run(idle=False)
+
+    def balance(self, user):
+        update = self.mg.get_message(
+            text='/balance', parse_mode='HTML', user=user, chat=self.chat)
+        with patch('slateboy.personality.BlankPersonality.getBalance',
+                   return_value=(True, None, (1.0, 0.0, 0.0, 0.0))):
+            self.mock_bot.insertUpdate(update)
+        return self.mock_bot.sent_messages[-1]['text']
+
+    def test_user_locale(self):
+        self.start(Translations(self.directory))
+        alice = self.ug.get_user()
+        alice.language_code = 'pl'
+        bob = self.ug.get_user()
+        bob.language_code = 'de'
+        self.assertTrue(self.balance(alice).startswith('Do wydania: 1.0\n'))
+        self.assertTrue(self.balance(bob).startswith('Spendable: 1.0\n'))
+
+    # every instance answers with its own translations
+    def test_two_instances(self):
+        self.start(Translations(self.directory))
+        other = tempfile.mkdtemp()
+        try:
+            shutil.copy(os.path.join(TRANSLATIONS_DIRECTORY, 'slateboy.en.json'), other)
+            SlateBoy('slate-boy', '', BlankPersonality(), WalletProvider(),
+                     bot=Mockbot(), translations=Translations(other))
+        finally:
+            shutil.rmtree(other)
+        alice = self.ug.get_user()
+        alice.language_code = 'pl'
+        self.assertTrue(self.balance(alice).startswith('Do wydania: 1.0\n'))
+
+    # a broken translation does not get as far as a reply
+    def test_fails_at_startup(self):
+        writeTranslations(self.directory, 'slateboy', 'pl', {
+            'msg_balance': 'Do wydania: {dostepne}'})
+        with self.assertRaises(TranslationError):
+            SlateBoy('slate-boy', '', BlankPersonality(), WalletProvider(),
+                     bot=self.mock_bot, translations=Translations(self.directory))
+
+    def test_config(self):
+        os.remove(os.path.join(self.directory, 'slateboy.pl.json'))
+        slateboy = SlateBoy(
+            'slate-boy', '', BlankPersonality(), WalletProvider(),
+            config={'translations': self.directory}, bot=self.mock_bot)
+        self.assertEqual(slateboy.translations.locales, ['en'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from slateboy.transport import WalletTransport
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length))
+        self.server.peers.append(self.client_address)
+        body = json.dumps({
+            'jsonrpc': '2.0', 'id': payload['id'],
+            'result': {'Ok': payload['method']}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWalletTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        self.server.peers = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        host, port = self.server.server_address
+        self.owner_url = 'http://{}:{}/v3/owner'.format(host, port)
+        self.foreign_url = 'http://{}:{}/v2/foreign'.format(host, port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # consecutive calls to both endpoints share one kept-alive connection
+    def test_connection_reused(self):
+        transport = WalletTransport()
+        for url in [self.owner_url, self.foreign_url] * 3:
+            payload = {'jsonrpc': '2.0', 'id': 1, 'method': 'm', 'params': []}
+            response = transport.post(url, payload)
+            self.assertEqual(response.json()['result']['Ok'], 'm')
+        transport.close()
+        self.assertEqual(len(self.server.peers), 6)
+        self.assertEqual(len(set(self.server.peers)), 1)
+
+    def test_per_endpoint_timeouts(self):
+        transport = WalletTransport(timeout=5, timeouts={self.owner_url: 120})
+        transport.setTimeout(self.foreign_url, 10)
+        self.assertEqual(transport.getTimeout(self.owner_url), 120)
+        self.assertEqual(transport.getTimeout(self.foreign_url), 10)
+        self.assertEqual(transport.getTimeout('http://elsewhere'), 5)
@@ -0,0 +1,181 @@
+import json
+import os
+import signal
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import warnings
+
+from i18n import resource_loader
+from i18n import config as i18config
+
+from unittest.mock import patch
+
+from ptbtest import ChatGenerator
+from ptbtest import MessageGenerator
+from ptbtest import Mockbot
+from ptbtest import UserGenerator
+
+from slateboy.slateboy import SlateBoy
+from slateboy.personality import BlankPersonality
+from slateboy.providers import WalletProvider
+from slateboy.webhook import WebhookServer, SECRET_TOKEN_HEADER
+
+TRANSLATIONS_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep + '../translations' + os.sep
+i18config.set('file_format', 'json')
+i18config.set('load_path', [TRANSLATIONS_DIRECTORY])
+i18config.set('filename_format', '{namespace}.{locale}.{format}')
+i18config.set('locale', 'en')
+resource_loader.init_json_loader()
+
+
+# returns the HTTP status
+def post(url, body, token=None):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    request = urllib.request.Request(url, data=body, method='POST')
+    request.add_header('Content-Type', 'application/json')
+    if token is not None:
+        request.add_header(SECRET_TOKEN_HEADER, token)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class TestWebhookServer(unittest.TestCase):
+    def setUp(self):
+        self.processed = []
+        self.release = threading.Event()
+        self.server = None
+
+    def tearDown(self):
+        self.release.set()
+        if self.server is not None:
+            self.server.stop()
+
+    def start(self, process=None, **kwargs):
+        if process is None:
+            process = self.processed.append
+        self.server = WebhookServer(
+            process, port=0, path='/telegram', **kwargs).start()
+        return self.server
+
+    def test_process(self):
+        server = self.start(workers=2)
+        for update_id in range(5):
+            self.assertEqual(post(server.url, {'update_id': update_id}), 200)
+        server.join()
+        self.assertEqual(sorted(data['update_id'] for data in self.processed),
+                         list(range(5)))
+
+    def test_secret_token(self):
+        server = self.start(secret_token='s3cr3t')
+        self.assertEqual(post(server.url, {'update_id': 1}), 403)
+        self.assertEqual(post(server.url, {'update_id': 2}, token='wrong'), 403)
+        self.assertEqual(post(server.url, {'update_id': 3}, token='s3cr3t'), 200)
+        server.join()
+        self.assertEqual(self.processed, [{'update_id': 3}])
+
+    def test_invalid_requests(self):
+        server = self.start()
+        self.assertEqual(post(server.url, b'not json'), 400)
+        self.assertEqual(post(server.url, [1, 2]), 400)
+        self.assertEqual(post(server.url.replace('/telegram', '/other'),
+                              {'update_id': 1}), 404)
+        server.join()
+        self.assertEqual(self.processed, [])
+
+    # full queue is rejected for Telegram to retry later
+    def test_queue_full(self):
+        started = threading.Event()
+
+        def block(data):
+            started.set()
+            self.release.wait(5)
+
+        server = self.start(process=block, workers=1, max_queue=1)
+        self.assertEqual(post(server.url, {'update_id': 1}), 200)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(post(server.url, {'update_id': 2}), 200)
+        self.assertEqual(post(server.url, {'update_id': 3}), 503)
+
+    # failing update does not stop the worker
+    def test_failing_update(self):
+        def process(data):
+            if data['update_id'] == 1:
+                raise ValueError('ricked')
+            self.processed.append(data)
+
+        server = self.start(process=process, workers=1)
+        self.assertEqual(post(server.url, {'update_id': 1}), 200)
+        self.assertEqual(post(server.url, {'update_id': 2}), 200)
+        server.join()
+        self.assertEqual(self.processed, [{'update_id': 2}])
+
+    # the listener serves until a stop signal arrives
+    def test_idle(self):
+        server = self.start()
+        self.assertTrue(server.running)
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGUSR1)).start()
+            server.idle(stop_signals=(signal.SIGUSR1,))
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+        self.assertTrue(server.stopping.is_set())
+        server.stop()
+        self.assertFalse(server.running)
+        self.server = None
+
+
+# recorded updates POSTed at the bot in the webhook mode
+class TestSlateBoyWebhook(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.mock_bot = Mockbot()
+        self.chat = ChatGenerator().get_chat()
+        self.alice = UserGenerator().get_user()
+        self.mg = MessageGenerator(self.mock_bot)
+        config = {
+            'webhook_enabled': True,
+            'webhook_port': 0,
+            'webhook_path': '/telegram',
+            'webhook_secret_token': 's3cr3t'
+        }
+        self.slateboy = SlateBoy(
+            'slate-boy', '', BlankPersonality(), WalletProvider(),
+            config=config, bot=self.mock_bot)
+        self.slateboy.initiate()
+        self.slateboy.run(idle=False)
+
+    def tearDown(self):
+        self.slateboy.stop()
+
+    def test_balance(self):
+        update = self.mg.get_message(
+            text='/balance', parse_mode='HTML', user=self.alice, chat=self.chat)
+        server = self.slateboy.webhook_server
+        with patch('slateboy.personality.BlankPersonality.getBalance',
+                   return_value=(True, None, 'all the grins')):
+            self.assertEqual(
+                post(server.url, update.to_dict(), token='s3cr3t'), 200)
+            server.join()
+        self.assertEqual(self.mock_bot.sent_messages[-1]['text'], 'all the grins')
+
+    # the listener runs on its own, the updater only lends its job queue
+    def test_lifecycle(self):
+        server = self.slateboy.webhook_server
+        self.assertTrue(server.running)
+        self.assertFalse(self.slateboy.updater.running)
+        self.assertTrue(self.slateboy.updater.job_queue.scheduler.running)
+        self.slateboy.stop()
+        self.assertFalse(server.running)
+        self.assertIsNone(self.slateboy.webhook_server)
+        self.assertFalse(self.slateboy.updater.job_queue.scheduler.running)
+
+
+if __name__ == '__main__':
+    unittest.main()
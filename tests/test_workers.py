@@ -0,0 +1,61 @@
+import threading
+import time
+import unittest
+
+from slateboy.workers import WalletWorkerPool
+
+
+class TestWalletWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = WalletWorkerPool(workers=1, max_queue=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.stop()
+
+    def block(self):
+        self.release.wait(5)
+
+    # running plus queued tasks are bounded
+    def test_queue_limit(self):
+        self.assertTrue(self.pool.submit(self.block))
+        self.assertTrue(self.pool.submit(self.block))
+        self.assertFalse(self.pool.submit(self.block))
+
+        # slots are returned once the tasks finish
+        self.release.set()
+        self.pool.stop()
+        self.pool = WalletWorkerPool(workers=1, max_queue=0)
+        done = threading.Event()
+        self.assertTrue(self.pool.submit(done.set))
+        self.assertTrue(done.wait(5))
+
+    # failing task does not leak its slot
+    def test_failing_task(self):
+        pool = WalletWorkerPool(workers=1, max_queue=0)
+
+        def fail():
+            raise ValueError('ricked')
+
+        self.assertTrue(pool.submit(fail))
+        pool.stop()
+        self.assertTrue(pool.slots.acquire(blocking=False))
+
+    # nothing is accepted after the pool stopped
+    def test_stopped(self):
+        self.pool.stop()
+        self.assertFalse(self.pool.submit(self.block))
+
+    # operations of one user wait for each other
+    def test_ordered(self):
+        pool = WalletWorkerPool(workers=2, max_queue=2)
+        done = []
+        self.assertTrue(pool.submitOrdered('alice', self.block))
+        self.assertTrue(pool.submitOrdered('alice', done.append, 'alice'))
+        self.assertTrue(pool.submitOrdered('bob', done.append, 'bob'))
+        time.sleep(0.1)
+        self.assertEqual(done, ['bob'])
+        self.release.set()
+        pool.stop()
+        self.assertEqual(done, ['bob', 'alice'])